@@ -0,0 +1,32 @@
+class SummaryProvider:
+    """退院時サマリを生成するAIプロバイダの共通インターフェース
+
+    generate_asyncは(サマリ本文, 入力トークン数, 出力トークン数, 使用量の内訳)を返し、
+    stream_asyncは{"type": "delta", "text"}のイベントと、最後に{"type": "usage", ...}のイベントを返す。
+    max_tokensは呼び出し元（SummaryRouter）が入力トークン数の見積もりから決めて渡し、
+    省略した場合はプロバイダごとの既定の出力トークン数の上限を使う
+    """
+    name = None
+    capabilities = {
+        "streaming": True,
+        "async": True,
+        "prompt_cache": False,
+        "count_tokens_api": False,
+    }
+
+    def is_available(self):
+        raise NotImplementedError
+
+    async def generate_async(self, model_name, medical_text, additional_info="", department="default",
+                             max_tokens=None, section=None):
+        raise NotImplementedError
+
+    def stream_async(self, model_name, medical_text, additional_info="", department="default",
+                     max_tokens=None, section=None):
+        raise NotImplementedError
+
+    def count_tokens(self, text, model_name=None):
+        """APIでトークン数を数える。capabilities["count_tokens_api"]がFalseのプロバイダでは、
+        呼び出し元でservices.token_estimatorによる見積もりを使う
+        """
+        raise NotImplementedError
@@ -1,13 +1,17 @@
+import asyncio
 import os
-import anthropic
-from anthropic import Anthropic
 
-from utils.config import get_config, CLAUDE_API_KEY, CLAUDE_MODEL
+from external_service.base_provider import SummaryProvider
+from external_service.client_registry import get_anthropic_client, get_async_anthropic_client
+from external_service.prompt_builder import create_discharge_summary_prompt_parts, create_section_instruction
+from utils.config import CLAUDE_API_KEY, CLAUDE_MODEL, CLAUDE_PROMPT_CACHE
 from utils.constants import MESSAGES
-from utils.prompt_manager import get_prompt_by_department
 from utils.exceptions import APIError
 
 
+CLAUDE_DEFAULT_MAX_TOKENS = 5000
+
+
 def initialize_claude():
     try:
         if CLAUDE_API_KEY:
@@ -18,48 +22,147 @@ def initialize_claude():
         raise APIError(f"Claude API初期化エラー: {str(e)}")
 
 
-def create_discharge_summary_prompt(medical_text, additional_info="", department="default"):
-    prompt_data = get_prompt_by_department(department)
+def create_message_params(medical_text, additional_info="", department="default", section=None):
+    """テンプレートをキャッシュ可能なsystemブロック、カルテ情報をuserメッセージとしたリクエスト引数を作成
+
+    sectionを指定した場合は、項目ごとのリクエストでカルテ情報までをキャッシュから読み込めるよう、
+    カルテ情報の後にキャッシュの区切りを置き、その後に項目の指示を続ける
+    """
+    prompt_template, karte_text = create_discharge_summary_prompt_parts(medical_text, additional_info, department)
+
+    if not CLAUDE_PROMPT_CACHE:
+        content = f"{prompt_template}\n\n{karte_text}"
+        if section:
+            content += f"\n\n{create_section_instruction(section)}"
+        return {
+            "messages": [
+                {"role": "user", "content": content}
+            ]
+        }
+
+    content = karte_text
+    if section:
+        content = [
+            {"type": "text", "text": karte_text, "cache_control": {"type": "ephemeral"}},
+            {"type": "text", "text": create_section_instruction(section)}
+        ]
+    return {
+        "system": [
+            {"type": "text", "text": prompt_template, "cache_control": {"type": "ephemeral"}}
+        ],
+        "messages": [
+            {"role": "user", "content": content}
+        ]
+    }
+
+
+def parse_claude_usage(usage):
+    """トークン使用量を返す。入力トークンはキャッシュ読み込み・書き込み分を含めた合計とする"""
+    cache_read_tokens = getattr(usage, "cache_read_input_tokens", None) or 0
+    cache_creation_tokens = getattr(usage, "cache_creation_input_tokens", None) or 0
+
+    input_tokens = usage.input_tokens + cache_read_tokens + cache_creation_tokens
+    output_tokens = usage.output_tokens
+    cache_usage = {
+        "cache_read_input_tokens": cache_read_tokens,
+        "cache_creation_input_tokens": cache_creation_tokens
+    }
 
-    if not prompt_data:
-        config = get_config()
-        prompt_template = config['PROMPTS']['discharge_summary']
+    return input_tokens, output_tokens, cache_usage
+
+
+def parse_claude_response(response):
+    if response.content:
+        summary_text = response.content[0].text
     else:
-        prompt_template = prompt_data['content']
+        summary_text = "レスポンスが空でした"
+
+    input_tokens, output_tokens, cache_usage = parse_claude_usage(response.usage)
+
+    return summary_text, input_tokens, output_tokens, cache_usage
 
-    prompt = f"{prompt_template}\n\n【カルテ情報】\n{medical_text}"
-    if additional_info:
-        prompt += f"\n{additional_info}"
-    return prompt
 
+def create_usage_event(usage):
+    input_tokens, output_tokens, cache_usage = parse_claude_usage(usage)
+    return {"type": "usage", "input_tokens": input_tokens, "output_tokens": output_tokens, **cache_usage}
 
-def claude_generate_discharge_summary(medical_text, additional_info="", department="default"):
+
+async def claude_generate_discharge_summary_async(medical_text, additional_info="", department="default",
+                                                  model_name=None, max_tokens=None, section=None):
     try:
         initialize_claude()
-        model_name = CLAUDE_MODEL
-        client = Anthropic(api_key=CLAUDE_API_KEY)
-
-        prompt = create_discharge_summary_prompt(medical_text, additional_info, department)
+        if not model_name:
+            model_name = CLAUDE_MODEL
+        client = get_async_anthropic_client(CLAUDE_API_KEY)
+        # プロンプトの取得はMongoDBを参照することがあるため、イベントループの外で行う
+        params = await asyncio.to_thread(create_message_params, medical_text, additional_info, department, section)
 
-        response = client.messages.create(
+        response = await client.messages.create(
             model=model_name,
-            max_tokens=5000,
-            messages=[
-                {"role": "user", "content": prompt}
-            ]
+            max_tokens=max_tokens or CLAUDE_DEFAULT_MAX_TOKENS,
+            **params
         )
 
-        if response.content:
-            summary_text = response.content[0].text
-        else:
-            summary_text = "レスポンスが空でした"
+        return parse_claude_response(response)
+
+    except APIError as e:
+        raise e
+    except Exception as e:
+        raise APIError(f"Claude APIでエラーが発生しました: {str(e)}")
 
-        input_tokens = response.usage.input_tokens
-        output_tokens = response.usage.output_tokens
 
-        return summary_text, input_tokens, output_tokens
+async def claude_stream_discharge_summary_async(medical_text, additional_info="", department="default",
+                                                model_name=None, max_tokens=None, section=None):
+    """退院時サマリをストリーミングで生成し、テキスト差分と最後にトークン使用量を返す"""
+    try:
+        initialize_claude()
+        if not model_name:
+            model_name = CLAUDE_MODEL
+        client = get_async_anthropic_client(CLAUDE_API_KEY)
+        params = await asyncio.to_thread(create_message_params, medical_text, additional_info, department, section)
+
+        async with client.messages.stream(
+            model=model_name,
+            max_tokens=max_tokens or CLAUDE_DEFAULT_MAX_TOKENS,
+            **params
+        ) as stream:
+            async for text in stream.text_stream:
+                yield {"type": "delta", "text": text}
+
+            final_message = await stream.get_final_message()
+
+        yield create_usage_event(final_message.usage)
 
     except APIError as e:
         raise e
     except Exception as e:
         raise APIError(f"Claude APIでエラーが発生しました: {str(e)}")
+
+
+class ClaudeProvider(SummaryProvider):
+    name = "claude"
+    capabilities = {**SummaryProvider.capabilities, "prompt_cache": True, "count_tokens_api": True}
+
+    def is_available(self):
+        return bool(CLAUDE_API_KEY)
+
+    async def generate_async(self, model_name, medical_text, additional_info="", department="default",
+                             max_tokens=None, section=None):
+        return await claude_generate_discharge_summary_async(medical_text, additional_info, department, model_name,
+                                                             max_tokens, section)
+
+    def stream_async(self, model_name, medical_text, additional_info="", department="default",
+                     max_tokens=None, section=None):
+        return claude_stream_discharge_summary_async(medical_text, additional_info, department, model_name,
+                                                     max_tokens, section)
+
+    def count_tokens(self, text, model_name=None):
+        try:
+            client = get_anthropic_client(CLAUDE_API_KEY)
+            response = client.messages.count_tokens(
+                model=model_name or CLAUDE_MODEL,
+                messages=[{"role": "user", "content": text}]
+            )
+            return response.input_tokens
+        except Exception as e:
+            raise APIError(f"Claude APIでエラーが発生しました: {str(e)}")
@@ -0,0 +1,175 @@
+import asyncio
+import threading
+import weakref
+
+import anthropic
+import httpx
+import openai
+from anthropic import Anthropic, AsyncAnthropic
+from google import genai
+from google.genai import types
+from openai import OpenAI, AsyncOpenAI
+
+from utils.config import API_TIMEOUT, API_MAX_CONNECTIONS, API_MAX_KEEPALIVE_CONNECTIONS, API_KEEPALIVE_EXPIRY
+
+
+class ClientRegistry:
+    """プロバイダごとのAPIクライアントをプロセス内で1つだけ生成して共有する
+
+    再試行はservices.retry_policyでまとめて行うため、SDK自体の再試行は無効にする
+    """
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = ClientRegistry()
+        return cls._instance
+
+    @classmethod
+    def reset(cls):
+        """生成済みクライアントを閉じてレジストリを破棄する"""
+        with cls._instance_lock:
+            if cls._instance is not None:
+                cls._instance.close()
+            cls._instance = None
+
+    def __init__(self, timeout=API_TIMEOUT, max_connections=API_MAX_CONNECTIONS,
+                 max_keepalive_connections=API_MAX_KEEPALIVE_CONNECTIONS, keepalive_expiry=API_KEEPALIVE_EXPIRY):
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.keepalive_expiry = keepalive_expiry
+        self._clients = {}
+        # 非同期クライアントの接続プールはイベントループに紐づくため、ループごとに保持する
+        self._async_clients = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def get_limits(self):
+        return httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive_connections,
+            keepalive_expiry=self.keepalive_expiry
+        )
+
+    def get_client(self, key, factory):
+        """keyに対応するクライアントを返す。未生成の場合のみfactoryで生成する"""
+        client = self._clients.get(key)
+        if client is not None:
+            return client
+
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                client = factory()
+                self._clients[key] = client
+        return client
+
+    def get_async_client(self, key, factory):
+        """実行中のイベントループ用のkeyに対応する非同期クライアントを返す"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            clients = self._async_clients.setdefault(loop, {})
+            client = clients.get(key)
+            if client is None:
+                client = factory()
+                clients[key] = client
+        return client
+
+    def get_anthropic_client(self, api_key, base_url=None):
+        def factory():
+            return Anthropic(
+                api_key=api_key,
+                base_url=base_url,
+                timeout=self.timeout,
+                max_retries=0,
+                http_client=anthropic.DefaultHttpxClient(limits=self.get_limits(), timeout=self.timeout)
+            )
+
+        return self.get_client(("anthropic", api_key, base_url), factory)
+
+    def get_openai_client(self, api_key, base_url=None):
+        def factory():
+            return OpenAI(
+                api_key=api_key,
+                base_url=base_url,
+                timeout=self.timeout,
+                max_retries=0,
+                http_client=openai.DefaultHttpxClient(limits=self.get_limits(), timeout=self.timeout)
+            )
+
+        return self.get_client(("openai", api_key, base_url), factory)
+
+    def get_async_anthropic_client(self, api_key, base_url=None):
+        def factory():
+            return AsyncAnthropic(
+                api_key=api_key,
+                base_url=base_url,
+                timeout=self.timeout,
+                max_retries=0,
+                http_client=anthropic.DefaultAsyncHttpxClient(limits=self.get_limits(), timeout=self.timeout)
+            )
+
+        return self.get_async_client(("anthropic", api_key, base_url), factory)
+
+    def get_async_openai_client(self, api_key, base_url=None):
+        def factory():
+            return AsyncOpenAI(
+                api_key=api_key,
+                base_url=base_url,
+                timeout=self.timeout,
+                max_retries=0,
+                http_client=openai.DefaultAsyncHttpxClient(limits=self.get_limits(), timeout=self.timeout)
+            )
+
+        return self.get_async_client(("openai", api_key, base_url), factory)
+
+    def get_gemini_client(self, api_key, base_url=None):
+        def factory():
+            # HttpOptions.timeoutはミリ秒指定
+            http_options = types.HttpOptions(
+                base_url=base_url,
+                timeout=int(self.timeout * 1000),
+                client_args={"limits": self.get_limits()},
+                async_client_args={"limits": self.get_limits()}
+            )
+            return genai.Client(api_key=api_key, http_options=http_options)
+
+        return self.get_client(("gemini", api_key, base_url), factory)
+
+    def close(self):
+        with self._lock:
+            clients = list(self._clients.values())
+            self._clients = {}
+            self._async_clients = weakref.WeakKeyDictionary()
+
+        for client in clients:
+            close = getattr(client, "close", None)
+            if callable(close):
+                try:
+                    close()
+                except Exception:
+                    pass
+
+
+def get_anthropic_client(api_key, base_url=None):
+    return ClientRegistry.get_instance().get_anthropic_client(api_key, base_url)
+
+
+def get_openai_client(api_key, base_url=None):
+    return ClientRegistry.get_instance().get_openai_client(api_key, base_url)
+
+
+def get_gemini_client(api_key, base_url=None):
+    return ClientRegistry.get_instance().get_gemini_client(api_key, base_url)
+
+
+def get_async_anthropic_client(api_key, base_url=None):
+    return ClientRegistry.get_instance().get_async_anthropic_client(api_key, base_url)
+
+
+def get_async_openai_client(api_key, base_url=None):
+    return ClientRegistry.get_instance().get_async_openai_client(api_key, base_url)
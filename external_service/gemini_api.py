@@ -1,20 +1,26 @@
+import asyncio
 import json
 import os
 
-from google import genai
+from google.genai import errors as genai_errors
 from google.genai import types
 
-from utils.config import get_config, GEMINI_CREDENTIALS, GEMINI_MODEL, GEMINI_THINKING_BUDGET
+from external_service.base_provider import SummaryProvider
+from external_service.client_registry import get_gemini_client
+from external_service.gemini_context_cache import GeminiContextCache
+from external_service.prompt_builder import create_discharge_summary_prompt_parts, create_section_instruction
+from utils.config import GEMINI_CREDENTIALS, GEMINI_MODEL, GEMINI_THINKING_BUDGET
 from utils.constants import MESSAGES
-from utils.prompt_manager import get_prompt_by_department
 from utils.exceptions import APIError
 
+# キャッシュが失効・削除された（参照できない）場合のステータス。それ以外のエラーはプロンプトを直接送信しても失敗する
+CACHE_UNAVAILABLE_CODES = (403, 404)
+
 
 def initialize_gemini():
     try:
         if GEMINI_CREDENTIALS:
-            client = genai.Client(api_key=GEMINI_CREDENTIALS)
-            return client
+            return get_gemini_client(GEMINI_CREDENTIALS)
         else:
             raise APIError(MESSAGES["API_CREDENTIALS_MISSING"])
 
@@ -22,60 +28,180 @@ def initialize_gemini():
         raise APIError(f"Gemini API初期化エラー: {str(e)}")
 
 
-def create_discharge_summary_prompt(medical_text, additional_info="", department="default"):
-    prompt_data = get_prompt_by_department(department)
+def create_generate_content_config(cached_content=None, max_tokens=None, system_instruction=None):
+    thinking_config = None
+    if GEMINI_THINKING_BUDGET:
+        thinking_config = types.ThinkingConfig(thinking_budget=GEMINI_THINKING_BUDGET)
+
+    if thinking_config or cached_content or max_tokens or system_instruction:
+        return types.GenerateContentConfig(
+            thinking_config=thinking_config,
+            cached_content=cached_content,
+            system_instruction=system_instruction,
+            max_output_tokens=max_tokens
+        )
+    return None
+
+
+def create_request(prompt_template, karte_text, cached_content=None, max_tokens=None, section=None):
+    """generate_contentに渡すcontentsとconfigを作成
+
+    プロンプトはキャッシュ利用時もそうでない場合もシステム指示として扱い、contentsにはカルテ情報のみを送信する
+    """
+    contents = karte_text
+    if section:
+        contents += f"\n\n{create_section_instruction(section)}"
+    system_instruction = None if cached_content else prompt_template
+    return {"contents": contents,
+            "config": create_generate_content_config(cached_content, max_tokens, system_instruction)}
+
+
+async def get_prompt_parts_async(medical_text, additional_info, department):
+    """プロンプトの取得はMongoDBを参照することがあるため、イベントループの外で行う"""
+    return await asyncio.to_thread(create_discharge_summary_prompt_parts, medical_text, additional_info, department)
+
+
+def parse_gemini_usage(usage_metadata):
+    input_tokens = usage_metadata.prompt_token_count or 0
+    output_tokens = usage_metadata.candidates_token_count or 0
+    cache_usage = {"cache_read_input_tokens": getattr(usage_metadata, 'cached_content_token_count', None) or 0}
+    return input_tokens, output_tokens, cache_usage
+
 
-    if not prompt_data:
-        config = get_config()
-        prompt_template = config['PROMPTS']['discharge_summary']
+def parse_gemini_response(response):
+    if hasattr(response, 'text'):
+        summary_text = response.text
     else:
-        prompt_template = prompt_data['content']
+        summary_text = str(response)
 
-    prompt = f"{prompt_template}\n\n【カルテ情報】\n{medical_text}"
-    if additional_info:
-        prompt += f"\n{additional_info}"
-    return prompt
+    input_tokens = 0
+    output_tokens = 0
+    cache_usage = {}
 
+    if getattr(response, 'usage_metadata', None):
+        input_tokens, output_tokens, cache_usage = parse_gemini_usage(response.usage_metadata)
 
-def gemini_generate_discharge_summary(medical_text, additional_info="", department="default", model_name=None):
+    return summary_text, input_tokens, output_tokens, cache_usage
+
+
+def update_stream_usage(usage_event, usage_metadata):
+    """使用量は累積値で届くため、値のある項目は後のチャンクの値で上書きする"""
+    input_tokens, output_tokens, cache_usage = parse_gemini_usage(usage_metadata)
+    usage_event["input_tokens"] = input_tokens or usage_event["input_tokens"]
+    usage_event["output_tokens"] = output_tokens or usage_event["output_tokens"]
+    for key, value in cache_usage.items():
+        usage_event[key] = value or usage_event.get(key, 0)
+
+
+async def gemini_generate_discharge_summary_async(medical_text, additional_info="", department="default",
+                                                  model_name=None, max_tokens=None, section=None):
     try:
         client = initialize_gemini()
         if not model_name:
             model_name = GEMINI_MODEL
 
-        prompt = create_discharge_summary_prompt(medical_text, additional_info, department)
+        prompt_template, karte_text = await get_prompt_parts_async(medical_text, additional_info, department)
+        cached_content = await GeminiContextCache.get_instance().get_cached_content_async(
+            client, model_name, department, prompt_template
+        )
 
-        if GEMINI_THINKING_BUDGET:
-            response = client.models.generate_content(
+        try:
+            response = await client.aio.models.generate_content(
                 model=model_name,
-                contents=prompt,
-                config=types.GenerateContentConfig(
-                    thinking_config=types.ThinkingConfig(
-                        thinking_budget=GEMINI_THINKING_BUDGET
-                    )
-                )
+                **create_request(prompt_template, karte_text, cached_content, max_tokens, section)
             )
-        else:
-            response = client.models.generate_content(
+        except genai_errors.ClientError as e:
+            if not cached_content or e.code not in CACHE_UNAVAILABLE_CODES:
+                raise
+            GeminiContextCache.get_instance().invalidate(cached_content)
+            response = await client.aio.models.generate_content(
                 model=model_name,
-                contents=prompt
+                **create_request(prompt_template, karte_text, max_tokens=max_tokens, section=section)
             )
 
-        if hasattr(response, 'text'):
-            summary_text = response.text
-        else:
-            summary_text = str(response)
+        return parse_gemini_response(response)
 
-        input_tokens = 0
-        output_tokens = 0
+    except APIError as e:
+        raise e
+    except Exception as e:
+        raise APIError(f"Gemini APIでエラーが発生しました: {str(e)}")
+
+
+async def open_stream_async(client, model_name, request):
+    """ストリームを開始し、最初のチャンクとストリームを返す"""
+    stream = await client.aio.models.generate_content_stream(model=model_name, **request)
+    first_chunk = await anext(stream, None)
+    return first_chunk, stream
+
+
+async def gemini_stream_discharge_summary_async(medical_text, additional_info="", department="default",
+                                                model_name=None, max_tokens=None, section=None):
+    """退院時サマリをストリーミングで生成し、テキスト差分と最後にトークン使用量を返す"""
+    try:
+        client = initialize_gemini()
+        if not model_name:
+            model_name = GEMINI_MODEL
 
-        if hasattr(response, 'usage_metadata'):
-            input_tokens = response.usage_metadata.prompt_token_count
-            output_tokens = response.usage_metadata.candidates_token_count
+        prompt_template, karte_text = await get_prompt_parts_async(medical_text, additional_info, department)
+        cached_content = await GeminiContextCache.get_instance().get_cached_content_async(
+            client, model_name, department, prompt_template
+        )
 
-        return summary_text, input_tokens, output_tokens
+        try:
+            first_chunk, stream = await open_stream_async(
+                client, model_name, create_request(prompt_template, karte_text, cached_content, max_tokens, section)
+            )
+        except genai_errors.ClientError as e:
+            if not cached_content or e.code not in CACHE_UNAVAILABLE_CODES:
+                raise
+            GeminiContextCache.get_instance().invalidate(cached_content)
+            first_chunk, stream = await open_stream_async(
+                client, model_name, create_request(prompt_template, karte_text, max_tokens=max_tokens, section=section)
+            )
+
+        usage_event = {"type": "usage", "input_tokens": 0, "output_tokens": 0}
+        chunk = first_chunk
+
+        while chunk is not None:
+            if getattr(chunk, 'text', None):
+                yield {"type": "delta", "text": chunk.text}
+
+            if getattr(chunk, 'usage_metadata', None):
+                update_stream_usage(usage_event, chunk.usage_metadata)
+
+            chunk = await anext(stream, None)
+
+        yield usage_event
 
     except APIError as e:
         raise e
     except Exception as e:
         raise APIError(f"Gemini APIでエラーが発生しました: {str(e)}")
+
+
+class GeminiProvider(SummaryProvider):
+    name = "gemini"
+    capabilities = {**SummaryProvider.capabilities, "prompt_cache": True, "count_tokens_api": True}
+
+    def is_available(self):
+        return bool(GEMINI_CREDENTIALS)
+
+    async def generate_async(self, model_name, medical_text, additional_info="", department="default",
+                             max_tokens=None, section=None):
+        return await gemini_generate_discharge_summary_async(medical_text, additional_info, department, model_name,
+                                                             max_tokens, section)
+
+    def stream_async(self, model_name, medical_text, additional_info="", department="default",
+                     max_tokens=None, section=None):
+        return gemini_stream_discharge_summary_async(medical_text, additional_info, department, model_name,
+                                                     max_tokens, section)
+
+    def count_tokens(self, text, model_name=None):
+        try:
+            client = initialize_gemini()
+            response = client.models.count_tokens(model=model_name or GEMINI_MODEL, contents=text)
+            return response.total_tokens
+        except APIError as e:
+            raise e
+        except Exception as e:
+            raise APIError(f"Gemini APIでエラーが発生しました: {str(e)}")
@@ -0,0 +1,156 @@
+import asyncio
+import hashlib
+import threading
+import time
+
+from google.genai import types
+
+from utils.config import GEMINI_CONTEXT_CACHE, GEMINI_CONTEXT_CACHE_TTL, GEMINI_CONTEXT_CACHE_REFRESH_MARGIN, \
+    GEMINI_CONTEXT_CACHE_RETRY_INTERVAL
+
+
+def get_prompt_version(prompt_template):
+    return hashlib.sha256(prompt_template.encode("utf-8")).hexdigest()[:16]
+
+
+class GeminiContextCache:
+    """診療科のプロンプトテンプレートをGeminiのキャッシュ済みコンテンツとして保持する
+
+    (診療科, モデル, プロンプトのバージョン)ごとに1つ作成し、TTLが切れる前に延長する。
+    作成できなかった場合はretry_interval秒の間は作成を試みず、呼び出し元はプロンプトを直接送信する。
+    同じキーの作成・延長が実行中の場合は新たに送信せず、作成はその結果を待ち、延長は現在のキャッシュを使う
+    """
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = GeminiContextCache()
+        return cls._instance
+
+    def __init__(self, enabled=GEMINI_CONTEXT_CACHE, ttl=GEMINI_CONTEXT_CACHE_TTL,
+                 refresh_margin=GEMINI_CONTEXT_CACHE_REFRESH_MARGIN, retry_interval=GEMINI_CONTEXT_CACHE_RETRY_INTERVAL):
+        self.enabled = enabled
+        self.ttl = ttl
+        self.refresh_margin = refresh_margin
+        self.retry_interval = retry_interval
+        self._entries = {}
+        self._unavailable = {}
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    async def get_cached_content_async(self, client, model_name, department, prompt_template):
+        """キャッシュ済みコンテンツの名前を返す。利用できない場合はNone"""
+        key, action, name = self._prepare(model_name, department, prompt_template)
+        if action is None:
+            return name
+        if action == "wait":
+            # 待っている側の取り消しで作成中の処理を取り消さない
+            return await asyncio.shield(name)
+
+        future = self._start_in_flight(key)
+        try:
+            if action == "refresh":
+                await client.aio.caches.update(name=name, config=self._create_update_config())
+            else:
+                cached_content = await client.aio.caches.create(
+                    model=model_name,
+                    config=self._create_config(department, prompt_template)
+                )
+                name = cached_content.name
+        except Exception as e:
+            name = self._on_failure(key, action, name, department, e)
+        else:
+            name = self._on_success(key, name)
+        finally:
+            self._finish_in_flight(key, future, name)
+
+        return name
+
+    def invalidate(self, name):
+        """サーバ側で失効していたキャッシュを破棄する"""
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                if entry["name"] == name:
+                    del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._unavailable.clear()
+            self._in_flight.clear()
+
+    def _prepare(self, model_name, department, prompt_template):
+        """(キー, 必要な処理, キャッシュ名)を返す。処理はNone(そのまま使う)、"refresh"、"create"、"wait"のいずれか
+
+        "wait"の場合は、キャッシュ名の代わりに実行中の作成の結果を受け取るFutureを返す
+        """
+        if not self.enabled or not prompt_template:
+            return None, None, None
+
+        key = (department, model_name, get_prompt_version(prompt_template))
+        now = time.monotonic()
+        with self._lock:
+            if self._unavailable.get(key, 0) > now:
+                return key, None, None
+
+            entry = self._entries.get(key)
+            if entry is not None and entry["expires_at"] - now > self.refresh_margin:
+                return key, None, entry["name"]
+
+            in_flight = self._get_in_flight(key)
+            if entry is not None and entry["expires_at"] > now:
+                # 延長中のキャッシュは期限まで有効なため、延長を待たずに使う
+                return key, None if in_flight else "refresh", entry["name"]
+
+            self._entries.pop(key, None)
+            if in_flight:
+                return key, "wait", in_flight
+            return key, "create", None
+
+    def _get_in_flight(self, key):
+        """同じイベントループで実行中の作成・延長のFuture。Futureは他のイベントループから待てないため、それ以外はNone"""
+        future = self._in_flight.get(key)
+        if future is None or future.get_loop() is not asyncio.get_running_loop():
+            return None
+        return future
+
+    def _start_in_flight(self, key):
+        future = asyncio.get_running_loop().create_future()
+        with self._lock:
+            self._in_flight.setdefault(key, future)
+        return future
+
+    def _finish_in_flight(self, key, future, name):
+        with self._lock:
+            if self._in_flight.get(key) is future:
+                del self._in_flight[key]
+        if not future.done():
+            future.set_result(name)
+
+    def _on_success(self, key, name):
+        with self._lock:
+            self._entries[key] = {"name": name, "expires_at": time.monotonic() + self.ttl}
+            self._unavailable.pop(key, None)
+        return name
+
+    def _on_failure(self, key, action, name, department, error):
+        with self._lock:
+            self._entries.pop(key, None)
+            if action == "create":
+                self._unavailable[key] = time.monotonic() + self.retry_interval
+        print(f"Geminiのコンテキストキャッシュを利用できません（{department}）: {str(error)}")
+        return None
+
+    def _create_config(self, department, prompt_template):
+        return types.CreateCachedContentConfig(
+            display_name=f"discharge-summary-{department}",
+            system_instruction=prompt_template,
+            ttl=f"{self.ttl}s"
+        )
+
+    def _create_update_config(self):
+        return types.UpdateCachedContentConfig(ttl=f"{self.ttl}s")
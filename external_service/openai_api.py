@@ -1,12 +1,17 @@
+import asyncio
 import os
-from openai import OpenAI
 
-from utils.config import get_config, OPENAI_API_KEY, OPENAI_MODEL
+from external_service.base_provider import SummaryProvider
+from external_service.client_registry import get_async_openai_client
+from external_service.prompt_builder import create_discharge_summary_prompt
+from utils.config import OPENAI_API_KEY, OPENAI_MODEL
 from utils.constants import MESSAGES
-from utils.prompt_manager import get_prompt_by_department
 from utils.exceptions import APIError
 
 
+OPENAI_DEFAULT_MAX_TOKENS = 10000
+
+
 def initialize_openai():
     try:
         if OPENAI_API_KEY:
@@ -17,49 +22,102 @@ def initialize_openai():
         raise APIError(f"OpenAI API初期化エラー: {str(e)}")
 
 
-def create_discharge_summary_prompt(medical_text, additional_info="", department="default"):
-    prompt_data = get_prompt_by_department(department)
-
-    if not prompt_data:
-        config = get_config()
-        prompt_template = config['PROMPTS']['discharge_summary']
+def parse_openai_response(response):
+    if response.choices and response.choices[0].message.content:
+        summary_text = response.choices[0].message.content
     else:
-        prompt_template = prompt_data['content']
+        summary_text = "レスポンスが空でした"
+
+    input_tokens = response.usage.prompt_tokens
+    output_tokens = response.usage.completion_tokens
 
-    prompt = f"{prompt_template}\n\n【カルテ情報】\n{medical_text}"
-    if additional_info:
-        prompt += f"\n{additional_info}"
-    return prompt
+    return summary_text, input_tokens, output_tokens, {}
 
 
-def openai_generate_discharge_summary(medical_text, additional_info="", department="default"):
+async def openai_generate_discharge_summary_async(medical_text, additional_info="", department="default",
+                                                  model_name=None, max_tokens=None, section=None):
     try:
         initialize_openai()
-        model_name = OPENAI_MODEL
-        client = OpenAI(api_key=OPENAI_API_KEY)
+        if not model_name:
+            model_name = OPENAI_MODEL
+        client = get_async_openai_client(OPENAI_API_KEY)
 
-        prompt = create_discharge_summary_prompt(medical_text, additional_info, department)
+        # プロンプトの取得はMongoDBを参照することがあるため、イベントループの外で行う
+        prompt = await asyncio.to_thread(create_discharge_summary_prompt, medical_text, additional_info, department,
+                                         section)
 
-        response = client.chat.completions.create(
+        response = await client.chat.completions.create(
             model=model_name,
             messages=[
                 {"role": "system", "content": "あなたは経験豊富な医療文書作成の専門家です。"},
                 {"role": "user", "content": prompt}
             ],
-            max_tokens=10000,
+            max_tokens=max_tokens or OPENAI_DEFAULT_MAX_TOKENS,
         )
 
-        if response.choices and response.choices[0].message.content:
-            summary_text = response.choices[0].message.content
-        else:
-            summary_text = "レスポンスが空でした"
+        return parse_openai_response(response)
+
+    except APIError as e:
+        raise e
+    except Exception as e:
+        raise APIError(f"OpenAI APIでエラーが発生しました: {str(e)}")
 
-        input_tokens = response.usage.prompt_tokens
-        output_tokens = response.usage.completion_tokens
 
-        return summary_text, input_tokens, output_tokens
+async def openai_stream_discharge_summary_async(medical_text, additional_info="", department="default",
+                                                model_name=None, max_tokens=None, section=None):
+    """退院時サマリをストリーミングで生成し、テキスト差分と最後にトークン使用量を返す"""
+    try:
+        initialize_openai()
+        if not model_name:
+            model_name = OPENAI_MODEL
+        client = get_async_openai_client(OPENAI_API_KEY)
+
+        prompt = await asyncio.to_thread(create_discharge_summary_prompt, medical_text, additional_info, department,
+                                         section)
+
+        stream = await client.chat.completions.create(
+            model=model_name,
+            messages=[
+                {"role": "system", "content": "あなたは経験豊富な医療文書作成の専門家です。"},
+                {"role": "user", "content": prompt}
+            ],
+            max_tokens=max_tokens or OPENAI_DEFAULT_MAX_TOKENS,
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+
+        input_tokens = 0
+        output_tokens = 0
+
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield {"type": "delta", "text": chunk.choices[0].delta.content}
+
+            # 使用量は最後のチャンクにのみ含まれる
+            if chunk.usage:
+                input_tokens = chunk.usage.prompt_tokens
+                output_tokens = chunk.usage.completion_tokens
+
+        yield {"type": "usage", "input_tokens": input_tokens, "output_tokens": output_tokens}
 
     except APIError as e:
         raise e
     except Exception as e:
         raise APIError(f"OpenAI APIでエラーが発生しました: {str(e)}")
+
+
+class OpenAIProvider(SummaryProvider):
+    name = "openai"
+
+    def is_available(self):
+        return bool(OPENAI_API_KEY)
+
+    async def generate_async(self, model_name, medical_text, additional_info="", department="default",
+                             max_tokens=None, section=None):
+        return await openai_generate_discharge_summary_async(medical_text, additional_info, department, model_name,
+                                                             max_tokens, section)
+
+    def stream_async(self, model_name, medical_text, additional_info="", department="default",
+                     max_tokens=None, section=None):
+        return openai_stream_discharge_summary_async(medical_text, additional_info, department, model_name,
+                                                     max_tokens, section)
@@ -0,0 +1,39 @@
+from utils.prompt_manager import get_prompt_template
+
+# 長いカルテを分割して要約する場合の、チャンクごとの要約（map）を表すsection
+MAP_SECTION = "期間の経過要約"
+
+
+def create_discharge_summary_prompt_parts(medical_text, additional_info="", department="default"):
+    """プロンプトを診療科ごとに共通のテンプレート部分と、リクエストごとに変わるカルテ情報部分に分けて返す"""
+    prompt_template = get_prompt_template(department)
+
+    karte_text = f"【カルテ情報】\n{medical_text}"
+    if additional_info:
+        karte_text += f"\n{additional_info}"
+    return prompt_template, karte_text
+
+
+def create_map_instruction():
+    """分割したカルテの1期間を要約する場合の指示。退院時サマリの各項目ではなく、その期間の経過のみを出力させる"""
+    return ("【作成する内容】\n上記の指示の項目ごとの形式では出力せず、このカルテ情報の期間の経過要約のみを出力してください。"
+            "後で他の期間の要約とまとめて退院時サマリを作成するため、診断・治療・検査結果・処方の変更は省略しないでください。")
+
+
+def create_section_instruction(section):
+    """1項目のみを生成する場合の指示。カルテ情報の後に置き、項目間でプロンプトの先頭部分を共通にする
+
+    sectionがMAP_SECTIONの場合は、分割したカルテの1期間を要約する指示を返す
+    """
+    if section == MAP_SECTION:
+        return create_map_instruction()
+    return (f"【作成する項目】\n上記の指示のうち「{section}」の項目のみを、「{section}:」で始めて出力してください。"
+            f"他の項目は出力しないでください。")
+
+
+def create_discharge_summary_prompt(medical_text, additional_info="", department="default", section=None):
+    prompt_template, karte_text = create_discharge_summary_prompt_parts(medical_text, additional_info, department)
+    prompt = f"{prompt_template}\n\n{karte_text}"
+    if section:
+        prompt += f"\n\n{create_section_instruction(section)}"
+    return prompt
@@ -0,0 +1,71 @@
+import threading
+
+from external_service.claude_api import ClaudeProvider
+from external_service.gemini_api import GeminiProvider
+from external_service.openai_api import OpenAIProvider
+from utils.config import SUMMARY_MODELS
+from utils.constants import MESSAGES
+from utils.exceptions import APIError
+
+
+def create_default_providers():
+    return [GeminiProvider(), ClaudeProvider(), OpenAIProvider()]
+
+
+class ProviderRegistry:
+    """プロバイダと、画面上のモデル名に対応するモデル定義を管理する
+
+    モデル定義は{"name", "provider", "model", "model_detail"}の辞書で、SUMMARY_MODELSの設定から読み込む
+    """
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = ProviderRegistry()
+        return cls._instance
+
+    def __init__(self, providers=None, models=None):
+        self._providers = {}
+        for provider in create_default_providers() if providers is None else providers:
+            self.register(provider)
+        self._models = {}
+        for model in SUMMARY_MODELS if models is None else models:
+            self.register_model(model)
+
+    def register(self, provider):
+        self._providers[provider.name] = provider
+
+    def register_model(self, model):
+        self._models[model["name"]] = {**model, "model_detail": model.get("model_detail") or model["name"]}
+
+    def get_provider(self, provider_name):
+        return self._providers.get(provider_name)
+
+    def get_model(self, model_name):
+        return self._models.get(model_name)
+
+    def get_provider_name(self, model_name):
+        model = self._models.get(model_name)
+        return model["provider"] if model else model_name
+
+    def is_model_available(self, model_name):
+        model = self._models.get(model_name)
+        if not model or not model.get("model"):
+            return False
+        provider = self._providers.get(model["provider"])
+        return provider is not None and provider.is_available()
+
+    def get_available_models(self):
+        """利用可能なモデル名を設定の順に返す"""
+        return [name for name in self._models if self.is_model_available(name)]
+
+    def resolve(self, model_name):
+        """モデル名に対応する(プロバイダ, モデル定義)を返す"""
+        if not self.is_model_available(model_name):
+            raise APIError(MESSAGES["NO_API_CREDENTIALS"])
+        model = self._models[model_name]
+        return self._providers[model["provider"]], model
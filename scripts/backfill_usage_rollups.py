@@ -0,0 +1,43 @@
+"""
+使用記録（summary_usage）から時間別・日別の集計を作り直す
+
+統計情報を集計から表示する（USAGE_ROLLUP_ENABLED=True）前に、既存の使用記録について実行する。
+期間を指定しない場合はすべての使用記録から作り直す。
+
+使い方:
+    python scripts/backfill_usage_rollups.py
+    python scripts/backfill_usage_rollups.py --start 2025-04-01 --end 2025-04-30
+"""
+import argparse
+import datetime
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.usage_rollup import backfill_usage_rollups
+from utils.db import ensure_indexes
+from utils.env_loader import load_environment_variables
+
+
+def parse_date(value):
+    return datetime.datetime.strptime(value, "%Y-%m-%d")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="使用統計の時間別・日別の集計を作り直す")
+    parser.add_argument("--start", type=parse_date, help="開始日（YYYY-MM-DD、UTC）")
+    parser.add_argument("--end", type=parse_date, help="終了日（YYYY-MM-DD、UTC、この日を含む）")
+    args = parser.parse_args()
+
+    load_environment_variables()
+    # アプリケーションの起動前に実行する場合も、集計の一意のインデックスを作成しておく
+    ensure_indexes()
+
+    end = args.end + datetime.timedelta(days=1) if args.end else None
+    written = backfill_usage_rollups(args.start, end)
+    print(f"時間別の集計: {written['hourly']:,} 件、日別の集計: {written['daily']:,} 件を書き込みました。")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+APIクライアントを毎回生成する場合と、ClientRegistryで共有する場合のリクエスト時間を比較するベンチマーク
+
+ローカルのスタブHTTPサーバーに対してAnthropic/OpenAIクライアントでリクエストを送信する。
+スタブはHTTPのためTLSハンドシェイク分は含まれず、本番環境での差はこの結果より大きくなる。
+
+使い方:
+    python scripts/benchmark_client_registry.py --requests 200
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from anthropic import Anthropic
+from openai import OpenAI
+
+from external_service.client_registry import ClientRegistry
+
+CLAUDE_RESPONSE = {
+    "id": "msg_stub",
+    "type": "message",
+    "role": "assistant",
+    "model": "stub",
+    "content": [{"type": "text", "text": "入院期間:スタブ"}],
+    "stop_reason": "end_turn",
+    "stop_sequence": None,
+    "usage": {"input_tokens": 10, "output_tokens": 5}
+}
+
+OPENAI_RESPONSE = {
+    "id": "chatcmpl-stub",
+    "object": "chat.completion",
+    "created": 0,
+    "model": "stub",
+    "choices": [{
+        "index": 0,
+        "message": {"role": "assistant", "content": "入院期間:スタブ"},
+        "finish_reason": "stop"
+    }],
+    "usage": {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15}
+}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+
+        if self.path.endswith("/messages"):
+            body = json.dumps(CLAUDE_RESPONSE).encode("utf-8")
+        else:
+            body = json.dumps(OPENAI_RESPONSE).encode("utf-8")
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def call_claude(client):
+    client.messages.create(
+        model="stub",
+        max_tokens=10,
+        messages=[{"role": "user", "content": "テスト"}]
+    )
+
+
+def call_openai(client):
+    client.chat.completions.create(
+        model="stub",
+        messages=[{"role": "user", "content": "テスト"}]
+    )
+
+
+def measure(request_count, make_client, call):
+    timings = []
+    for _ in range(request_count):
+        start = time.perf_counter()
+        client = make_client()
+        call(client)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def report(label, timings):
+    print(f"{label:<28} 平均 {statistics.mean(timings):7.2f} ms  "
+          f"中央値 {statistics.median(timings):7.2f} ms  "
+          f"p95 {sorted(timings)[int(len(timings) * 0.95) - 1]:7.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="APIクライアント共有のベンチマーク")
+    parser.add_argument("--requests", type=int, default=200, help="計測するリクエスト数")
+    args = parser.parse_args()
+
+    server = start_stub_server()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    registry = ClientRegistry()
+
+    try:
+        scenarios = [
+            ("Claude 毎回生成", lambda: Anthropic(api_key="stub", base_url=base_url), call_claude),
+            ("Claude 共有クライアント", lambda: registry.get_anthropic_client("stub", base_url), call_claude),
+            ("OpenAI 毎回生成", lambda: OpenAI(api_key="stub", base_url=f"{base_url}/v1"), call_openai),
+            ("OpenAI 共有クライアント", lambda: registry.get_openai_client("stub", f"{base_url}/v1"), call_openai),
+        ]
+
+        for label, make_client, call in scenarios:
+            # ウォームアップ
+            measure(5, make_client, call)
+            report(label, measure(args.requests, make_client, call))
+    finally:
+        registry.close()
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+"""
+config.iniを毎回読み込む場合と、ConfigCacheを使う場合のget_config()の所要時間を比較するベンチマーク
+
+使い方:
+    python scripts/benchmark_config.py --iterations 10000
+"""
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.config import get_config, read_config
+
+
+def main():
+    parser = argparse.ArgumentParser(description="get_config()のベンチマーク")
+    parser.add_argument("--iterations", type=int, default=10000, help="呼び出し回数")
+    args = parser.parse_args()
+
+    get_config()
+
+    scenarios = [
+        ("毎回読み込み", lambda: read_config()["PROMPTS"]["discharge_summary"]),
+        ("キャッシュ", lambda: get_config()["PROMPTS"]["discharge_summary"]),
+    ]
+
+    for label, func in scenarios:
+        elapsed = min(timeit.repeat(func, number=args.iterations, repeat=3))
+        print(f"{label:<12} {elapsed / args.iterations * 1_000_000:9.2f} µs/回")
+
+
+if __name__ == "__main__":
+    main()
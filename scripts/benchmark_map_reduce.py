@@ -0,0 +1,127 @@
+"""
+長いカルテを1回で要約する場合と、期間ごとに分割して要約する場合(map-reduce)の所要時間を比較するベンチマーク
+
+既定では、入力・出力トークン数に比例して応答時間がかかるスタブのプロバイダを使う。
+--liveを指定すると、環境変数に設定された実際のモデルにリクエストを送信する（料金が発生します）。
+
+使い方:
+    python scripts/benchmark_map_reduce.py --chars 150000 --chunk-size 20000 --concurrency 4
+    python scripts/benchmark_map_reduce.py --live --model Claude --map-model Gemini_Flash
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from unittest.mock import patch
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from external_service.base_provider import SummaryProvider
+from external_service.provider_registry import ProviderRegistry
+from services.circuit_breaker import CircuitBreakerRegistry
+from services.map_reduce_summary import MapReduceSummarizer
+from services.summary_router import LatencyTracker, SummaryRouter
+from services.token_estimator import TokenEstimator
+
+SUMMARY_TEXT = "入院期間:2025年4月1日〜2025年4月30日\n現病歴:発熱と咳嗽で入院\n治療経過:抗菌薬で改善\n"
+
+
+class StubProvider(SummaryProvider):
+    """入力トークン数と出力トークン数に比例した時間をかけて応答するプロバイダ"""
+
+    def __init__(self, name, input_tokens_per_second, output_tokens_per_second, first_token_latency, output_tokens):
+        self.name = name
+        self.input_tokens_per_second = input_tokens_per_second
+        self.output_tokens_per_second = output_tokens_per_second
+        self.first_token_latency = first_token_latency
+        self.output_tokens = output_tokens
+        self.estimator = TokenEstimator(use_tokenizer=False)
+
+    def is_available(self):
+        return True
+
+    async def generate_async(self, model_name, medical_text, additional_info="", department="default",
+                             max_tokens=None, section=None):
+        input_tokens = self.estimator.estimate(medical_text + additional_info, self.name)
+        await asyncio.sleep(self.first_token_latency + input_tokens / self.input_tokens_per_second
+                            + self.output_tokens / self.output_tokens_per_second)
+        return SUMMARY_TEXT, input_tokens, self.output_tokens, {}
+
+
+def create_karte(chars):
+    lines = []
+    size = 0
+    day = 1
+    while size < chars:
+        entry = (f"2025/{4 + (day - 1) // 28:02d}/{(day - 1) % 28 + 1:02d}(月)　（入院 {day} 日目）\n"
+                 "内科　　山田　太郎　　国保　　09:00\n"
+                 "S >\n咳嗽は軽減している。食事は全量摂取。\n"
+                 "O >\nBT 36.8 BP 124/72 SpO2 97%(RA) 呼吸音清。\n"
+                 "A >\n肺炎は改善傾向。\n"
+                 "P >\n抗菌薬を継続し、明日採血で炎症反応を確認する。\n")
+        lines.append(entry)
+        size += len(entry)
+        day += 1
+    return "".join(lines)[:chars]
+
+
+def create_stub_router(output_tokens):
+    registry = ProviderRegistry(
+        providers=[
+            StubProvider("claude", input_tokens_per_second=20000, output_tokens_per_second=60,
+                         first_token_latency=1.0, output_tokens=output_tokens),
+            StubProvider("gemini", input_tokens_per_second=60000, output_tokens_per_second=200,
+                         first_token_latency=0.5, output_tokens=output_tokens),
+        ],
+        models=[
+            {"name": "Claude", "provider": "claude", "model": "claude-stub"},
+            {"name": "Gemini_Flash", "provider": "gemini", "model": "gemini-flash-stub"},
+        ]
+    )
+    return SummaryRouter(registry=registry, failover_models=[], latency_tracker=LatencyTracker(),
+                         circuit_breakers=CircuitBreakerRegistry())
+
+
+async def measure(label, func):
+    start = time.perf_counter()
+    outcome = await func()
+    elapsed = time.perf_counter() - start
+    print(f"{label}: {elapsed:7.2f} 秒  入力 {outcome['input_tokens']:>8,} トークン  "
+          f"出力 {outcome['output_tokens']:>6,} トークン")
+
+
+async def run(args):
+    router = SummaryRouter() if args.live else create_stub_router(args.output_tokens)
+    summarizer = MapReduceSummarizer(router, map_model=args.map_model, chunk_size=args.chunk_size,
+                                     concurrency=args.concurrency, threshold=0, enabled=True)
+    karte = create_karte(args.chars)
+    chunks = summarizer.split(karte)
+    print(f"カルテ {len(karte):,} 文字 / チャンク {len(chunks or [])} 件 / 同時実行数 {args.concurrency}")
+
+    await measure("1回で要約", lambda: router.generate_async(args.model, karte, args.department))
+    await measure("分割して要約", lambda: summarizer.generate_async(args.model, chunks, args.department))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="map-reduceによる要約のベンチマーク")
+    parser.add_argument("--chars", type=int, default=150000, help="カルテの文字数")
+    parser.add_argument("--chunk-size", type=int, default=20000, help="チャンクの最大文字数")
+    parser.add_argument("--concurrency", type=int, default=4, help="チャンクを同時に要約する数")
+    parser.add_argument("--model", default="Claude", help="最終的な要約に使うモデル名")
+    parser.add_argument("--map-model", default="Gemini_Flash", help="チャンクの要約に使うモデル名")
+    parser.add_argument("--department", default="default", help="診療科")
+    parser.add_argument("--output-tokens", type=int, default=1000, help="スタブが1回の要約で出力するトークン数")
+    parser.add_argument("--live", action="store_true", help="実際のAPIにリクエストを送信する")
+    args = parser.parse_args()
+
+    if args.live:
+        asyncio.run(run(args))
+    else:
+        # スタブではプロンプトテンプレートをDBから読み込まない
+        with patch("external_service.prompt_builder.get_prompt_template", return_value=""):
+            asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+退院時サマリを1回のリクエストで生成する場合と、項目ごとに同時に生成する場合の所要時間を比較するベンチマーク
+
+既定では、出力トークン数に比例して応答時間がかかるスタブのプロバイダを使う。
+スタブは同じカルテ情報の2回目以降のリクエストでは入力の処理時間をキャッシュ分だけ短縮する。
+--liveを指定すると、環境変数に設定された実際のモデルにリクエストを送信する（料金が発生します）。
+
+使い方:
+    python scripts/benchmark_section_parallel.py --chars 30000
+    python scripts/benchmark_section_parallel.py --live --model Claude
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from unittest.mock import patch
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from external_service.base_provider import SummaryProvider
+from external_service.provider_registry import ProviderRegistry
+from services.circuit_breaker import CircuitBreakerRegistry
+from services.section_parallel_summary import SectionParallelSummarizer
+from services.summary_router import LatencyTracker, SummaryRouter
+from services.token_estimator import TokenEstimator
+from utils.constants import DEFAULT_SECTION_NAMES
+
+# 項目ごとの出力トークン数の目安
+SECTION_OUTPUT_TOKENS = {
+    "入院期間": 30,
+    "現病歴": 300,
+    "入院時検査": 250,
+    "入院中の治療経過": 600,
+    "退院申し送り": 250,
+    "禁忌/アレルギー": 40,
+    "備考": 80,
+}
+
+
+class StubProvider(SummaryProvider):
+    """入力と出力のトークン数に比例した時間をかけて応答し、同じカルテ情報の入力はキャッシュするプロバイダ"""
+    name = "claude"
+
+    def __init__(self, input_tokens_per_second=20000, output_tokens_per_second=60, first_token_latency=1.0,
+                 cache_hit_ratio=0.9):
+        self.input_tokens_per_second = input_tokens_per_second
+        self.output_tokens_per_second = output_tokens_per_second
+        self.first_token_latency = first_token_latency
+        self.cache_hit_ratio = cache_hit_ratio
+        self.cached = set()
+        self.estimator = TokenEstimator(use_tokenizer=False)
+
+    def is_available(self):
+        return True
+
+    async def generate_async(self, model_name, medical_text, additional_info="", department="default",
+                             max_tokens=None, section=None):
+        input_tokens = self.estimator.estimate(medical_text + additional_info, self.name)
+        cache_read_tokens = round(input_tokens * self.cache_hit_ratio) if medical_text in self.cached else 0
+        output_tokens = SECTION_OUTPUT_TOKENS.get(section) if section else sum(SECTION_OUTPUT_TOKENS.values())
+        await asyncio.sleep(self.first_token_latency
+                            + (input_tokens - cache_read_tokens) / self.input_tokens_per_second
+                            + output_tokens / self.output_tokens_per_second)
+        self.cached.add(medical_text)
+        sections = [section] if section else DEFAULT_SECTION_NAMES
+        text = "\n".join(f"{name}:{name}の内容" for name in sections)
+        return text, input_tokens, output_tokens, {"cache_read_input_tokens": cache_read_tokens}
+
+
+def create_stub_router():
+    registry = ProviderRegistry(
+        providers=[StubProvider()],
+        models=[{"name": "Claude", "provider": "claude", "model": "claude-stub"}]
+    )
+    return SummaryRouter(registry=registry, failover_models=[], latency_tracker=LatencyTracker(),
+                         circuit_breakers=CircuitBreakerRegistry())
+
+
+async def measure(label, func):
+    start = time.perf_counter()
+    outcome = await func()
+    elapsed = time.perf_counter() - start
+    cache_read_tokens = outcome["cache_usage"].get("cache_read_input_tokens", 0)
+    print(f"{label}: {elapsed:7.2f} 秒  入力 {outcome['input_tokens']:>8,} トークン"
+          f"（キャッシュ {cache_read_tokens:,}）  出力 {outcome['output_tokens']:>6,} トークン")
+
+
+async def run(args):
+    router = SummaryRouter() if args.live else create_stub_router()
+    karte = ("入院時より発熱が持続し、抗菌薬を投与した。" * (args.chars // 20 + 1))[:args.chars]
+
+    await measure("1回で生成", lambda: router.generate_async(args.model, karte, args.department))
+    for warmup in (True, False):
+        summarizer = SectionParallelSummarizer(router, concurrency=args.concurrency, enabled=True, warmup=warmup)
+        # 項目ごとの計測でキャッシュが共有されないよう、カルテ情報を変える
+        karte = f"{warmup}\n{karte}"
+        label = "項目ごとに生成（先に1項目）" if warmup else "項目ごとに生成（同時）"
+        await measure(label, lambda: summarizer.generate_async(args.model, karte, args.department))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="項目ごとの並列生成のベンチマーク")
+    parser.add_argument("--chars", type=int, default=30000, help="カルテの文字数")
+    parser.add_argument("--concurrency", type=int, default=0, help="同時に生成する項目数（0で全項目）")
+    parser.add_argument("--model", default="Claude", help="モデル名")
+    parser.add_argument("--department", default="default", help="診療科")
+    parser.add_argument("--live", action="store_true", help="実際のAPIにリクエストを送信する")
+    args = parser.parse_args()
+
+    if args.live:
+        asyncio.run(run(args))
+    else:
+        # スタブではプロンプトテンプレートをDBから読み込まない
+        with patch("external_service.prompt_builder.get_prompt_template", return_value=""):
+            asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
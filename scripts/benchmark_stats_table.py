@@ -0,0 +1,69 @@
+"""
+統計情報の表を、変更前のiterrows()で全行作成する場合と、列ごとに整形して1ページ分のみ作成する場合の所要時間を比較するベンチマーク
+
+使い方:
+    python scripts/benchmark_stats_table.py --days 365
+"""
+import argparse
+import os
+import sys
+import timeit
+
+import flet as ft
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ui_components.stats_table import create_stats_table
+
+
+def create_daily_stats(days):
+    rng = np.random.default_rng(0)
+    input_tokens = rng.integers(10000, 2000000, days)
+    output_tokens = rng.integers(1000, 200000, days)
+    return pd.DataFrame({
+        "date_str": pd.date_range("2024-01-01", periods=days).strftime("%Y-%m-%d"),
+        "count": rng.integers(1, 200, days),
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens,
+        "total_tokens": input_tokens + output_tokens,
+        "processing_time": rng.uniform(5, 60, days).round(1),
+    })
+
+
+def create_table_with_iterrows(daily_stats):
+    """変更前の実装（iterrows()で全行のDataRowを作成する）"""
+    table_rows = []
+    for _, row in daily_stats.iterrows():
+        table_rows.append(ft.DataRow(
+            cells=[
+                ft.DataCell(ft.Text(row['date_str'])),
+                ft.DataCell(ft.Text(str(row['count']))),
+                ft.DataCell(ft.Text(f"{row['input_tokens']:,}")),
+                ft.DataCell(ft.Text(f"{row['output_tokens']:,}")),
+                ft.DataCell(ft.Text(f"{row['total_tokens']:,}")),
+                ft.DataCell(ft.Text(f"{row['processing_time']:.1f}秒"))
+            ]
+        ))
+    return ft.DataTable(columns=[ft.DataColumn(ft.Text("日付"))], rows=table_rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="統計情報の表の作成のベンチマーク")
+    parser.add_argument("--days", type=int, default=365, help="日別集計の行数")
+    parser.add_argument("--iterations", type=int, default=20, help="1回の計測での作成回数")
+    args = parser.parse_args()
+
+    daily_stats = create_daily_stats(args.days)
+    scenarios = [
+        ("iterrows（全行）", lambda: create_table_with_iterrows(daily_stats)),
+        ("列ごと（1ページ）", lambda: create_stats_table(daily_stats, "date_str", "日付", on_page_change=print)),
+    ]
+    for label, func in scenarios:
+        elapsed = min(timeit.repeat(func, number=args.iterations, repeat=3))
+        print(f"{label:<16} {elapsed / args.iterations * 1000:9.2f} ms/回")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+以前の項目ごとに部分文字列を探す実装と、正規表現で項目名を探す現在の実装のparse_discharge_summary()の所要時間を比較するベンチマーク
+
+10～50KBの退院時サマリを生成し、両方の実装の結果が一致することを確認してから計測する。
+
+使い方:
+    python scripts/benchmark_text_processor.py --sizes 10 30 50
+"""
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.constants import DEFAULT_SECTION_NAMES
+from utils.text_processor import parse_discharge_summary
+
+SAMPLE_LINES = [
+    "発熱と咳嗽を主訴に当院外来を受診し、胸部X線で右下肺野に浸潤影を認めたため入院となった。",
+    "入院後はセフトリアキソンを開始し、第3病日には解熱した。",
+    "WBC 12,300/μL、CRP 8.5mg/dLと炎症反応の上昇を認めた。",
+    "喀痰培養では肺炎球菌が検出された。",
+    "食事摂取は良好で、リハビリテーションにより歩行は自立した。",
+]
+
+
+def parse_discharge_summary_legacy(summary_text):
+    """変更前の実装（行ごとにすべての項目名を部分文字列として探し、文字列を連結する）"""
+    sections = {section: "" for section in DEFAULT_SECTION_NAMES}
+
+    section_aliases = {
+        "禁忌・アレルギー": "禁忌/アレルギー"
+    }
+
+    lines = summary_text.split('\n')
+    current_section = None
+
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+
+        found_section = False
+        for section in list(sections.keys()) + list(section_aliases.keys()):
+            if section in line:
+                if section in section_aliases:
+                    current_section = section_aliases[section]
+                else:
+                    current_section = section
+
+                line = line.replace(section, "").replace(":", "").strip()
+                found_section = True
+                break
+
+        if current_section and line and not found_section:
+            if sections[current_section]:
+                sections[current_section] += "\n" + line
+            else:
+                sections[current_section] = line
+        elif current_section and line and found_section:
+            sections[current_section] = line
+
+    return sections
+
+
+def create_summary(size_kb):
+    """各項目にほぼ同じ量の本文を持つ、UTF-8でsize_kb KB程度の退院時サマリ"""
+    section_bytes = size_kb * 1024 // len(DEFAULT_SECTION_NAMES)
+    lines = []
+    index = 0
+    for section in DEFAULT_SECTION_NAMES:
+        lines.append(f"{section}:")
+        size = 0
+        while size < section_bytes:
+            line = SAMPLE_LINES[index % len(SAMPLE_LINES)]
+            lines.append(line)
+            size += len(line.encode("utf-8")) + 1
+            index += 1
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="parse_discharge_summary()のベンチマーク")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 30, 50], help="サマリのサイズ（KB）")
+    parser.add_argument("--iterations", type=int, default=20, help="1回の計測での呼び出し回数")
+    args = parser.parse_args()
+
+    for size_kb in args.sizes:
+        summary = create_summary(size_kb)
+        if parse_discharge_summary(summary) != parse_discharge_summary_legacy(summary):
+            raise SystemExit(f"{size_kb}KB: 以前の実装と結果が一致しません")
+
+        results = []
+        for label, func in [("以前の実装", parse_discharge_summary_legacy), ("現在の実装", parse_discharge_summary)]:
+            elapsed = min(timeit.repeat(lambda: func(summary), number=args.iterations, repeat=3))
+            results.append(elapsed / args.iterations * 1000)
+            print(f"{size_kb:>3}KB {label:<8} {results[-1]:9.3f} ms/回")
+        print(f"{size_kb:>3}KB 高速化 {results[0] / results[1]:9.1f} 倍")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+使用記録をすべて取得してpandasで集計する場合と、MongoDBの集計パイプラインを使う場合の統計情報の取得時間を比較するベンチマーク
+
+ローカルのMongoDBに合成した使用記録を作成して計測する（本番のデータベースは使わない）。
+
+使い方:
+    python scripts/benchmark_usage_statistics.py --uri mongodb://localhost:27017 --rows 1000000
+"""
+import argparse
+import datetime
+import os
+import random
+import sys
+import time
+
+import pandas as pd
+from pymongo import MongoClient
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.usage_statistics import create_usage_query, load_usage_statistics
+
+DEPARTMENTS = ["default", "内科", "外科", "整形外科", "眼科", "皮膚科", "泌尿器科", "循環器内科"]
+MODELS = ["Claude", "Gemini_Pro", "Gemini_Flash", "GPT4.1"]
+DOCUMENT_NAMES = ["退院時サマリ", "不明"]
+BATCH_SIZE = 10000
+
+
+def create_usage_documents(rows, start):
+    """startから1年間に分散した合成の使用記録"""
+    seconds = 365 * 24 * 60 * 60
+    for _ in range(rows):
+        input_tokens = random.randint(2000, 60000)
+        output_tokens = random.randint(500, 3000)
+        yield {
+            "date": start + datetime.timedelta(seconds=random.randrange(seconds)),
+            "app_type": "discharge_summary",
+            "document_name": random.choice(DOCUMENT_NAMES),
+            "model_detail": random.choice(MODELS),
+            "department": random.choice(DEPARTMENTS),
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens,
+            "processing_time": random.randint(5, 60),
+        }
+
+
+def prepare_collection(collection, rows, start):
+    if collection.estimated_document_count() == rows:
+        return
+    collection.drop()
+    batch = []
+    for document in create_usage_documents(rows, start):
+        batch.append(document)
+        if len(batch) == BATCH_SIZE:
+            collection.insert_many(batch)
+            batch = []
+    if batch:
+        collection.insert_many(batch)
+    collection.create_index([("date", 1), ("document_name", 1)])
+
+
+def load_with_pandas(collection, start, end, doc_type, grouping):
+    """変更前の実装（条件に合う使用記録をすべて取得してpandasで集計する）"""
+    df = pd.DataFrame(list(collection.find(create_usage_query(start, end, doc_type))))
+    if grouping == "daily":
+        df["date_str"] = df["date"].dt.strftime("%Y-%m-%d")
+    column = {"daily": "date_str", "department": "department", "model": "model_detail"}[grouping]
+    return df.groupby(column).agg({
+        "input_tokens": "sum",
+        "output_tokens": "sum",
+        "total_tokens": "sum",
+        "processing_time": "mean",
+        "document_name": "count"
+    }).reset_index()
+
+
+def measure(label, func):
+    start = time.perf_counter()
+    stats = func()
+    print(f"{label:<20} {time.perf_counter() - start:8.2f} 秒  {len(stats):>4} 行")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="統計情報の取得のベンチマーク")
+    parser.add_argument("--uri", default="mongodb://localhost:27017", help="ローカルのMongoDBの接続先")
+    parser.add_argument("--rows", type=int, default=1000000, help="合成する使用記録の件数")
+    parser.add_argument("--days", type=int, default=365, help="集計する期間の日数")
+    args = parser.parse_args()
+
+    client = MongoClient(args.uri, serverSelectionTimeoutMS=5000)
+    collection = client["usage_statistics_benchmark"]["summary_usage"]
+    start = datetime.datetime(2024, 1, 1)
+    prepare_collection(collection, args.rows, start)
+
+    end = start + datetime.timedelta(days=args.days)
+    for grouping in ("daily", "department", "model"):
+        for doc_type in ("退院時サマリ", "すべて"):
+            print(f"[{grouping} / {doc_type}]")
+            measure("pandasで集計", lambda: load_with_pandas(collection, start, end, doc_type, grouping))
+            measure("集計パイプライン", lambda: load_usage_statistics(start, end, doc_type, grouping, collection))
+
+
+if __name__ == "__main__":
+    main()
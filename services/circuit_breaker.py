@@ -0,0 +1,117 @@
+import threading
+import time
+
+from services.retry_policy import CONNECTION_ERRORS, get_status_code, iter_error_chain
+from utils.config import CIRCUIT_BREAKER_FAILURE_THRESHOLD, CIRCUIT_BREAKER_RESET_TIMEOUT
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+def is_provider_failure(error):
+    """プロバイダ側の障害とみなすエラーか。入力内容やレート制限によるエラーは含めない"""
+    for cause in iter_error_chain(error):
+        if isinstance(cause, (CONNECTION_ERRORS, TimeoutError)):
+            return True
+        status_code = get_status_code(cause)
+        if status_code is not None:
+            return status_code >= 500
+    return False
+
+
+class CircuitBreaker:
+    """連続してfailure_threshold回失敗したプロバイダへの送信を止め、reset_timeout秒後に1件だけ試す
+
+    試行が成功すれば送信を再開し、失敗すれば再びreset_timeout秒止める
+    """
+
+    def __init__(self, failure_threshold=CIRCUIT_BREAKER_FAILURE_THRESHOLD,
+                 reset_timeout=CIRCUIT_BREAKER_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def get_state(self):
+        with self._lock:
+            return self._get_state()
+
+    def _get_state(self):
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._state = HALF_OPEN
+            self._trial_running = False
+        return self._state
+
+    def is_available(self):
+        """画面表示用。停止中でなければTrue（試行待ちの状態を含む）"""
+        return self.get_state() != OPEN
+
+    def allow_request(self):
+        """送信してよいか。HALF_OPENでは試行中の1件のみ許可する"""
+        if self.failure_threshold <= 0:
+            return True
+        with self._lock:
+            state = self._get_state()
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._state = CLOSED
+            self._failures = 0
+            self._trial_running = False
+
+    def record_failure(self):
+        if self.failure_threshold <= 0:
+            return
+        with self._lock:
+            self._failures += 1
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+                self._trial_running = False
+
+    def record_cancel(self):
+        """結果が出る前にキャンセルされた試行は成功とも失敗とも数えない"""
+        with self._lock:
+            self._trial_running = False
+
+
+class CircuitBreakerRegistry:
+    """プロバイダごとのCircuitBreakerをプロセス内で共有する"""
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = CircuitBreakerRegistry()
+        return cls._instance
+
+    def __init__(self, failure_threshold=CIRCUIT_BREAKER_FAILURE_THRESHOLD,
+                 reset_timeout=CIRCUIT_BREAKER_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def get(self, provider_name):
+        with self._lock:
+            breaker = self._breakers.get(provider_name)
+            if breaker is None:
+                breaker = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+                self._breakers[provider_name] = breaker
+            return breaker
+
+    def is_available(self, provider_name):
+        return self.get(provider_name).is_available()
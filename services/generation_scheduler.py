@@ -0,0 +1,207 @@
+import asyncio
+import contextlib
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+from utils.config import GENERATION_QUEUE_SIZE, GENERATION_QUEUE_POLICY, GENERATION_QUEUE_TIMEOUT, \
+    get_generation_workers
+from utils.constants import MESSAGES
+from utils.exceptions import QueueFullError
+
+
+class GenerationTicket:
+    """スケジューラに投入された1件の生成リクエスト。イベントループ上でコルーチンとして実行される"""
+
+    def __init__(self, lane, func, args, kwargs, loop):
+        self.future = Future()
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self._lane = lane
+        self._loop = loop
+        self._started = loop.create_future()
+
+    def start(self):
+        """ワーカーの空きが出た時点で呼ばれ、実行を開始する"""
+        # ワーカーの解放は別スレッドから行われることがあるため、ループ経由で通知する
+        self._loop.call_soon_threadsafe(self._set_started)
+
+    def position(self):
+        """待ち行列での順番（1始まり）を返す。実行中または完了済みの場合は0"""
+        return self._lane.get_position(self)
+
+    def done(self):
+        return self.future.done()
+
+    def result(self, timeout=None):
+        return self.future.result(timeout)
+
+    def cancel(self):
+        """実行開始前であれば待ち行列から取り除く"""
+        cancelled = self._lane.cancel(self)
+        if cancelled:
+            self._loop.call_soon_threadsafe(self._started.cancel)
+        return cancelled
+
+    def _set_started(self):
+        if not self._started.done():
+            self._started.set_result(None)
+
+
+class ProviderLane:
+    """1つのプロバイダに対するFIFO待ち行列と同時実行数の上限"""
+
+    def __init__(self, name, max_workers, max_queue_size=GENERATION_QUEUE_SIZE,
+                 queue_policy=GENERATION_QUEUE_POLICY, queue_timeout=GENERATION_QUEUE_TIMEOUT):
+        self.name = name
+        self.max_workers = max(1, max_workers)
+        self.max_queue_size = max(1, max_queue_size)
+        self.queue_policy = queue_policy
+        self.queue_timeout = queue_timeout
+        self._condition = threading.Condition()
+        self._waiting = deque()
+        self._active = 0
+        self._tasks = set()
+
+    async def submit_async(self, func, *args, **kwargs):
+        """コルーチン関数funcを待ち行列に投入し、スレッドを占有せずに実行するチケットを返す"""
+        loop = asyncio.get_running_loop()
+        ticket = GenerationTicket(self, func, args, kwargs, loop)
+        await self._wait_for_capacity_async()
+        with self._condition:
+            if len(self._waiting) >= self.max_queue_size:
+                raise QueueFullError(MESSAGES["QUEUE_FULL"])
+            self._waiting.append(ticket)
+            self._dispatch()
+        # タスクへの参照を保持しないと実行途中でガベージコレクトされることがある
+        task = loop.create_task(self._run_async(ticket))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return ticket
+
+    def get_position(self, ticket):
+        with self._condition:
+            try:
+                return self._waiting.index(ticket) + 1
+            except ValueError:
+                return 0
+
+    def get_status(self):
+        with self._condition:
+            return {"waiting": len(self._waiting), "active": self._active}
+
+    def cancel(self, ticket):
+        with self._condition:
+            try:
+                self._waiting.remove(ticket)
+            except ValueError:
+                return False
+            self._condition.notify_all()
+        return ticket.future.cancel()
+
+    def shutdown(self):
+        """実行開始前のチケットをすべてキャンセルする"""
+        with self._condition:
+            waiting = list(self._waiting)
+        for ticket in waiting:
+            ticket.cancel()
+
+    async def _wait_for_capacity_async(self):
+        # イベントループを止めないよう、条件変数ではなくポーリングで空きを待つ
+        deadline = time.monotonic() + self.queue_timeout
+        while True:
+            with self._condition:
+                if len(self._waiting) < self.max_queue_size:
+                    return
+            if self.queue_policy == "reject" or time.monotonic() >= deadline:
+                raise QueueFullError(MESSAGES["QUEUE_FULL"])
+            await asyncio.sleep(0.1)
+
+    @contextlib.contextmanager
+    def borrow_workers(self, count):
+        """実行中のチケットが同時に追加で送るリクエストのために、空きワーカーを最大count個確保し、確保した数を返す
+
+        待ち行列のチケットを優先するため、待ち行列が空の場合のみ確保する。
+        確保できなくても待機しないため、チケットが自身のワーカーのみで実行を続けられる。終了時に解放する
+        """
+        with self._condition:
+            granted = 0 if self._waiting else max(0, min(count, self.max_workers - self._active))
+            self._active += granted
+        try:
+            yield granted
+        finally:
+            if granted:
+                self._release(granted)
+
+    def _dispatch(self):
+        """空きワーカーがあれば待ち行列の先頭から実行を開始する（ロック取得済みで呼び出す）"""
+        while self._waiting and self._active < self.max_workers:
+            ticket = self._waiting.popleft()
+            self._active += 1
+            ticket.start()
+        self._condition.notify_all()
+
+    def _release(self, count=1):
+        with self._condition:
+            self._active -= count
+            self._dispatch()
+
+    async def _run_async(self, ticket):
+        try:
+            await ticket._started
+        except asyncio.CancelledError:
+            # 実行開始前にキャンセルされた場合はワーカーを確保していない
+            return
+
+        try:
+            if ticket.future.set_running_or_notify_cancel():
+                try:
+                    ticket.future.set_result(await ticket.func(*ticket.args, **ticket.kwargs))
+                except BaseException as e:
+                    ticket.future.set_exception(e)
+        finally:
+            self._release()
+
+
+class GenerationScheduler:
+    """プロセス全体で共有するサマリ生成スケジューラ"""
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = GenerationScheduler()
+        return cls._instance
+
+    def __init__(self):
+        self._lanes = {}
+        self._lock = threading.Lock()
+
+    def get_lane(self, provider):
+        with self._lock:
+            lane = self._lanes.get(provider)
+            if lane is None:
+                lane = ProviderLane(provider, get_generation_workers(provider))
+                self._lanes[provider] = lane
+            return lane
+
+    async def submit_async(self, provider, func, *args, **kwargs):
+        """コルーチン関数をプロバイダの待ち行列に投入してチケットを返す"""
+        return await self.get_lane(provider).submit_async(func, *args, **kwargs)
+
+    def get_status(self):
+        with self._lock:
+            lanes = dict(self._lanes)
+        return {provider: lane.get_status() for provider, lane in lanes.items()}
+
+    def shutdown(self):
+        with self._lock:
+            lanes = list(self._lanes.values())
+            self._lanes = {}
+        for lane in lanes:
+            lane.shutdown()
@@ -0,0 +1,104 @@
+import asyncio
+import contextlib
+
+from external_service.prompt_builder import MAP_SECTION
+from services.summary_router import SummaryRouter, combine_cache_usage, combine_models, create_model_usage
+from utils.config import MAP_REDUCE_CHUNK_SIZE, MAP_REDUCE_CONCURRENCY, MAP_REDUCE_ENABLED, MAP_REDUCE_MAP_MODEL, \
+    MAP_REDUCE_THRESHOLD
+from utils.karte_splitter import split_karte
+
+
+def format_period(chunk):
+    if chunk["start_date"] and chunk["end_date"] and chunk["start_date"] != chunk["end_date"]:
+        return f"{chunk['start_date']}〜{chunk['end_date']}"
+    return chunk["start_date"] or chunk["end_date"] or "日付不明"
+
+
+def create_reduce_input(chunks, partial_summaries):
+    """期間ごとの要約を、期間の見出しをつけて1つのカルテ情報にまとめる"""
+    sections = [f"【{format_period(chunk)}の経過の要約】\n{summary.strip()}"
+                for chunk, summary in zip(chunks, partial_summaries)]
+    return "\n\n".join(sections)
+
+
+def combine_outcomes(map_outcomes, reduce_outcome):
+    """トークン数・キャッシュの利用量・再試行回数は全リクエストの合計とする
+
+    チャンクの要約とまとめで異なるモデルを使うため、使用したすべてのモデルとモデルごとの内訳を記録する
+    """
+    outcomes = [*map_outcomes, reduce_outcome]
+    return {
+        **reduce_outcome,
+        "model_name": combine_models(outcomes, "model_name"),
+        "model_detail": combine_models(outcomes, "model_detail"),
+        "input_tokens": sum(outcome["input_tokens"] for outcome in outcomes),
+        "output_tokens": sum(outcome["output_tokens"] for outcome in outcomes),
+        "cache_usage": combine_cache_usage(outcomes),
+        "model_usage": create_model_usage(outcomes),
+        "failover": any(outcome["failover"] for outcome in outcomes),
+        "retry_count": sum(outcome["retry_count"] for outcome in outcomes),
+        "chunk_count": len(map_outcomes),
+    }
+
+
+class MapReduceSummarizer:
+    """長いカルテを期間ごとのチャンクに分けて要約し、それらをまとめて退院時サマリを生成する
+
+    各チャンクは高速なモデル（map_model）で、診療科のプロンプトに期間の経過要約のみを出力する指示を加えて並列に要約し、
+    期間の見出しをつけて連結したものを選択されたモデルでもう一度要約する。
+    laneを指定した場合は、同時に送る2件目以降のチャンクにプロバイダの空きワーカーを使い、
+    プロバイダごとの同時生成数（GENERATION_WORKERS）を超えないようにする
+    """
+
+    def __init__(self, router=None, map_model=MAP_REDUCE_MAP_MODEL, chunk_size=MAP_REDUCE_CHUNK_SIZE,
+                 concurrency=MAP_REDUCE_CONCURRENCY, threshold=MAP_REDUCE_THRESHOLD, enabled=MAP_REDUCE_ENABLED,
+                 lane=None):
+        self.router = router or SummaryRouter()
+        self.lane = lane
+        self.map_model = map_model
+        self.chunk_size = chunk_size
+        self.concurrency = max(1, concurrency)
+        self.threshold = threshold
+        self.enabled = enabled
+
+    def split(self, input_text):
+        """分割して要約する場合はチャンクのリスト、1回で要約する場合はNoneを返す"""
+        if not self.enabled or len(input_text) <= self.threshold:
+            return None
+        chunks = split_karte(input_text, self.chunk_size)
+        return chunks if len(chunks) > 1 else None
+
+    def get_map_model(self, selected_model):
+        """map_modelが利用できない、または停止中の場合は選択されたモデルで要約する"""
+        if self.map_model and self.router.registry.is_model_available(self.map_model) \
+                and self.router.is_circuit_available(self.map_model):
+            return self.map_model
+        return selected_model
+
+    def borrow_workers(self, count):
+        return self.lane.borrow_workers(count) if self.lane else contextlib.nullcontext(count)
+
+    async def generate_async(self, selected_model, chunks, selected_department, additional_info="", on_chunk=None):
+        map_model = self.get_map_model(selected_model)
+
+        # 実行中のチケットのワーカーに加えて、確保できた空きワーカーの数だけ同時に要約する
+        with self.borrow_workers(min(self.concurrency, len(chunks)) - 1) as extra_workers:
+            semaphore = asyncio.Semaphore(1 + extra_workers)
+
+            async def summarize_chunk(chunk):
+                async with semaphore:
+                    return await self.router.generate_async(map_model, chunk["text"], selected_department,
+                                                            section=MAP_SECTION)
+
+            # いずれかのチャンクが失敗した場合は残りをキャンセルし、最初のエラーを返す
+            try:
+                async with asyncio.TaskGroup() as group:
+                    tasks = [group.create_task(summarize_chunk(chunk)) for chunk in chunks]
+            except ExceptionGroup as e:
+                raise e.exceptions[0]
+        map_outcomes = [task.result() for task in tasks]
+
+        reduce_input = create_reduce_input(chunks, [outcome["discharge_summary"] for outcome in map_outcomes])
+        reduce_outcome = await self.router.generate_async(selected_model, reduce_input, selected_department,
+                                                          additional_info, on_chunk)
+        return combine_outcomes(map_outcomes, reduce_outcome)
@@ -0,0 +1,144 @@
+import asyncio
+import threading
+import time
+from collections import deque
+
+from utils.config import RATE_LIMIT_RPM, RATE_LIMIT_TPM
+
+# 先頭以外の待機者が順番を確認する間隔（秒）
+WAITER_POLL_INTERVAL = 0.05
+
+
+class TokenBucket:
+    """1分あたりの上限を、毎秒limit/60ずつ補充されるバケットとして管理する"""
+
+    def __init__(self, limit_per_minute):
+        self.capacity = limit_per_minute
+        self.rate = limit_per_minute / 60
+        self.tokens = float(limit_per_minute)
+        self.updated_at = time.monotonic()
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def get_wait(self, amount, now):
+        """amountを消費できるまでの秒数。上限を超える量は上限まで貯まれば消費できるものとする"""
+        self.refill(now)
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount):
+        self.tokens -= amount
+
+    def adjust(self, amount):
+        """見積もりとの差分を反映する。不足分は残量がマイナスとなり、以降の待ち時間に反映される"""
+        self.tokens = min(self.capacity, self.tokens - amount)
+
+
+class RateLimiter:
+    """モデルごとにリクエスト数/分(RPM)とトークン数/分(TPM)を制限する、プロセス全体で共有のレートリミッタ
+
+    上限に達した場合はエラーにせず、到着順に空きが出るまで待機させる。
+    トークン数は送信前に見積もりで確保し、応答後に実際の使用量との差分を反映する
+    """
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = RateLimiter()
+        return cls._instance
+
+    def __init__(self, default_rpm=RATE_LIMIT_RPM, default_tpm=RATE_LIMIT_TPM):
+        self.default_rpm = default_rpm
+        self.default_tpm = default_tpm
+        self._buckets = {}
+        self._waiters = {}
+        self._lock = threading.Lock()
+
+    def get_limits(self, model):
+        """モデル定義のrpm・tpm、未指定の場合は既定値。0は無制限"""
+        return model.get("rpm", self.default_rpm) or 0, model.get("tpm", self.default_tpm) or 0
+
+    def get_buckets(self, model):
+        key = model["model"]
+        buckets = self._buckets.get(key)
+        if buckets is None:
+            rpm, tpm = self.get_limits(model)
+            buckets = {
+                "requests": TokenBucket(rpm) if rpm else None,
+                "tokens": TokenBucket(tpm) if tpm else None,
+            }
+            self._buckets[key] = buckets
+            self._waiters[key] = deque()
+        return buckets
+
+    def is_limited(self, model):
+        rpm, tpm = self.get_limits(model)
+        return bool(rpm or tpm)
+
+    def try_acquire(self, model, tokens, waiter):
+        """確保できた場合は0、できなかった場合は次に確認するまでの秒数を返す"""
+        now = time.monotonic()
+        with self._lock:
+            buckets = self.get_buckets(model)
+            waiters = self._waiters[model["model"]]
+            if waiters[0] is not waiter:
+                return WAITER_POLL_INTERVAL
+
+            wait = 0.0
+            if buckets["requests"]:
+                wait = max(wait, buckets["requests"].get_wait(1, now))
+            if buckets["tokens"]:
+                wait = max(wait, buckets["tokens"].get_wait(tokens, now))
+            if wait > 0:
+                return wait
+
+            if buckets["requests"]:
+                buckets["requests"].consume(1)
+            if buckets["tokens"]:
+                buckets["tokens"].consume(tokens)
+            waiters.popleft()
+            return 0.0
+
+    def add_waiter(self, model):
+        waiter = object()
+        with self._lock:
+            self.get_buckets(model)
+            self._waiters[model["model"]].append(waiter)
+        return waiter
+
+    def remove_waiter(self, model, waiter):
+        with self._lock:
+            waiters = self._waiters[model["model"]]
+            if waiter in waiters:
+                waiters.remove(waiter)
+
+    async def acquire_async(self, model, tokens):
+        """1リクエストとtokens分のトークンを確保するまで待機する"""
+        if not self.is_limited(model):
+            return
+        waiter = self.add_waiter(model)
+        try:
+            while True:
+                wait = self.try_acquire(model, tokens, waiter)
+                if wait == 0:
+                    return
+                await asyncio.sleep(wait)
+        finally:
+            self.remove_waiter(model, waiter)
+
+    def record_usage(self, model, estimated_tokens, actual_tokens):
+        """送信前に見積もったトークン数と実際の使用量の差分を反映する"""
+        if not self.is_limited(model):
+            return
+        with self._lock:
+            buckets = self.get_buckets(model)
+            if buckets["tokens"]:
+                buckets["tokens"].adjust(actual_tokens - estimated_tokens)
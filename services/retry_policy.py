@@ -0,0 +1,165 @@
+import asyncio
+import datetime
+import email.utils
+import random
+import re
+import time
+
+import anthropic
+import httpx
+import openai
+from google.genai import errors as genai_errors
+
+from utils.config import get_retry_settings
+
+# 一時的な障害として再試行するHTTPステータス
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504, 529}
+
+# 再試行しても解消しないエラー（クォータ超過など）
+NON_RETRYABLE_MESSAGES = ("insufficient_quota", "exceeded your current quota")
+
+CONNECTION_ERRORS = (anthropic.APIConnectionError, openai.APIConnectionError, httpx.TransportError)
+
+
+def iter_error_chain(error):
+    """APIErrorに包まれた元の例外までたどる"""
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        yield error
+        error = error.__cause__ or error.__context__
+
+
+def get_status_code(error):
+    status_code = getattr(error, "status_code", None)
+    if isinstance(status_code, int):
+        return status_code
+    if isinstance(error, genai_errors.APIError) and isinstance(error.code, int):
+        return error.code
+    return None
+
+
+def parse_duration(value):
+    """"1.5"、"500ms"、"6m0s"のような秒数・期間表記を秒に変換する"""
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+
+    parts = re.findall(r"(\d+(?:\.\d+)?)(ms|h|m|s)", value)
+    if not parts or "".join(number + unit for number, unit in parts) != value:
+        return None
+    units = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+    return sum(float(number) * units[unit] for number, unit in parts)
+
+
+def parse_retry_after(headers, now=None):
+    """レスポンスヘッダから次に送信できるまでの秒数を返す。指定がなければNone"""
+    if not headers:
+        return None
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+
+    value = headers.get("retry-after")
+    if value:
+        seconds = parse_duration(value)
+        if seconds is not None:
+            return seconds
+        try:
+            retry_at = email.utils.parsedate_to_datetime(value)
+            return max(0.0, (retry_at - now).total_seconds())
+        except (TypeError, ValueError):
+            pass
+
+    # OpenAIは"6m0s"形式、Anthropicは日時形式で制限が解除される時刻を返す
+    delays = []
+    for name in ("x-ratelimit-reset-requests", "x-ratelimit-reset-tokens"):
+        if headers.get(name):
+            seconds = parse_duration(headers[name])
+            if seconds is not None:
+                delays.append(seconds)
+    for name in ("anthropic-ratelimit-requests-reset", "anthropic-ratelimit-tokens-reset"):
+        if headers.get(name):
+            try:
+                reset_at = datetime.datetime.fromisoformat(headers[name].replace("Z", "+00:00"))
+                delays.append(max(0.0, (reset_at - now).total_seconds()))
+            except ValueError:
+                pass
+    return max(delays) if delays else None
+
+
+def get_retry_info(error):
+    """(再試行するか, 待機秒数の指定)を返す"""
+    if any(message in str(error) for message in NON_RETRYABLE_MESSAGES):
+        return False, None
+
+    for cause in iter_error_chain(error):
+        if isinstance(cause, CONNECTION_ERRORS):
+            return True, None
+
+        status_code = get_status_code(cause)
+        if status_code is not None:
+            if status_code not in RETRYABLE_STATUS_CODES:
+                return False, None
+            response = getattr(cause, "response", None)
+            return True, parse_retry_after(getattr(response, "headers", None))
+
+    return False, None
+
+
+class RetryPolicy:
+    """指数バックオフとフルジッターで再試行する。Retry-Afterなどの指定があればその時間以上待機する
+
+    deadline秒を超えて待機することになる場合は再試行せずにエラーとする
+    """
+
+    def __init__(self, max_attempts=3, base_delay=1.0, max_delay=30.0, deadline=120.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+
+    @classmethod
+    def for_provider(cls, provider_name):
+        return cls(**get_retry_settings(provider_name))
+
+    def get_delay(self, retry_number, retry_after=None):
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** retry_number)))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    def get_next_delay(self, error, retries, start_time, can_retry=None):
+        """次の再試行までの待機秒数を返す。再試行しない場合はNone"""
+        if retries + 1 >= self.max_attempts or (can_retry and not can_retry()):
+            return None
+
+        retryable, retry_after = get_retry_info(error)
+        if not retryable:
+            return None
+
+        delay = self.get_delay(retries, retry_after)
+        if time.monotonic() - start_time + delay > self.deadline:
+            return None
+        return delay
+
+    async def call_async(self, func, *args, can_retry=None):
+        """funcを実行し、(結果, 再試行回数)を返す"""
+        start_time = time.monotonic()
+        retries = 0
+        while True:
+            try:
+                return await func(*args), retries
+            except Exception as e:
+                delay = self.get_next_delay(e, retries, start_time, can_retry)
+                if delay is None:
+                    raise
+            await asyncio.sleep(delay)
+            retries += 1
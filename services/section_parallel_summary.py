@@ -0,0 +1,96 @@
+import asyncio
+import contextlib
+
+from services.summary_router import SummaryRouter, combine_cache_usage, combine_models, create_model_usage
+from utils.config import SECTION_PARALLEL_CONCURRENCY, SECTION_PARALLEL_ENABLED, SECTION_PARALLEL_WARMUP
+from utils.constants import DEFAULT_SECTION_NAMES
+
+
+def extract_section_content(section, text):
+    """項目ごとの応答から先頭の「項目名:」を除いた本文を返す"""
+    text = text.strip()
+    for prefix in (f"{section}:", f"{section}：", section):
+        if text.startswith(prefix):
+            return text[len(prefix):].strip()
+    return text
+
+
+def format_section(section, content):
+    return f"{section}:{content}"
+
+
+def combine_section_outcomes(sections, outcomes):
+    """項目の順に本文を連結し、トークン数・キャッシュの利用量・再試行回数は全リクエストの合計とする
+
+    フェイルオーバーなどで項目ごとに異なるモデルが使われた場合は、使用したすべてのモデルとモデルごとの内訳を記録する
+    """
+    return {
+        **outcomes[0],
+        "model_name": combine_models(outcomes, "model_name"),
+        "model_detail": combine_models(outcomes, "model_detail"),
+        "discharge_summary": "\n".join(
+            format_section(section, extract_section_content(section, outcome["discharge_summary"]))
+            for section, outcome in zip(sections, outcomes)
+        ),
+        "input_tokens": sum(outcome["input_tokens"] for outcome in outcomes),
+        "output_tokens": sum(outcome["output_tokens"] for outcome in outcomes),
+        "cache_usage": combine_cache_usage(outcomes),
+        "model_usage": create_model_usage(outcomes),
+        "failover": any(outcome["failover"] for outcome in outcomes),
+        "retry_count": sum(outcome["retry_count"] for outcome in outcomes),
+        "section_count": len(outcomes),
+    }
+
+
+class SectionParallelSummarizer:
+    """退院時サマリの項目ごとに同時にリクエストを送り、結果を項目の順に組み立てる
+
+    各リクエストはプロンプトテンプレートとカルテ情報が共通で、最後の項目の指示のみが異なるため、
+    プロバイダのプロンプトキャッシュでカルテ情報までを共有できる。
+    キャッシュは最初の応答後に利用可能となるため、warmupが有効な場合は最初の項目（入院期間など出力が短いもの）を
+    先に生成してから残りの項目を同時に送信する。
+    laneを指定した場合は、同時に送る2件目以降のリクエストにプロバイダの空きワーカーを使い、
+    プロバイダごとの同時生成数（GENERATION_WORKERS）を超えないようにする
+    """
+
+    def __init__(self, router=None, sections=None, concurrency=SECTION_PARALLEL_CONCURRENCY,
+                 enabled=SECTION_PARALLEL_ENABLED, warmup=SECTION_PARALLEL_WARMUP, lane=None):
+        self.router = router or SummaryRouter()
+        self.lane = lane
+        self.sections = list(sections or DEFAULT_SECTION_NAMES)
+        self.concurrency = max(1, concurrency or len(self.sections))
+        self.enabled = enabled
+        self.warmup = warmup
+
+    def borrow_workers(self, count):
+        return self.lane.borrow_workers(count) if self.lane else contextlib.nullcontext(count)
+
+    async def generate_async(self, selected_model, input_text, selected_department, additional_info="",
+                             on_chunk=None):
+        async def generate_section(section, semaphore):
+            async with semaphore:
+                outcome = await self.router.generate_async(selected_model, input_text, selected_department,
+                                                           additional_info, section=section)
+            # 完了した項目から途中結果として表示する
+            if on_chunk:
+                on_chunk(format_section(section, extract_section_content(section, outcome["discharge_summary"]))
+                         + "\n")
+            return outcome
+
+        outcomes = []
+        sections = self.sections
+        if self.warmup:
+            outcomes.append(await generate_section(sections[0], asyncio.Semaphore(1)))
+            sections = sections[1:]
+
+        # 実行中のチケットのワーカーに加えて、確保できた空きワーカーの数だけ同時に送信する
+        with self.borrow_workers(min(self.concurrency, len(sections)) - 1) as extra_workers:
+            semaphore = asyncio.Semaphore(1 + extra_workers)
+            # いずれかの項目が失敗した場合は残りをキャンセルし、最初のエラーを返す
+            try:
+                async with asyncio.TaskGroup() as group:
+                    tasks = [group.create_task(generate_section(section, semaphore)) for section in sections]
+            except ExceptionGroup as e:
+                raise e.exceptions[0]
+        outcomes.extend(task.result() for task in tasks)
+        return combine_section_outcomes(self.sections, outcomes)
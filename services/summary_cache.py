@@ -0,0 +1,111 @@
+import datetime
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+from pymongo.errors import OperationFailure
+
+from utils.config import SUMMARY_CACHE_SIZE, SUMMARY_CACHE_MONGODB, SUMMARY_CACHE_TTL
+from utils.db import ensure_ttl_index, get_summary_cache_collection
+
+# キャッシュに保存する生成結果の項目
+CACHED_FIELDS = ("discharge_summary", "parsed_summary", "input_tokens", "output_tokens", "model_detail")
+
+
+def build_cache_key(prompt_template, department, model_id, input_text, additional_info=""):
+    """プロンプト本文・診療科・APIのモデルID・入力内容から生成結果のキャッシュキーを作成
+
+    表示名ではなくモデルIDを使い、環境変数でモデルを切り替えた場合に以前のモデルの結果を返さないようにする
+    """
+    prompt_version = hashlib.sha256(prompt_template.encode("utf-8")).hexdigest()
+    payload = json.dumps(
+        [prompt_version, department, model_id, input_text, additional_info or ""],
+        ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class SummaryCache:
+    """生成結果のキャッシュ。メモリ上のLRUと、オプションでMongoDB(TTL付き)の2層で保持する"""
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = SummaryCache()
+        return cls._instance
+
+    def __init__(self, max_entries=SUMMARY_CACHE_SIZE, use_mongodb=SUMMARY_CACHE_MONGODB, ttl=SUMMARY_CACHE_TTL):
+        self.max_entries = max_entries
+        self.use_mongodb = use_mongodb
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._index_ready = False
+
+    def get(self, key):
+        result = self.get_from_memory(key)
+        if result is None and self.use_mongodb:
+            result = self.get_from_mongodb(key)
+            if result is not None:
+                self.set_to_memory(key, result)
+        return result
+
+    def set(self, key, result):
+        entry = {field: result[field] for field in CACHED_FIELDS if field in result}
+        self.set_to_memory(key, entry)
+        if self.use_mongodb:
+            self.set_to_mongodb(key, entry)
+
+    def get_from_memory(self, key):
+        with self._lock:
+            result = self._entries.get(key)
+            if result is not None:
+                self._entries.move_to_end(key)
+            return result
+
+    def set_to_memory(self, key, entry):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_from_mongodb(self, key):
+        try:
+            document = self.get_collection().find_one({"_id": key}, {"result": True})
+        except Exception as e:
+            print(f"生成結果キャッシュの取得に失敗しました: {str(e)}")
+            return None
+        return document["result"] if document else None
+
+    def set_to_mongodb(self, key, entry):
+        try:
+            self.get_collection().replace_one(
+                {"_id": key},
+                {"_id": key, "result": entry, "created_at": datetime.datetime.now(datetime.timezone.utc)},
+                upsert=True
+            )
+        except Exception as e:
+            print(f"生成結果キャッシュの保存に失敗しました: {str(e)}")
+
+    def get_collection(self):
+        collection = get_summary_cache_collection()
+        if not self._index_ready:
+            # created_atから一定時間経過したキャッシュをMongoDBに自動削除させる。保持期間を変更した場合も反映する
+            try:
+                ensure_ttl_index(collection, "created_at", self.ttl)
+            except OperationFailure as e:
+                print(f"生成結果キャッシュのTTLインデックスの設定に失敗しました: {str(e)}")
+            self._index_ready = True
+        return collection
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,370 @@
+import asyncio
+import math
+import threading
+import time
+from collections import deque
+
+from external_service.prompt_builder import create_discharge_summary_prompt
+from external_service.provider_registry import ProviderRegistry
+from services.circuit_breaker import CircuitBreakerRegistry, is_provider_failure
+from services.rate_limiter import RateLimiter
+from services.retry_policy import RetryPolicy
+from services.token_estimator import TokenEstimator
+from utils.config import FAILOVER_MODELS, FAILOVER_TIMEOUT, HEDGE_ENABLED, HEDGE_DEFAULT_DELAY, HEDGE_MIN_SAMPLES
+from utils.constants import MESSAGES
+from utils.exceptions import APIError
+
+
+def convert_api_error(provider, error):
+    error_str = str(error)
+    if provider.name == "openai" and (
+            "insufficient_quota" in error_str or "exceeded your current quota" in error_str):
+        return APIError("OpenAI APIのクォータを超過しています。請求情報を確認するか、管理者に連絡してください。")
+    return error
+
+
+def parse_usage_event(event):
+    """usageイベントからトークン数と、キャッシュ利用量などプロバイダ固有の内訳を取り出す"""
+    details = {key: value for key, value in event.items()
+               if key not in ("type", "input_tokens", "output_tokens")}
+    return event["input_tokens"], event["output_tokens"], details
+
+
+async def consume_summary_stream_async(stream, on_chunk):
+    """非同期ストリーミングイベントを消費し、差分をon_chunkへ渡して全文とトークン数を返す"""
+    chunks = []
+    input_tokens = 0
+    output_tokens = 0
+    cache_usage = {}
+
+    async for event in stream:
+        if event["type"] == "delta":
+            chunks.append(event["text"])
+            on_chunk(event["text"])
+        elif event["type"] == "usage":
+            input_tokens, output_tokens, cache_usage = parse_usage_event(event)
+
+    return "".join(chunks), input_tokens, output_tokens, cache_usage
+
+
+def estimate_request_tokens(provider_name, input_text, additional_info="", selected_department="default"):
+    """送信するプロンプト全体の入力トークン数の見積もり"""
+    prompt = create_discharge_summary_prompt(input_text, additional_info, selected_department)
+    return TokenEstimator.get_instance().estimate(prompt, provider_name)
+
+
+def combine_models(outcomes, key):
+    """複数のリクエストで使用したモデルを、重複を除いて順に「 / 」で区切って連結する"""
+    return " / ".join(dict.fromkeys(outcome[key] for outcome in outcomes))
+
+
+def combine_cache_usage(outcomes):
+    cache_usage = {}
+    for outcome in outcomes:
+        for key, value in outcome["cache_usage"].items():
+            cache_usage[key] = cache_usage.get(key, 0) + (value or 0)
+    return cache_usage
+
+
+def create_model_usage(outcomes):
+    """モデルごとのリクエスト数とトークン数の内訳"""
+    model_usage = {}
+    for outcome in outcomes:
+        usage = model_usage.setdefault(outcome["model_detail"], {
+            "model_detail": outcome["model_detail"], "requests": 0, "input_tokens": 0, "output_tokens": 0
+        })
+        usage["requests"] += 1
+        usage["input_tokens"] += outcome["input_tokens"]
+        usage["output_tokens"] += outcome["output_tokens"]
+    return list(model_usage.values())
+
+
+class LatencyTracker:
+    """モデルごとの直近の応答時間を保持し、パーセンタイル値を返す"""
+
+    def __init__(self, window=200):
+        self.window = window
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, key, seconds):
+        with self._lock:
+            self._samples.setdefault(key, deque(maxlen=self.window)).append(seconds)
+
+    def get_percentile(self, key, percentile=95, min_samples=1):
+        with self._lock:
+            samples = sorted(self._samples.get(key, ()))
+        if len(samples) < max(min_samples, 1):
+            return None
+        index = min(len(samples) - 1, math.ceil(len(samples) * percentile / 100) - 1)
+        return samples[index]
+
+
+_latency_tracker = LatencyTracker()
+
+
+class SummaryAttempt:
+    """1つのモデルへの生成リクエスト。ストリーミングでは最初のイベントを受け取った時点を開始完了とする"""
+
+    def __init__(self, model_name, provider, model):
+        self.model_name = model_name
+        self.provider = provider
+        self.model = model
+        self.stream = None
+        self.first_event = None
+        self.result = None
+        self.retries = 0
+        self.started_at = None
+        # 最初の送信後、再試行の前にレート制限で待機した時間の合計
+        self.limiter_wait = 0.0
+        self.estimated_tokens = 0
+
+    def get_elapsed(self):
+        """最初の送信からの経過時間。レート制限の待ち時間は含めない"""
+        return time.monotonic() - self.started_at - self.limiter_wait
+
+    async def close(self):
+        if self.stream is not None:
+            try:
+                await self.stream.aclose()
+            except Exception:
+                pass
+
+
+async def prepend_event(first_event, stream):
+    if first_event is not None:
+        yield first_event
+    async for event in stream:
+        yield event
+
+
+class SummaryRouter:
+    """選択されたモデルで失敗・タイムアウトした場合に、設定された順に別のモデルへ切り替えてサマリを生成する
+
+    ヘッジが有効な場合は、選択されたモデルの応答がp95の応答時間を超えても始まらなければ
+    次のモデルにも同じリクエストを送り、先に応答したほうを採用して他方をキャンセルする
+    """
+
+    def __init__(self, registry=None, failover_models=None, attempt_timeout=FAILOVER_TIMEOUT,
+                 hedge_enabled=HEDGE_ENABLED, hedge_delay=HEDGE_DEFAULT_DELAY, hedge_min_samples=HEDGE_MIN_SAMPLES,
+                 latency_tracker=None, retry_policy_factory=RetryPolicy.for_provider, rate_limiter=None,
+                 circuit_breakers=None, token_estimator=None):
+        self.registry = registry or ProviderRegistry.get_instance()
+        self.failover_models = FAILOVER_MODELS if failover_models is None else failover_models
+        self.attempt_timeout = attempt_timeout
+        self.hedge_enabled = hedge_enabled
+        self.hedge_delay = hedge_delay
+        self.hedge_min_samples = hedge_min_samples
+        self.latency_tracker = latency_tracker or _latency_tracker
+        self.retry_policy_factory = retry_policy_factory
+        self.rate_limiter = rate_limiter or RateLimiter.get_instance()
+        self.circuit_breakers = circuit_breakers or CircuitBreakerRegistry.get_instance()
+        self.token_estimator = token_estimator or TokenEstimator.get_instance()
+
+    def get_candidates(self, selected_model):
+        """選択されたモデルを先頭に、切り替え先として利用可能なモデルを順に返す"""
+        candidates = [selected_model]
+        for model_name in self.failover_models:
+            if model_name not in candidates and self.registry.is_model_available(model_name) \
+                    and self.is_circuit_available(model_name):
+                candidates.append(model_name)
+        return candidates
+
+    def is_circuit_available(self, model_name):
+        return self.circuit_breakers.is_available(self.registry.get_provider_name(model_name))
+
+    def has_available_candidate(self, selected_model):
+        """選択されたモデル、または切り替え先のいずれかのプロバイダが停止中でないか"""
+        return any(self.is_circuit_available(model_name) for model_name in self.get_candidates(selected_model))
+
+    def check_circuit(self, provider):
+        if not self.circuit_breakers.get(provider.name).allow_request():
+            raise APIError(MESSAGES["PROVIDER_UNAVAILABLE"])
+
+    def record_circuit_result(self, provider, error=None):
+        breaker = self.circuit_breakers.get(provider.name)
+        if error is None:
+            breaker.record_success()
+        elif is_provider_failure(error):
+            breaker.record_failure()
+        else:
+            breaker.record_cancel()
+
+    def estimate_tokens(self, model, input_text, additional_info="", selected_department="default"):
+        """入力トークン数を見積もる。レート制限・出力トークン数の上限のほか、実測値による補正にも使うため常に見積もる"""
+        return estimate_request_tokens(model["provider"], input_text, additional_info, selected_department)
+
+    def get_generation_kwargs(self, model, estimated_tokens, section=None):
+        kwargs = {}
+        max_tokens = self.token_estimator.choose_max_tokens(model, estimated_tokens)
+        if max_tokens:
+            kwargs["max_tokens"] = max_tokens
+        if section:
+            kwargs["section"] = section
+        return kwargs
+
+    def record_usage(self, model, estimated_tokens, output, seconds):
+        """実際の使用量をレート制限とトークン数の見積もりに反映する"""
+        _, input_tokens, output_tokens, _ = output
+        self.rate_limiter.record_usage(model, estimated_tokens, input_tokens + output_tokens)
+        self.token_estimator.record_actual(model["provider"], estimated_tokens, input_tokens)
+        self.token_estimator.record_output(model["model"], output_tokens, seconds)
+
+    def get_hedge_delay(self, model_name, streaming):
+        p95 = self.latency_tracker.get_percentile(
+            (model_name, streaming), percentile=95, min_samples=self.hedge_min_samples
+        )
+        return self.hedge_delay if p95 is None else p95
+
+    async def generate_async(self, selected_model, input_text, selected_department, additional_info="",
+                             on_chunk=None, section=None):
+        """サマリを生成する。sectionを指定した場合は、退院時サマリのその項目のみを生成する"""
+        streaming = bool(on_chunk)
+        candidates = self.get_candidates(selected_model)
+        args = (input_text, additional_info, selected_department)
+
+        attempt = await self.start_first_attempt(candidates, args, streaming, section)
+
+        try:
+            if streaming:
+                output = await consume_summary_stream_async(
+                    prepend_event(attempt.first_event, attempt.stream), on_chunk
+                )
+            else:
+                output = attempt.result
+        except Exception as e:
+            raise convert_api_error(attempt.provider, e)
+
+        self.record_usage(attempt.model, attempt.estimated_tokens, output, attempt.get_elapsed())
+        return self.create_outcome(attempt.model_name, attempt.model, output, selected_model, attempt.retries)
+
+    async def start_first_attempt(self, candidates, args, streaming, section=None):
+        """候補のモデルに順にリクエストを送り、最初に応答を開始したものを返す"""
+        pending = {}
+        errors = []
+        next_index = 0
+        hedged = False
+
+        def launch():
+            nonlocal next_index
+            model_name = candidates[next_index]
+            next_index += 1
+            acquired = asyncio.Event()
+            task = asyncio.create_task(self.start_attempt(model_name, args, streaming, section, acquired))
+            pending[task] = (model_name, acquired)
+
+        try:
+            while pending or next_index < len(candidates):
+                if not pending:
+                    launch()
+
+                timeout = None
+                if self.hedge_enabled and not hedged and next_index < len(candidates) and len(pending) == 1:
+                    task, (model_name, acquired) = next(iter(pending.items()))
+                    if not acquired.is_set() and not task.done():
+                        # レート制限の待ち時間はヘッジまでの待ち時間に含めない
+                        acquired_task = asyncio.create_task(acquired.wait())
+                        await asyncio.wait({task, acquired_task}, return_when=asyncio.FIRST_COMPLETED)
+                        acquired_task.cancel()
+                        continue
+                    timeout = self.get_hedge_delay(model_name, streaming)
+
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedged = True
+                    launch()
+                    continue
+
+                winner = None
+                for task in done:
+                    pending.pop(task)
+                    if task.exception() is not None:
+                        errors.append(task.exception())
+                    elif winner is None:
+                        winner = task.result()
+                    else:
+                        await task.result().close()
+
+                if winner is not None:
+                    return winner
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+
+        raise errors[0]
+
+    async def start_attempt(self, model_name, args, streaming, section=None, acquired=None):
+        """1つのモデルへのリクエストを開始する
+
+        レート制限の待ち時間は、attempt_timeoutと応答時間（ヘッジまでの待ち時間）のいずれにも含めない。
+        最初の送信枠を確保した時点でacquiredを設定する
+        """
+        provider, model = self.registry.resolve(model_name)
+        attempt = SummaryAttempt(model_name, provider, model)
+        # プロンプトの取得とトークン数の計算はイベントループを止めないよう別スレッドで行う
+        attempt.estimated_tokens = await asyncio.to_thread(self.estimate_tokens, model, *args)
+        kwargs = self.get_generation_kwargs(model, attempt.estimated_tokens, section)
+
+        # 送信枠の確保を待つ間はサーキットブレーカーの試行枠を占有しない
+        await self.rate_limiter.acquire_async(model, attempt.estimated_tokens)
+        self.check_circuit(provider)
+        attempt.started_at = time.monotonic()
+        if acquired is not None:
+            acquired.set()
+        first_send = True
+
+        async def send():
+            if streaming:
+                attempt.stream = provider.stream_async(model["model"], *args, **kwargs)
+                attempt.first_event = await anext(attempt.stream, None)
+            else:
+                attempt.result = await provider.generate_async(model["model"], *args, **kwargs)
+
+        async def start():
+            nonlocal first_send
+            if not first_send:
+                wait_started = time.monotonic()
+                await self.rate_limiter.acquire_async(model, attempt.estimated_tokens)
+                attempt.limiter_wait += time.monotonic() - wait_started
+            first_send = False
+            if self.attempt_timeout > 0:
+                remaining = self.attempt_timeout - attempt.get_elapsed()
+                await asyncio.wait_for(send(), timeout=max(0.0, remaining))
+            else:
+                await send()
+
+        try:
+            _, attempt.retries = await self.retry_policy_factory(provider.name).call_async(start)
+        except asyncio.TimeoutError as e:
+            await attempt.close()
+            self.record_circuit_result(provider, e)
+            raise APIError(f"{model_name}の応答が{self.attempt_timeout:g}秒以内に始まりませんでした")
+        except asyncio.CancelledError:
+            await attempt.close()
+            self.record_circuit_result(provider, asyncio.CancelledError())
+            raise
+        except Exception as e:
+            await attempt.close()
+            self.record_circuit_result(provider, e)
+            raise convert_api_error(provider, e)
+
+        self.record_circuit_result(provider)
+
+        self.latency_tracker.record((model_name, streaming), attempt.get_elapsed())
+        return attempt
+
+    @staticmethod
+    def create_outcome(model_name, model, output, selected_model, retries=0):
+        discharge_summary, input_tokens, output_tokens, cache_usage = output
+        return {
+            "discharge_summary": discharge_summary,
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "cache_usage": cache_usage,
+            "model_name": model_name,
+            "model_detail": model["model_detail"],
+            "failover": model_name != selected_model,
+            "retry_count": retries
+        }
@@ -1,81 +1,187 @@
+import asyncio
 import datetime
-import threading
 import time
-import queue
+
 import pytz
 import flet as ft
 
-from external_service.claude_api import claude_generate_discharge_summary
-from external_service.gemini_api import gemini_generate_discharge_summary
-from external_service.openai_api import openai_generate_discharge_summary
+from external_service.prompt_builder import create_discharge_summary_prompt
+from external_service.provider_registry import ProviderRegistry
+from services.generation_scheduler import GenerationScheduler
+from services.map_reduce_summary import MapReduceSummarizer
+from services.section_parallel_summary import SectionParallelSummarizer
+from services.summary_cache import SummaryCache, build_cache_key
+from services.summary_router import SummaryRouter
+from services.token_estimator import TokenEstimator
+from services.usage_rollup import record_usage_rollup
 from utils.constants import APP_TYPE, DOCUMENT_NAME, MESSAGES
 from utils.error_handlers import handle_error
 from utils.exceptions import APIError
-from utils.text_processor import format_discharge_summary, parse_discharge_summary
+from utils.karte_dedup import KarteDeduplicator
+from utils.text_processor import SummaryStreamParser, format_discharge_summary, parse_discharge_summary
 from utils.db import get_usage_collection
-from utils.config import GEMINI_CREDENTIALS, CLAUDE_API_KEY, OPENAI_API_KEY, GEMINI_MODEL, GEMINI_FLASH_MODEL, \
-    OPENAI_MODEL, MAX_INPUT_TOKENS, MIN_INPUT_TOKENS
+from utils.prompt_manager import get_prompt_template
+from utils.config import KARTE_DEDUP_DISABLED_DEPARTMENTS, KARTE_DEDUP_ENABLED, MAX_INPUT_TOKENS, MIN_INPUT_TOKENS, \
+    STREAMING_ENABLED, STREAMING_UPDATE_INTERVAL, SUMMARY_CACHE_ENABLED
 
 JST = pytz.timezone('Asia/Tokyo')
 
 
-def generate_summary_task(input_text, selected_department, selected_model, result_queue, additional_info=""):
+def resolve_summary_model(selected_model):
+    """選択されたモデルの定義を返す。利用できない場合はAPIError"""
+    _, model = ProviderRegistry.get_instance().resolve(selected_model)
+    return model
+
+
+def create_summary_result(discharge_summary, input_tokens, output_tokens, model_detail, cache_usage=None,
+                          failover=False, retry_count=0):
+    discharge_summary = format_discharge_summary(discharge_summary)
+    parsed_summary = parse_discharge_summary(discharge_summary)
+
+    return {
+        "success": True,
+        "discharge_summary": discharge_summary,
+        "parsed_summary": parsed_summary,
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens,
+        "model_detail": model_detail,
+        "cache_usage": cache_usage or {},
+        "failover": failover,
+        "retry_count": retry_count
+    }
+
+
+def get_summary_cache_key(input_text, selected_department, model_id, additional_info=""):
+    if not SUMMARY_CACHE_ENABLED:
+        return None
+    prompt_template = get_prompt_template(selected_department)
+    return build_cache_key(prompt_template, selected_department, model_id, input_text, additional_info)
+
+
+def create_cache_hit_result(cached_result):
+    """キャッシュから返す結果。APIを呼び出していないためトークン数は0として扱う"""
+    result = dict(cached_result)
+    result["parsed_summary"] = dict(cached_result.get("parsed_summary", {}))
+    result.update({
+        "success": True,
+        "input_tokens": 0,
+        "output_tokens": 0,
+        "cache_hit": True
+    })
+    result.pop("dedup_usage", None)
+    return result
+
+
+def deduplicate_input(input_text, selected_department, provider_name):
+    """前日までの記載のコピーを省略したカルテと、削減量（文字数・バイト数・段落数・トークン数）を返す"""
+    if not KARTE_DEDUP_ENABLED or selected_department in KARTE_DEDUP_DISABLED_DEPARTMENTS:
+        return input_text, {}
+
+    deduplicated, stats = KarteDeduplicator().deduplicate(input_text)
+    if not stats["removed_paragraphs"]:
+        return input_text, {}
+
+    estimator = TokenEstimator.get_instance()
+    removed_tokens = estimator.estimate(input_text, provider_name) - estimator.estimate(deduplicated, provider_name)
+    dedup_usage = {
+        "dedup_removed_chars": stats["removed_chars"],
+        "dedup_removed_bytes": stats["removed_bytes"],
+        "dedup_removed_paragraphs": stats["removed_paragraphs"],
+        "dedup_removed_tokens": removed_tokens,
+    }
+    return deduplicated, dedup_usage
+
+
+async def find_cached_summary(input_text, selected_department, selected_model, additional_info=""):
+    """(キャッシュキー, キャッシュされた結果)を返す。キャッシュが無効な場合はキーがNone、ない場合は結果がNone"""
+    model = resolve_summary_model(selected_model)
+    # プロンプトの取得はMongoDBを参照することがあるため、イベントループの外で行う
+    cache_key = await asyncio.to_thread(get_summary_cache_key, input_text, selected_department, model["model"],
+                                        additional_info)
+    if not cache_key:
+        return None, None
+
+    summary_cache = SummaryCache.get_instance()
+    cached_result = summary_cache.get_from_memory(cache_key)
+    if cached_result is None and summary_cache.use_mongodb:
+        cached_result = await asyncio.to_thread(summary_cache.get, cache_key)
+    return cache_key, cached_result
+
+
+async def generate_summary_task_async(input_text, selected_department, selected_model, additional_info="",
+                                      on_chunk=None, cache_key=None):
+    """非同期APIでサマリを生成し、結果を辞書で返す。cache_keyを指定した場合は結果をキャッシュに保存する"""
     try:
-        if selected_model == "Claude" and CLAUDE_API_KEY:
-            discharge_summary, input_tokens, output_tokens = claude_generate_discharge_summary(
-                input_text,
-                additional_info,
-                selected_department,
-            )
-            model_detail = selected_model
-        elif selected_model == "Gemini_Pro" and GEMINI_MODEL and GEMINI_CREDENTIALS:
-            discharge_summary, input_tokens, output_tokens = gemini_generate_discharge_summary(
-                input_text,
-                additional_info,
-                selected_department,
-                GEMINI_MODEL,
-            )
-            model_detail = GEMINI_MODEL
-        elif selected_model == "Gemini_Flash" and GEMINI_FLASH_MODEL and GEMINI_CREDENTIALS:
-            discharge_summary, input_tokens, output_tokens = gemini_generate_discharge_summary(
-                input_text,
-                additional_info,
-                selected_department,
-                GEMINI_FLASH_MODEL,
-            )
-            model_detail = GEMINI_FLASH_MODEL
-        elif selected_model == "GPT4.1" and OPENAI_API_KEY:
-            try:
-                discharge_summary, input_tokens, output_tokens = openai_generate_discharge_summary(
-                    input_text,
-                    additional_info,
-                    selected_department,
-                )
-                model_detail = selected_model
-            except Exception as e:
-                error_str = str(e)
-                if "insufficient_quota" in error_str or "exceeded your current quota" in error_str:
-                    raise APIError(
-                        "OpenAI APIのクォータを超過しています。請求情報を確認するか、管理者に連絡してください。")
-                else:
-                    raise e
+        model = resolve_summary_model(selected_model)
+
+        # カルテの処理・トークン数の計算はイベントループを止めないよう別スレッドで行う
+        input_text, dedup_usage = await asyncio.to_thread(deduplicate_input, input_text, selected_department,
+                                                          model["provider"])
+        router = SummaryRouter()
+        # 同時に送る追加のリクエストは、選択されたモデルのプロバイダの同時生成数の範囲で送る
+        lane = GenerationScheduler.get_instance().get_lane(model["provider"])
+        summarizer = MapReduceSummarizer(router, lane=lane)
+        section_summarizer = SectionParallelSummarizer(router, lane=lane)
+        chunks = await asyncio.to_thread(summarizer.split, input_text)
+        if chunks:
+            # 長いカルテは期間ごとに分けて要約してからまとめる
+            outcome = await summarizer.generate_async(selected_model, chunks, selected_department, additional_info,
+                                                      on_chunk)
+        elif section_summarizer.enabled:
+            # 項目ごとに同時に生成して組み立てる
+            outcome = await section_summarizer.generate_async(selected_model, input_text, selected_department,
+                                                              additional_info, on_chunk)
         else:
-            raise APIError(MESSAGES["NO_API_CREDENTIALS"])
+            outcome = await router.generate_async(selected_model, input_text, selected_department, additional_info,
+                                                  on_chunk)
+
+        result = create_summary_result(outcome["discharge_summary"], outcome["input_tokens"], outcome["output_tokens"],
+                                       outcome["model_detail"], outcome["cache_usage"], outcome["failover"],
+                                       outcome["retry_count"])
+        result["dedup_usage"] = dedup_usage
+        if "model_usage" in outcome:
+            result["model_usage"] = outcome["model_usage"]
+        # 別のモデルで生成した結果は、選択されたモデルのキャッシュとして保存しない
+        if cache_key and not outcome["failover"]:
+            summary_cache = SummaryCache.get_instance()
+            if summary_cache.use_mongodb:
+                await asyncio.to_thread(summary_cache.set, cache_key, result)
+            else:
+                summary_cache.set(cache_key, result)
+        return result
+
+    except Exception as e:
+        return {"success": False, "error": e}
 
-        discharge_summary = format_discharge_summary(discharge_summary)
-        parsed_summary = parse_discharge_summary(discharge_summary)
 
-        result_queue.put({
-            "success": True,
-            "discharge_summary": discharge_summary,
-            "parsed_summary": parsed_summary,
-            "input_tokens": input_tokens,
-            "output_tokens": output_tokens,
-            "model_detail": model_detail
-        })
+def save_usage(usage_data):
+    """使用記録を保存し、統計情報の表示用に時間別・日別の集計へ加算する
 
+    集計の加算に失敗しても使用記録は保存済みのため、エラーは画面に表示せずに出力のみ行う
+    （集計はscripts/backfill_usage_rollups.pyで使用記録から作り直せる）
+    """
+    get_usage_collection().insert_one(usage_data)
+    try:
+        record_usage_rollup(usage_data)
     except Exception as e:
-        result_queue.put({"success": False, "error": e})
+        print(f"使用統計の集計の更新中にエラーが発生しました: {str(e)}")
+
+
+def predict_summary_request(model, input_text, additional_info="", selected_department="default"):
+    """送信前に入力トークン数・出力トークン数の上限・処理時間・費用を予測する"""
+    prompt = create_discharge_summary_prompt(input_text, additional_info, selected_department)
+    return TokenEstimator.get_instance().predict(model, model["provider"], prompt)
+
+
+def format_prediction(prediction):
+    if not prediction:
+        return ""
+    parts = [f"入力 約{prediction['input_tokens']:,}トークン"]
+    if prediction["seconds"] is not None:
+        parts.append(f"約{round(prediction['seconds'])}秒")
+    if prediction["cost"] is not None:
+        parts.append(f"約${prediction['cost']:.3f}")
+    return f"（{' / '.join(parts)}）"
 
 
 class SummaryProcessor:
@@ -86,10 +192,15 @@ class SummaryProcessor:
         self.error_text = ft.Text("", color=ft.colors.RED)
         self.progress_ring = ft.ProgressRing(width=20, height=20, visible=False)
         self.timer_text = ft.Text("", color=ft.colors.BLUE)
+        self.prediction_text = ""
+
+    async def process_discharge_summary(self, input_text, additional_info="", on_complete=None, on_progress=None):
+        """退院時サマリを生成する
 
-    def process_discharge_summary(self, input_text, additional_info="", on_complete=None):
-        """退院時サマリを生成する"""
-        if not GEMINI_CREDENTIALS and not CLAUDE_API_KEY:
+        on_progressが指定され、ストリーミングが有効な場合は生成途中のサマリを
+        on_progress(discharge_summary, parsed_summary)で逐次通知する
+        """
+        if not ProviderRegistry.get_instance().get_available_models():
             self.show_error(MESSAGES["NO_API_CREDENTIALS"])
             return
 
@@ -97,61 +208,70 @@ class SummaryProcessor:
             self.show_error(MESSAGES["NO_INPUT"])
             return
 
-        input_length = len(input_text.strip())
-        if input_length < MIN_INPUT_TOKENS:
+        available_models = self.global_state.get("available_models", [])
+        selected_model = self.global_state.get("selected_model",
+                                               available_models[0] if available_models else None)
+        selected_department = self.global_state.get("selected_department", "default")
+        registry = ProviderRegistry.get_instance()
+        provider = registry.get_provider_name(selected_model)
+
+        # 入力の長さは選択したモデルのプロバイダでのトークン数の見積もりで判定する
+        # トークン数の計算・プロンプトの取得・DBへの保存はイベントループを止めないよう別スレッドで行う
+        input_tokens = await asyncio.to_thread(TokenEstimator.get_instance().estimate, input_text.strip(), provider)
+        if input_tokens < MIN_INPUT_TOKENS:
             self.show_error(f"{MESSAGES['INPUT_TOO_SHORT']}")
             return
 
-        if input_length > MAX_INPUT_TOKENS:
+        if input_tokens > MAX_INPUT_TOKENS:
             self.show_error(f"{MESSAGES['INPUT_TOO_LONG']}")
             return
 
         try:
+            prediction = None
+            model = registry.get_model(selected_model)
+            if model:
+                prediction = await asyncio.to_thread(predict_summary_request, model, input_text, additional_info,
+                                                     selected_department)
+                if prediction["max_tokens"] == 0 \
+                        and not await asyncio.to_thread(MapReduceSummarizer().split, input_text):
+                    # プロンプトだけでコンテキスト長を超え、分割して要約することもできない
+                    self.show_error(f"{MESSAGES['INPUT_TOO_LONG']}")
+                    return
+            self.prediction_text = format_prediction(prediction)
+
             # UI表示の準備
             self.error_text.value = ""
-            self.status_text.value = "退院時サマリを作成中..."
+            self.status_text.value = f"退院時サマリを作成中...{self.prediction_text}"
             self.progress_ring.visible = True
             self.timer_text.value = "⏱️ 経過時間: 0秒"
             self.page.update()
 
             start_time = datetime.datetime.now()
-            result_queue = queue.Queue()
-
-            available_models = self.global_state.get("available_models", [])
-            selected_model = self.global_state.get("selected_model",
-                                                   available_models[0] if available_models else None)
-            selected_department = self.global_state.get("selected_department", "default")
-
-            # 別スレッドでサマリ生成を実行
-            summary_thread = threading.Thread(
-                target=generate_summary_task,
-                args=(input_text, selected_department, selected_model, result_queue, additional_info)
-            )
-            summary_thread.start()
-
-            # 経過時間表示用のタイマー
-            def update_timer():
-                elapsed_time = 0
-                while summary_thread.is_alive():
-                    elapsed_time = int((datetime.datetime.now() - start_time).total_seconds())
-                    self.timer_text.value = f"⏱️ 経過時間: {elapsed_time}秒"
-                    self.page.update()
-                    time.sleep(1)
-
-            timer_thread = threading.Thread(target=update_timer)
-            timer_thread.daemon = True
-            timer_thread.start()
-
-            # 完了を待機
-            summary_thread.join()
+
+            # キャッシュにある結果は待ち行列に入れずに返す
+            cache_key, cached_result = await find_cached_summary(input_text, selected_department, selected_model,
+                                                                 additional_info)
+            if cached_result:
+                result = create_cache_hit_result(cached_result)
+            else:
+                # 障害で停止中のプロバイダには待ち行列に入れる前にエラーを返す
+                if not SummaryRouter().has_available_candidate(selected_model):
+                    self.show_error(MESSAGES["PROVIDER_UNAVAILABLE"])
+                    return
+
+                on_chunk = None
+                if on_progress and STREAMING_ENABLED:
+                    on_chunk = self.create_stream_handler(on_progress)
+
+                result = await self.run_generation(provider, start_time, input_text, selected_department,
+                                                   selected_model, additional_info, on_chunk, cache_key)
 
             # タイマーを停止し、UI表示を更新
             self.progress_ring.visible = False
             self.status_text.value = ""
             self.page.update()
 
-            # 結果の取得と処理
-            result = result_queue.get()
+            # 結果の処理
 
             if result["success"]:
                 self.global_state["discharge_summary"] = result["discharge_summary"]
@@ -166,7 +286,6 @@ class SummaryProcessor:
 
                 # 使用統計の記録
                 try:
-                    usage_collection = get_usage_collection()
                     now_jst = datetime.datetime.now().astimezone(JST)
                     usage_data = {
                         "date": now_jst,
@@ -177,9 +296,19 @@ class SummaryProcessor:
                         "input_tokens": input_tokens,
                         "output_tokens": output_tokens,
                         "total_tokens": input_tokens + output_tokens,
-                        "processing_time": round(processing_time)
+                        "processing_time": round(processing_time),
+                        "cache_hit": result.get("cache_hit", False),
+                        "failover": result.get("failover", False),
+                        "retry_count": result.get("retry_count", 0)
                     }
-                    usage_collection.insert_one(usage_data)
+                    # プロンプトキャッシュの読み込み・書き込みトークン数などプロバイダ固有の内訳
+                    usage_data.update(result.get("cache_usage", {}))
+                    # 重複した記載の省略による削減量
+                    usage_data.update(result.get("dedup_usage", {}))
+                    # 複数のモデルで生成した場合のモデルごとの内訳
+                    if result.get("model_usage"):
+                        usage_data["model_usage"] = result["model_usage"]
+                    await asyncio.to_thread(save_usage, usage_data)
                 except Exception as db_error:
                     self.show_error(f"利用状況のDB保存中にエラーが発生しました: {str(db_error)}")
 
@@ -192,6 +321,48 @@ class SummaryProcessor:
         except Exception as e:
             self.show_error(f"退院時サマリの作成中にエラーが発生しました: {str(e)}")
 
+    async def run_generation(self, provider, start_time, *args):
+        """プロバイダごとの待ち行列に投入してイベントループ上でサマリ生成を実行し、完了まで待ち順番と経過時間を表示する"""
+        ticket = await GenerationScheduler.get_instance().submit_async(provider, generate_summary_task_async, *args)
+
+        result_future = asyncio.wrap_future(ticket.future)
+        while not result_future.done():
+            self.update_waiting_status(ticket.position(), start_time)
+            await asyncio.wait([result_future], timeout=1)
+        return result_future.result()
+
+    def update_waiting_status(self, position, start_time):
+        """待ち順番と経過時間の表示を更新"""
+        if position:
+            self.status_text.value = f"順番待ちです（{position}番目）..."
+        else:
+            self.status_text.value = f"退院時サマリを作成中...{self.prediction_text}"
+        elapsed_time = int((datetime.datetime.now() - start_time).total_seconds())
+        self.timer_text.value = f"⏱️ 経過時間: {elapsed_time}秒"
+        self.page.update()
+
+    def create_stream_handler(self, on_progress):
+        """ストリーミングの差分を蓄積し、一定間隔で途中結果を通知するハンドラを作成
+
+        整形は文字単位のため差分ごとに行い、項目ごとの本文は完了した行から逐次更新する
+        """
+        chunks = []
+        parser = SummaryStreamParser()
+        last_update = [0.0]
+
+        def on_chunk(delta):
+            delta = format_discharge_summary(delta)
+            chunks.append(delta)
+            parser.feed(delta)
+            now = time.monotonic()
+            if now - last_update[0] < STREAMING_UPDATE_INTERVAL:
+                return
+            last_update[0] = now
+
+            on_progress("".join(chunks), parser.snapshot())
+
+        return on_chunk
+
     def show_error(self, message):
         """エラーメッセージを表示"""
         self.error_text.value = message
@@ -0,0 +1,198 @@
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+
+from utils.config import TOKEN_ESTIMATE_CACHE_SIZE
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# 文字種ごとの1文字あたりのトークン数。各プロバイダの実測値から求めた目安
+CHAR_CLASS_RATIOS = {
+    "claude": {"cjk": 1.05, "kana": 0.95, "ascii": 0.27, "digit": 0.45, "space": 0.2, "other": 1.0},
+    "gemini": {"cjk": 0.75, "kana": 0.6, "ascii": 0.25, "digit": 1.0, "space": 0.15, "other": 0.8},
+    "openai": {"cjk": 0.8, "kana": 0.65, "ascii": 0.25, "digit": 0.35, "space": 0.15, "other": 0.8},
+}
+DEFAULT_CHAR_CLASS_RATIOS = CHAR_CLASS_RATIOS["claude"]
+
+# tiktokenがインストールされている場合に使うエンコーディング
+TIKTOKEN_ENCODINGS = {"openai": "o200k_base"}
+
+# 実測値による補正係数の更新の重みと範囲
+CALIBRATION_WEIGHT = 0.1
+CALIBRATION_RANGE = (0.5, 2.0)
+
+# 出力トークン数の実績がない場合の予測値と、コンテキスト長から差し引く余裕
+DEFAULT_OUTPUT_TOKENS = 1500
+CONTEXT_WINDOW_MARGIN = 256
+
+
+def classify_char(char):
+    if char.isspace():
+        return "space"
+    if char.isascii():
+        return "digit" if char.isdigit() else "ascii"
+    name = unicodedata.name(char, "")
+    if name.startswith("CJK"):
+        return "cjk"
+    if name.startswith(("HIRAGANA", "KATAKANA", "HALFWIDTH KATAKANA")):
+        return "kana"
+    if char.isdigit():
+        return "digit"
+    return "other"
+
+
+def get_text_digest(text):
+    return hashlib.sha256(text.encode("utf-8")).digest()
+
+
+def count_char_classes(text):
+    counts = {}
+    for char in text:
+        char_class = classify_char(char)
+        counts[char_class] = counts.get(char_class, 0) + 1
+    return counts
+
+
+class TokenEstimator:
+    """APIを呼び出さずにプロバイダごとの入力トークン数を見積もる
+
+    tiktokenが利用できるプロバイダはトークナイザで数え、それ以外は文字種ごとの比率から見積もる。
+    見積もり結果は(プロバイダ, テキストのハッシュ値)ごとに保持するため、同じテキストの再見積もりは辞書の参照のみとなる。
+    カルテ全体を含むプロンプトをキーとして保持しないよう、テキストそのものではなくハッシュ値をキーとする。
+    実際の入力トークン数をrecord_actualで渡すと、プロバイダごとの補正係数を更新する
+    """
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = TokenEstimator()
+        return cls._instance
+
+    def __init__(self, cache_size=TOKEN_ESTIMATE_CACHE_SIZE, use_tokenizer=True):
+        self.cache_size = cache_size
+        self.use_tokenizer = use_tokenizer
+        self._cache = OrderedDict()
+        self._encodings = {}
+        self._corrections = {}
+        self._output_stats = {}
+        self._lock = threading.Lock()
+
+    def estimate(self, text, provider_name):
+        """textのトークン数の見積もり（補正係数を適用済み）"""
+        if not text:
+            return 0
+        return max(1, round(self.estimate_raw(text, provider_name) * self.get_correction(provider_name)))
+
+    def estimate_raw(self, text, provider_name):
+        key = (provider_name, get_text_digest(text))
+        with self._lock:
+            tokens = self._cache.get(key)
+            if tokens is not None:
+                self._cache.move_to_end(key)
+                return tokens
+
+        tokens = self.count_with_tokenizer(text, provider_name)
+        if tokens is None:
+            ratios = CHAR_CLASS_RATIOS.get(provider_name, DEFAULT_CHAR_CLASS_RATIOS)
+            tokens = sum(ratios[char_class] * count for char_class, count in count_char_classes(text).items())
+
+        if self.cache_size > 0:
+            with self._lock:
+                self._cache[key] = tokens
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return tokens
+
+    def count_with_tokenizer(self, text, provider_name):
+        encoding = self.get_encoding(provider_name)
+        if encoding is None:
+            return None
+        return len(encoding.encode(text, disallowed_special=()))
+
+    def get_encoding(self, provider_name):
+        if not self.use_tokenizer or tiktoken is None or provider_name not in TIKTOKEN_ENCODINGS:
+            return None
+        if provider_name not in self._encodings:
+            try:
+                self._encodings[provider_name] = tiktoken.get_encoding(TIKTOKEN_ENCODINGS[provider_name])
+            except Exception as e:
+                # エンコーディングのファイルを取得できない環境では文字種による見積もりを使う
+                print(f"トークナイザを読み込めませんでした（{provider_name}）: {str(e)}")
+                self._encodings[provider_name] = None
+        return self._encodings[provider_name]
+
+    def get_correction(self, provider_name):
+        return self._corrections.get(provider_name, 1.0)
+
+    def record_actual(self, provider_name, estimated_tokens, actual_tokens):
+        """estimateで見積もったトークン数と実際の入力トークン数の比から補正係数を更新する"""
+        if not estimated_tokens or not actual_tokens:
+            return
+        low, high = CALIBRATION_RANGE
+        with self._lock:
+            correction = self._corrections.get(provider_name, 1.0)
+            target = correction * actual_tokens / estimated_tokens
+            correction += (target - correction) * CALIBRATION_WEIGHT
+            self._corrections[provider_name] = min(high, max(low, correction))
+
+    def record_output(self, model_id, output_tokens, seconds):
+        """モデルごとの出力トークン数と生成速度（トークン/秒）の移動平均を更新する"""
+        if not output_tokens or seconds <= 0:
+            return
+        with self._lock:
+            stats = self._output_stats.get(model_id)
+            if stats is None:
+                self._output_stats[model_id] = {"tokens": output_tokens, "rate": output_tokens / seconds}
+                return
+            stats["tokens"] += (output_tokens - stats["tokens"]) * CALIBRATION_WEIGHT
+            stats["rate"] += (output_tokens / seconds - stats["rate"]) * CALIBRATION_WEIGHT
+
+    @staticmethod
+    def choose_max_tokens(model, input_tokens):
+        """モデル定義のmax_output_tokensとcontext_windowから出力トークン数の上限を決める
+
+        どちらも指定されていない場合はNone（プロバイダごとの既定値を使う）
+        """
+        max_output_tokens = model.get("max_output_tokens")
+        context_window = model.get("context_window")
+        if context_window:
+            available = max(0, context_window - input_tokens - CONTEXT_WINDOW_MARGIN)
+            return min(max_output_tokens, available) if max_output_tokens else available
+        return max_output_tokens
+
+    def predict(self, model, provider_name, prompt_text):
+        """送信前に入力トークン数・出力トークン数の上限・処理時間・費用（USD）を予測する
+
+        処理時間は生成の実績がない場合、費用はモデル定義にinput_price・output_price（100万トークンあたり）が
+        ない場合はNoneとなる
+        """
+        input_tokens = self.estimate(prompt_text, provider_name)
+        max_tokens = self.choose_max_tokens(model, input_tokens)
+        stats = self._output_stats.get(model.get("model"))
+        output_tokens = round(stats["tokens"]) if stats else DEFAULT_OUTPUT_TOKENS
+        if max_tokens is not None:
+            output_tokens = min(output_tokens, max_tokens)
+
+        cost = None
+        if "input_price" in model and "output_price" in model:
+            cost = (input_tokens * model["input_price"] + output_tokens * model["output_price"]) / 1_000_000
+
+        return {
+            "input_tokens": input_tokens,
+            "max_tokens": max_tokens,
+            "output_tokens": output_tokens,
+            "seconds": output_tokens / stats["rate"] if stats else None,
+            "cost": cost,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
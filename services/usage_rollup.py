@@ -0,0 +1,115 @@
+import datetime
+
+from pymongo import ReplaceOne
+
+from utils.db import get_usage_collection, get_usage_rollup_collection
+
+# 集計の単位ごとの$dateTruncの単位
+ROLLUP_UNITS = {"hourly": "hour", "daily": "day"}
+# 集計の単位内で区別する項目（utils.db.INDEXESで一意のインデックスを作成する）
+ROLLUP_KEYS = ("bucket", "department", "model_detail", "document_name")
+ROLLUP_SUM_FIELDS = ("input_tokens", "output_tokens", "total_tokens")
+BACKFILL_BATCH_SIZE = 1000
+
+
+def to_utc(date):
+    """MongoDBと同じく、タイムゾーン付きの日時はUTCのタイムゾーンなしの日時に変換する"""
+    if date.tzinfo is not None:
+        date = date.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return date
+
+
+def get_bucket(date, granularity):
+    """日時を含む集計の単位の開始日時（UTC）"""
+    bucket = to_utc(date).replace(minute=0, second=0, microsecond=0)
+    if granularity == "daily":
+        bucket = bucket.replace(hour=0)
+    return bucket
+
+
+def create_rollup_increment(usage_data):
+    increment = {"count": 1}
+    for field in ROLLUP_SUM_FIELDS:
+        increment[field] = usage_data.get(field) or 0
+    # 平均処理時間は、処理時間のある記録のみの合計と件数から求める
+    if usage_data.get("processing_time") is not None:
+        increment["processing_time_sum"] = usage_data["processing_time"]
+        increment["processing_time_count"] = 1
+    return increment
+
+
+def record_usage_rollup(usage_data):
+    """使用記録を時間別・日別の集計に$incで加算する"""
+    increment = create_rollup_increment(usage_data)
+    for granularity in ROLLUP_UNITS:
+        key = {
+            "bucket": get_bucket(usage_data["date"], granularity),
+            "department": usage_data.get("department"),
+            "model_detail": usage_data.get("model_detail"),
+            "document_name": usage_data.get("document_name"),
+        }
+        get_usage_rollup_collection(granularity).update_one(key, {"$inc": increment}, upsert=True)
+
+
+def create_date_range(start, end):
+    date_range = {}
+    if start:
+        date_range["$gte"] = start
+    if end:
+        date_range["$lt"] = end
+    return date_range
+
+
+def create_backfill_pipeline(granularity, start=None, end=None):
+    """使用記録から集計の単位ごとの集計を作成するパイプライン（$dateTruncのためMongoDB 5.0以降）"""
+    pipeline = []
+    if start or end:
+        pipeline.append({"$match": {"date": create_date_range(start, end)}})
+
+    group = {
+        "_id": {
+            "bucket": {"$dateTrunc": {"date": "$date", "unit": ROLLUP_UNITS[granularity]}},
+            "department": "$department",
+            "model_detail": "$model_detail",
+            "document_name": "$document_name",
+        },
+        "count": {"$sum": 1},
+        "processing_time_sum": {"$sum": "$processing_time"},
+        "processing_time_count": {"$sum": {"$cond": [{"$isNumber": "$processing_time"}, 1, 0]}},
+    }
+    for field in ROLLUP_SUM_FIELDS:
+        group[field] = {"$sum": f"${field}"}
+    pipeline.append({"$group": group})
+    return pipeline
+
+
+def backfill_usage_rollups(start=None, end=None, usage_collection=None):
+    """使用記録から集計を作り直し、集計の単位ごとに書き込んだ件数を返す
+
+    start・endは日単位に広げ、その期間の既存の集計は削除してから書き込む。
+    集計の途中に記録された使用記録は集計から漏れる場合があるため、利用の少ない時間帯に実行する
+    """
+    if start:
+        start = get_bucket(start, "daily")
+    if end:
+        day = get_bucket(end, "daily")
+        end = day if day == to_utc(end) else day + datetime.timedelta(days=1)
+    usage_collection = usage_collection if usage_collection is not None else get_usage_collection()
+
+    written = {}
+    for granularity in ROLLUP_UNITS:
+        rollups = [
+            {**row["_id"], **{field: value for field, value in row.items() if field != "_id"}}
+            for row in usage_collection.aggregate(create_backfill_pipeline(granularity, start, end))
+        ]
+
+        collection = get_usage_rollup_collection(granularity)
+        collection.delete_many({"bucket": create_date_range(start, end)} if start or end else {})
+
+        for i in range(0, len(rollups), BACKFILL_BATCH_SIZE):
+            collection.bulk_write([
+                ReplaceOne({key: rollup.get(key) for key in ROLLUP_KEYS}, rollup, upsert=True)
+                for rollup in rollups[i:i + BACKFILL_BATCH_SIZE]
+            ], ordered=False)
+        written[granularity] = len(rollups)
+    return written
@@ -0,0 +1,191 @@
+import datetime
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+
+from utils.config import STATISTICS_CACHE_PAST_TTL, STATISTICS_CACHE_SIZE, STATISTICS_CACHE_TTL, \
+    USAGE_ROLLUP_ENABLED
+from utils.db import get_usage_collection, get_usage_rollup_collection
+
+# 集計の種類ごとの結果の列名
+STATISTICS_GROUPINGS = {
+    "daily": "date_str",
+    "department": "department",
+    "model": "model_detail",
+}
+
+STATISTICS_COLUMNS = ["count", "input_tokens", "output_tokens", "total_tokens", "processing_time"]
+
+# 集計に必要な項目（カルテ由来の項目などは読み込まない）
+USAGE_PROJECTION = {
+    "_id": 0,
+    "date": 1,
+    "department": 1,
+    "model_detail": 1,
+    "input_tokens": 1,
+    "output_tokens": 1,
+    "total_tokens": 1,
+    "processing_time": 1,
+}
+
+
+def create_usage_query(start, end, doc_type):
+    """期間と文書タイプの条件。doc_typeが「すべて」の場合は文書タイプで絞り込まない"""
+    query = {
+        "date": {"$gte": start, "$lt": end}
+    }
+    if doc_type != "すべて":
+        query["document_name"] = doc_type
+    return query
+
+
+def get_group_key(grouping, date_field):
+    if grouping == "daily":
+        return {"$dateToString": {"format": "%Y-%m-%d", "date": f"${date_field}"}}
+    return f"${STATISTICS_GROUPINGS[grouping]}"
+
+
+def create_statistics_pipeline(start, end, doc_type, grouping):
+    """条件に合う使用記録をグループごとに集計し、キーの順に並べるパイプライン"""
+    return [
+        {"$match": create_usage_query(start, end, doc_type)},
+        {"$project": USAGE_PROJECTION},
+        {"$group": {
+            "_id": get_group_key(grouping, "date"),
+            "count": {"$sum": 1},
+            "input_tokens": {"$sum": "$input_tokens"},
+            "output_tokens": {"$sum": "$output_tokens"},
+            "total_tokens": {"$sum": "$total_tokens"},
+            "processing_time": {"$avg": "$processing_time"},
+        }},
+        # グループのキーがない記録は、pandasのgroupbyと同様に集計から除く
+        {"$match": {"_id": {"$ne": None}}},
+        {"$sort": {"_id": 1}},
+    ]
+
+
+def create_rollup_statistics_pipeline(start, end, doc_type, grouping):
+    """時間別・日別の集計をさらにグループごとに集計するパイプライン"""
+    query = create_usage_query(start, end, doc_type)
+    query["bucket"] = query.pop("date")
+    return [
+        {"$match": query},
+        {"$group": {
+            "_id": get_group_key(grouping, "bucket"),
+            "count": {"$sum": "$count"},
+            "input_tokens": {"$sum": "$input_tokens"},
+            "output_tokens": {"$sum": "$output_tokens"},
+            "total_tokens": {"$sum": "$total_tokens"},
+            "processing_time_sum": {"$sum": "$processing_time_sum"},
+            "processing_time_count": {"$sum": "$processing_time_count"},
+        }},
+        {"$match": {"_id": {"$ne": None}}},
+        {"$project": {
+            "count": 1,
+            "input_tokens": 1,
+            "output_tokens": 1,
+            "total_tokens": 1,
+            "processing_time": {"$cond": [
+                {"$gt": ["$processing_time_count", 0]},
+                {"$divide": ["$processing_time_sum", "$processing_time_count"]},
+                None
+            ]},
+        }},
+        {"$sort": {"_id": 1}},
+    ]
+
+
+def get_rollup_granularity(start, end):
+    """期間の境界に合う集計の単位。時間の途中で区切られる場合はNone"""
+    if all(date.hour == date.minute == date.second == date.microsecond == 0 for date in (start, end)):
+        return "daily"
+    if all(date.minute == date.second == date.microsecond == 0 for date in (start, end)):
+        return "hourly"
+    return None
+
+
+def load_usage_statistics(start, end, doc_type, grouping, collection=None, use_rollups=USAGE_ROLLUP_ENABLED):
+    """集計済みの行のみをMongoDBから取得し、グループの列と集計値の列のDataFrameで返す
+
+    use_rollupsが有効で期間が時間の境界に合う場合は、使用記録ではなく時間別・日別の集計から求める。
+    平均処理時間は小数点以下1桁に丸める。該当する記録がない場合は空のDataFrame
+    """
+    granularity = get_rollup_granularity(start, end) if use_rollups else None
+    if granularity:
+        collection = collection if collection is not None else get_usage_rollup_collection(granularity)
+        pipeline = create_rollup_statistics_pipeline(start, end, doc_type, grouping)
+    else:
+        collection = collection if collection is not None else get_usage_collection()
+        pipeline = create_statistics_pipeline(start, end, doc_type, grouping)
+    rows = list(collection.aggregate(pipeline))
+
+    stats = pd.DataFrame(rows, columns=["_id"] + STATISTICS_COLUMNS)
+    stats = stats.rename(columns={"_id": STATISTICS_GROUPINGS[grouping]})
+    stats["processing_time"] = stats["processing_time"].astype(float).round(1)
+    return stats
+
+
+class StatisticsCache:
+    """集計結果のTTL付きキャッシュ。プロセス内のすべてのセッションで共有する
+
+    現在より前に終わる期間の集計は新しい使用記録で変わらないため、past_ttlの間保持する
+    """
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = StatisticsCache()
+        return cls._instance
+
+    def __init__(self, ttl=STATISTICS_CACHE_TTL, past_ttl=STATISTICS_CACHE_PAST_TTL, max_entries=STATISTICS_CACHE_SIZE):
+        self.ttl = ttl
+        self.past_ttl = past_ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, stats = entry
+            if time.monotonic() >= expires_at:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+        # 表示側で列を書き換えてもキャッシュに影響しないよう複製を返す
+        return stats.copy()
+
+    def set(self, key, stats, end):
+        # 使用記録の日時はUTCで保存されるため、期間の終わりをUTCの現在日時と比べる
+        now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+        ttl = self.past_ttl if end <= now else self.ttl
+        if ttl <= 0 or self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, stats.copy())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def get_usage_statistics(start, end, doc_type, grouping):
+    """キャッシュがあればそれを、なければload_usage_statistics()の結果をキャッシュして返す"""
+    cache = StatisticsCache.get_instance()
+    key = (start, end, doc_type, grouping)
+    stats = cache.get(key)
+    if stats is None:
+        stats = load_usage_statistics(start, end, doc_type, grouping)
+        cache.set(key, stats, end)
+    return stats
@@ -0,0 +1,65 @@
+import httpx
+import openai
+from unittest.mock import patch
+
+from services.circuit_breaker import CircuitBreaker, CLOSED, OPEN, HALF_OPEN, is_provider_failure
+from utils.exceptions import APIError
+
+
+def create_status_error(status_code):
+    response = httpx.Response(status_code, request=httpx.Request("POST", "https://api.openai.com/v1/chat"))
+    return openai.APIStatusError("エラー", response=response, body=None)
+
+
+def test_opens_after_consecutive_failures():
+    """連続した失敗が閾値に達すると送信を止めることをテスト"""
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=60)
+
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.get_state() == CLOSED
+
+    breaker.record_failure()
+    assert breaker.get_state() == OPEN
+    assert breaker.allow_request() is False
+    assert breaker.is_available() is False
+
+
+def test_half_open_allows_single_trial():
+    """一定時間後に1件だけ試行を許可し、成功すれば送信を再開することをテスト"""
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+    breaker.record_failure()
+
+    with patch('services.circuit_breaker.time.monotonic', return_value=breaker._opened_at + 61):
+        assert breaker.get_state() == HALF_OPEN
+        assert breaker.is_available() is True
+        assert breaker.allow_request() is True
+        assert breaker.allow_request() is False
+
+        breaker.record_success()
+        assert breaker.get_state() == CLOSED
+
+
+def test_half_open_failure_reopens():
+    """試行が失敗した場合は再び送信を止めることをテスト"""
+    breaker = CircuitBreaker(failure_threshold=5, reset_timeout=60)
+    for _ in range(5):
+        breaker.record_failure()
+
+    with patch('services.circuit_breaker.time.monotonic', return_value=breaker._opened_at + 61):
+        assert breaker.allow_request() is True
+        breaker.record_failure()
+        assert breaker.get_state() == OPEN
+
+
+def test_is_provider_failure():
+    """5xx・接続エラー・タイムアウトのみをプロバイダの障害とみなすことをテスト"""
+    assert is_provider_failure(create_status_error(503)) is True
+    assert is_provider_failure(create_status_error(429)) is False
+    assert is_provider_failure(create_status_error(400)) is False
+    assert is_provider_failure(TimeoutError()) is True
+    assert is_provider_failure(APIError("認証情報が設定されていません")) is False
+
@@ -0,0 +1,89 @@
+import threading
+
+import pytest
+from unittest.mock import patch, MagicMock
+
+from external_service.client_registry import ClientRegistry, get_anthropic_client
+
+
+@pytest.fixture
+def reset_client_registry():
+    """各テスト前後にClientRegistryのシングルトンインスタンスをリセット"""
+    ClientRegistry._instance = None
+    yield
+    ClientRegistry._instance = None
+
+
+def test_get_instance_returns_singleton(reset_client_registry):
+    """get_instanceが同じインスタンスを返すことをテスト"""
+    assert ClientRegistry.get_instance() is ClientRegistry.get_instance()
+
+
+def test_get_client_creates_once():
+    """同じキーではfactoryが一度だけ呼ばれることをテスト"""
+    registry = ClientRegistry()
+    factory = MagicMock(side_effect=lambda: object())
+
+    client1 = registry.get_client("test", factory)
+    client2 = registry.get_client("test", factory)
+
+    assert client1 is client2
+    factory.assert_called_once()
+
+
+def test_get_client_shared_across_threads():
+    """複数スレッドから同時に取得しても同じクライアントが返されることをテスト"""
+    registry = ClientRegistry()
+    factory = MagicMock(side_effect=lambda: object())
+    results = []
+
+    def worker():
+        results.append(registry.get_client("test", factory))
+
+    threads = [threading.Thread(target=worker) for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(set(id(client) for client in results)) == 1
+    factory.assert_called_once()
+
+
+@patch('external_service.client_registry.Anthropic')
+def test_get_anthropic_client_uses_pool_settings(mock_anthropic, reset_client_registry):
+    """Anthropicクライアントにタイムアウトと接続プール設定が渡されることをテスト"""
+    registry = ClientRegistry(timeout=30, max_connections=5, max_keepalive_connections=2)
+
+    registry.get_anthropic_client("test_key")
+    registry.get_anthropic_client("test_key")
+
+    mock_anthropic.assert_called_once()
+    kwargs = mock_anthropic.call_args[1]
+    assert kwargs["api_key"] == "test_key"
+    assert kwargs["timeout"] == 30
+    assert kwargs["http_client"] is not None
+
+
+@patch('external_service.client_registry.Anthropic')
+def test_different_api_keys_use_different_clients(mock_anthropic, reset_client_registry):
+    """APIキーが異なる場合は別のクライアントが生成されることをテスト"""
+    mock_anthropic.side_effect = lambda **kwargs: MagicMock()
+
+    client1 = get_anthropic_client("key1")
+    client2 = get_anthropic_client("key2")
+
+    assert client1 is not client2
+    assert mock_anthropic.call_count == 2
+
+
+def test_reset_closes_clients(reset_client_registry):
+    """resetで生成済みクライアントがクローズされることをテスト"""
+    registry = ClientRegistry.get_instance()
+    client = MagicMock()
+    registry.get_client("test", lambda: client)
+
+    ClientRegistry.reset()
+
+    client.close.assert_called_once()
+    assert ClientRegistry._instance is None
@@ -5,7 +5,14 @@ import pytest
 from unittest.mock import patch, MagicMock
 
 # テスト前に各テストケースで使用する設定をインポート
-from utils.config import get_config
+from utils.config import get_config, ConfigCache
+
+
+@pytest.fixture(autouse=True)
+def reset_config_cache():
+    """各テストで設定キャッシュを初期化"""
+    with patch('utils.config._config_cache', ConfigCache(check_interval=0)):
+        yield
 
 
 @pytest.fixture
@@ -42,6 +49,48 @@ def test_get_config(mock_join, mock_configparser, mock_path):
     assert result == mock_configparser
 
 
+@patch('utils.config.read_config')
+def test_config_cache_reads_file_once(mock_read_config):
+    """更新日時が変わらない限りconfig.iniを再読み込みしないことをテスト"""
+    cache = ConfigCache(check_interval=0)
+
+    with patch('utils.config.os.path.getmtime', return_value=100.0):
+        first = cache.get()
+        second = cache.get()
+
+    assert first is second
+    mock_read_config.assert_called_once()
+
+
+@patch('utils.config.read_config')
+def test_config_cache_reloads_when_file_changes(mock_read_config):
+    """config.iniの更新日時が変わった場合に再読み込みすることをテスト"""
+    mock_read_config.side_effect = lambda path: MagicMock()
+    cache = ConfigCache(check_interval=0)
+
+    with patch('utils.config.os.path.getmtime', return_value=100.0):
+        first = cache.get()
+    with patch('utils.config.os.path.getmtime', return_value=200.0):
+        second = cache.get()
+
+    assert first is not second
+    assert mock_read_config.call_count == 2
+
+
+@patch('utils.config.read_config')
+def test_config_cache_skips_mtime_check_within_interval(mock_read_config):
+    """確認間隔内ではファイルの更新日時も確認しないことをテスト"""
+    cache = ConfigCache(check_interval=60)
+
+    with patch('utils.config.os.path.getmtime', return_value=100.0) as mock_getmtime:
+        cache.get()
+        cache.get()
+        cache.get()
+
+    mock_getmtime.assert_called_once()
+    mock_read_config.assert_called_once()
+
+
 @patch('utils.config.load_dotenv')
 def test_environment_variables_loaded(mock_load_dotenv):
     """環境変数からの設定読み込みテスト"""
@@ -0,0 +1,96 @@
+import datetime
+import os
+import uuid
+from unittest.mock import MagicMock
+
+import pytest
+from pymongo import MongoClient
+from pymongo.errors import OperationFailure, PyMongoError
+
+from utils.db import INDEXES, ensure_indexes, ensure_ttl_index
+
+LOCAL_MONGODB_URI = os.environ.get("MONGODB_TEST_URI", "mongodb://localhost:27017")
+
+
+@pytest.fixture
+def local_db():
+    """ローカルのMongoDBに一時的なデータベースを作成する。接続できない場合はスキップ"""
+    client = MongoClient(LOCAL_MONGODB_URI, serverSelectionTimeoutMS=500)
+    try:
+        client.admin.command("ping")
+    except PyMongoError:
+        pytest.skip("ローカルのMongoDBに接続できません")
+    db_name = f"test_indexes_{uuid.uuid4().hex[:8]}"
+    yield client[db_name]
+    client.drop_database(db_name)
+    client.close()
+
+
+def get_stages(plan):
+    """実行計画に含まれるステージ名"""
+    stages = [plan.get("stage")]
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            stages.extend(get_stages(plan[key]))
+    for child in plan.get("inputStages", []):
+        stages.extend(get_stages(child))
+    return stages
+
+
+def test_ensure_indexes_creates_each_index():
+    """INDEXESのインデックスをすべて作成し、失敗したものがあっても続行することをテスト"""
+    db = MagicMock()
+    db["prompts"].create_index.side_effect = OperationFailure("duplicate key")
+    db["summary_usage"].index_information.return_value = {}
+
+    ensure_indexes(db)
+
+    created = [(call[0][0], call[1]) for call in db.__getitem__.return_value.create_index.call_args_list]
+    assert created == [(keys, options) for _, keys, options in INDEXES]
+
+
+def test_ensure_ttl_index_updates_existing_index():
+    """TTLインデックスがない場合は作成し、保持期間が異なる場合はcollModで変更することをテスト"""
+    collection = MagicMock()
+    collection.name = "summary_usage"
+
+    collection.index_information.return_value = {}
+    ensure_ttl_index(collection, "date", 3600)
+    collection.create_index.assert_called_once_with("date", expireAfterSeconds=3600)
+
+    collection.index_information.return_value = {"date_1": {"key": [("date", 1)], "expireAfterSeconds": 60}}
+    ensure_ttl_index(collection, "date", 3600)
+    collection.database.command.assert_called_once_with(
+        "collMod", "summary_usage", index={"keyPattern": {"date": 1}, "expireAfterSeconds": 3600}
+    )
+
+    ensure_ttl_index(collection, "date", 0)
+    collection.drop_index.assert_called_once_with("date_1")
+
+
+def test_hot_queries_use_indexes(local_db):
+    """主な検索がコレクション全体の走査（COLLSCAN）にならないことをテスト"""
+    ensure_indexes(local_db)
+    ensure_indexes(local_db)
+
+    now = datetime.datetime(2025, 4, 1)
+    local_db["summary_usage"].insert_many([
+        {"date": now + datetime.timedelta(hours=i), "document_name": "退院時サマリ", "department": "内科"}
+        for i in range(100)
+    ])
+    local_db["prompts"].insert_one({"department": "default", "is_default": True})
+    local_db["departments"].insert_many([{"name": f"科{i}", "order": i} for i in range(10)])
+    local_db["users"].insert_one({"username": "user"})
+
+    queries = [
+        local_db["summary_usage"].find({"date": {"$gte": now, "$lt": now + datetime.timedelta(days=1)},
+                                        "document_name": "退院時サマリ"}),
+        local_db["summary_usage"].find({"date": {"$gte": now, "$lt": now + datetime.timedelta(days=1)}}),
+        local_db["prompts"].find({"department": "default", "is_default": True}),
+        local_db["departments"].find().sort("order"),
+        local_db["departments"].find({"name": "科1"}),
+        local_db["users"].find({"username": "user"}),
+    ]
+    for cursor in queries:
+        plan = cursor.explain()["queryPlanner"]["winningPlan"]
+        assert "COLLSCAN" not in get_stages(plan)
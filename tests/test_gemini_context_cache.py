@@ -0,0 +1,206 @@
+import asyncio
+import time
+
+import pytest
+from unittest.mock import patch, MagicMock, AsyncMock
+from google.genai import errors as genai_errors
+
+from external_service.gemini_api import gemini_generate_discharge_summary_async, parse_gemini_response
+from external_service.gemini_context_cache import GeminiContextCache
+from utils.exceptions import APIError
+
+
+def create_client():
+    client = MagicMock()
+    created = MagicMock()
+    created.name = "cachedContents/1"
+    client.aio.caches.create = AsyncMock(return_value=created)
+    client.aio.caches.update = AsyncMock()
+    return client
+
+
+def get_cached_content(cache, client, model_name, department, prompt_template):
+    return asyncio.run(cache.get_cached_content_async(client, model_name, department, prompt_template))
+
+
+def test_cached_content_is_created_once_and_reused():
+    """同じ診療科・モデル・プロンプトではキャッシュが1度だけ作成されることをテスト"""
+    cache = GeminiContextCache(enabled=True, ttl=3600, refresh_margin=300)
+    client = create_client()
+
+    first = get_cached_content(cache, client, "gemini-pro", "内科", "テストプロンプト")
+    second = get_cached_content(cache, client, "gemini-pro", "内科", "テストプロンプト")
+
+    assert first == second == "cachedContents/1"
+    client.aio.caches.create.assert_awaited_once()
+    config = client.aio.caches.create.call_args.kwargs["config"]
+    assert config.system_instruction == "テストプロンプト"
+    assert config.ttl == "3600s"
+
+
+def test_cached_content_is_created_per_prompt_version():
+    """プロンプトが更新された場合は新しいキャッシュが作成されることをテスト"""
+    cache = GeminiContextCache(enabled=True)
+    client = create_client()
+
+    get_cached_content(cache, client, "gemini-pro", "内科", "プロンプト1")
+    get_cached_content(cache, client, "gemini-pro", "内科", "プロンプト2")
+    get_cached_content(cache, client, "gemini-flash", "内科", "プロンプト2")
+
+    assert client.aio.caches.create.await_count == 3
+
+
+def test_cached_content_is_refreshed_before_expiry():
+    """TTLの期限が近づいたキャッシュは期限が延長されることをテスト"""
+    cache = GeminiContextCache(enabled=True, ttl=3600, refresh_margin=300)
+    client = create_client()
+
+    get_cached_content(cache, client, "gemini-pro", "内科", "テストプロンプト")
+    for entry in cache._entries.values():
+        entry["expires_at"] = time.monotonic() + 100
+
+    name = get_cached_content(cache, client, "gemini-pro", "内科", "テストプロンプト")
+
+    assert name == "cachedContents/1"
+    client.aio.caches.update.assert_awaited_once()
+    assert client.aio.caches.update.call_args.kwargs["name"] == "cachedContents/1"
+    client.aio.caches.create.assert_awaited_once()
+
+
+def test_concurrent_misses_create_cache_once():
+    """同じキーで同時に参照された場合は、作成中のキャッシュを待って1度だけ作成することをテスト"""
+    cache = GeminiContextCache(enabled=True)
+    client = create_client()
+    created = client.aio.caches.create.return_value
+
+    async def create_slowly(**kwargs):
+        await asyncio.sleep(0.01)
+        return created
+
+    client.aio.caches.create.side_effect = create_slowly
+
+    async def main():
+        return await asyncio.gather(*[
+            cache.get_cached_content_async(client, "gemini-pro", "内科", "テストプロンプト") for _ in range(5)
+        ])
+
+    assert asyncio.run(main()) == ["cachedContents/1"] * 5
+    client.aio.caches.create.assert_awaited_once()
+
+
+def test_concurrent_misses_share_create_failure():
+    """作成を待っていたリクエストも、作成に失敗した場合はキャッシュを使わずに送信することをテスト"""
+    cache = GeminiContextCache(enabled=True, retry_interval=60)
+    client = create_client()
+
+    async def fail_slowly(**kwargs):
+        await asyncio.sleep(0.01)
+        raise Exception("PERMISSION_DENIED")
+
+    client.aio.caches.create.side_effect = fail_slowly
+
+    async def main():
+        return await asyncio.gather(*[
+            cache.get_cached_content_async(client, "gemini-pro", "内科", "テストプロンプト") for _ in range(3)
+        ])
+
+    assert asyncio.run(main()) == [None] * 3
+    client.aio.caches.create.assert_awaited_once()
+
+
+def test_concurrent_refresh_uses_current_cache():
+    """延長中は延長を待たずに現在のキャッシュを使い、延長は1度だけ行うことをテスト"""
+    cache = GeminiContextCache(enabled=True, ttl=3600, refresh_margin=300)
+    client = create_client()
+    get_cached_content(cache, client, "gemini-pro", "内科", "テストプロンプト")
+    for entry in cache._entries.values():
+        entry["expires_at"] = time.monotonic() + 100
+
+    async def update_slowly(**kwargs):
+        await asyncio.sleep(0.01)
+
+    client.aio.caches.update.side_effect = update_slowly
+
+    async def main():
+        return await asyncio.gather(*[
+            cache.get_cached_content_async(client, "gemini-pro", "内科", "テストプロンプト") for _ in range(3)
+        ])
+
+    assert asyncio.run(main()) == ["cachedContents/1"] * 3
+    client.aio.caches.update.assert_awaited_once()
+
+
+def test_create_failure_falls_back_and_is_not_retried_immediately():
+    """キャッシュを作成できない場合はNoneを返し、一定時間は再作成しないことをテスト"""
+    cache = GeminiContextCache(enabled=True, retry_interval=600)
+    client = create_client()
+    client.aio.caches.create.side_effect = Exception("Cached content is too small")
+
+    assert get_cached_content(cache, client, "gemini-pro", "内科", "短いプロンプト") is None
+    assert get_cached_content(cache, client, "gemini-pro", "内科", "短いプロンプト") is None
+    client.aio.caches.create.assert_awaited_once()
+
+
+def test_disabled_cache_does_not_call_api():
+    """無効時はキャッシュAPIを呼び出さないことをテスト"""
+    cache = GeminiContextCache(enabled=False)
+    client = create_client()
+
+    assert get_cached_content(cache, client, "gemini-pro", "内科", "テストプロンプト") is None
+    client.aio.caches.create.assert_not_called()
+
+
+@patch('external_service.prompt_builder.get_prompt_template', return_value="テストプロンプト")
+@patch('external_service.gemini_api.initialize_gemini')
+def test_generate_falls_back_to_inline_prompt(mock_initialize, mock_prompt_template):
+    """キャッシュが見つからない場合は同じシステム指示としてプロンプトを直接送信してやり直すことをテスト"""
+    client = create_client()
+    response = MagicMock(text="現病歴:発熱")
+    response.usage_metadata = MagicMock(prompt_token_count=100, candidates_token_count=10,
+                                        cached_content_token_count=None)
+    not_found = genai_errors.ClientError(404, {"error": {"message": "CachedContent not found", "status": "NOT_FOUND"}})
+    client.aio.models.generate_content = AsyncMock(side_effect=[not_found, response])
+    mock_initialize.return_value = client
+
+    with patch.object(GeminiContextCache, '_instance', GeminiContextCache(enabled=True)):
+        result = asyncio.run(gemini_generate_discharge_summary_async("カルテ", "", "内科", "gemini-pro"))
+
+        cached_call, inline_call = client.aio.models.generate_content.call_args_list
+        assert cached_call.kwargs["contents"] == "【カルテ情報】\nカルテ"
+        assert cached_call.kwargs["config"].cached_content == "cachedContents/1"
+        assert cached_call.kwargs["config"].system_instruction is None
+        assert inline_call.kwargs["contents"] == "【カルテ情報】\nカルテ"
+        assert inline_call.kwargs["config"].cached_content is None
+        assert inline_call.kwargs["config"].system_instruction == "テストプロンプト"
+        assert GeminiContextCache.get_instance()._entries == {}
+
+    assert result == ("現病歴:発熱", 100, 10, {"cache_read_input_tokens": 0})
+
+
+@pytest.mark.parametrize("error", [
+    genai_errors.ClientError(400, {"error": {"message": "Invalid argument", "status": "INVALID_ARGUMENT"}}),
+    genai_errors.ServerError(503, {"error": {"message": "Unavailable", "status": "UNAVAILABLE"}}),
+])
+@patch('external_service.prompt_builder.get_prompt_template', return_value="テストプロンプト")
+@patch('external_service.gemini_api.initialize_gemini')
+def test_generate_does_not_fall_back_on_other_errors(mock_initialize, mock_prompt_template, error):
+    """キャッシュの失効以外のエラーではプロンプトを直接送信せず、キャッシュも破棄しないことをテスト"""
+    client = create_client()
+    client.aio.models.generate_content = AsyncMock(side_effect=error)
+    mock_initialize.return_value = client
+
+    with patch.object(GeminiContextCache, '_instance', GeminiContextCache(enabled=True)):
+        with pytest.raises(APIError):
+            asyncio.run(gemini_generate_discharge_summary_async("カルテ", "", "内科", "gemini-pro"))
+
+        client.aio.models.generate_content.assert_awaited_once()
+        assert GeminiContextCache.get_instance()._entries != {}
+
+
+def test_parse_gemini_response_includes_cached_tokens():
+    """キャッシュから読み込まれたトークン数が使用量に含まれることをテスト"""
+    response = MagicMock(text="現病歴:発熱")
+    response.usage_metadata = MagicMock(prompt_token_count=1100, candidates_token_count=10,
+                                        cached_content_token_count=1000)
+
+    assert parse_gemini_response(response) == ("現病歴:発熱", 1100, 10, {"cache_read_input_tokens": 1000})
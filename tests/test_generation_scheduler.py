@@ -0,0 +1,181 @@
+import asyncio
+
+import pytest
+
+from services.generation_scheduler import GenerationScheduler, ProviderLane
+from utils.exceptions import QueueFullError
+
+
+@pytest.fixture
+def reset_generation_scheduler():
+    """各テスト前後にGenerationSchedulerのシングルトンインスタンスをリセット"""
+    GenerationScheduler._instance = None
+    yield
+    if GenerationScheduler._instance is not None:
+        GenerationScheduler._instance.shutdown()
+    GenerationScheduler._instance = None
+
+
+def test_submit_async_returns_result():
+    """投入したコルーチンの結果がチケットから取得できることをテスト"""
+    lane = ProviderLane("test", max_workers=2)
+
+    async def add(x, y):
+        return x + y
+
+    async def main():
+        ticket = await lane.submit_async(add, 1, 2)
+        result = await asyncio.wrap_future(ticket.future)
+        return ticket, result
+
+    ticket, result = asyncio.run(main())
+
+    assert result == 3
+    assert ticket.position() == 0
+
+
+def test_queue_is_fifo_and_reports_position():
+    """待ち行列がFIFOで順番を返すことをテスト"""
+    lane = ProviderLane("test", max_workers=1, max_queue_size=10)
+    order = []
+
+    async def append(i):
+        order.append(i)
+
+    async def main():
+        release = asyncio.Event()
+        blocker = await lane.submit_async(release.wait)
+        tickets = [await lane.submit_async(append, i) for i in range(3)]
+        positions = [ticket.position() for ticket in tickets]
+        release.set()
+        await asyncio.gather(*[asyncio.wrap_future(ticket.future) for ticket in [blocker, *tickets]])
+        return positions
+
+    assert asyncio.run(main()) == [1, 2, 3]
+    assert order == [0, 1, 2]
+
+
+def test_wait_policy_times_out_when_queue_full():
+    """wait設定で空きが出ないままタイムアウトした場合にQueueFullErrorとなることをテスト"""
+    lane = ProviderLane("test", max_workers=1, max_queue_size=1, queue_policy="wait", queue_timeout=0.1)
+
+    async def main():
+        release = asyncio.Event()
+        await lane.submit_async(release.wait)
+        await lane.submit_async(release.wait)
+        await asyncio.sleep(0)
+        with pytest.raises(QueueFullError):
+            await lane.submit_async(release.wait)
+        release.set()
+
+    asyncio.run(main())
+
+
+def test_cancel_removes_waiting_ticket():
+    """実行前のチケットをキャンセルできることをテスト"""
+    lane = ProviderLane("test", max_workers=1, max_queue_size=10)
+
+    async def run():
+        return "実行された"
+
+    async def main():
+        release = asyncio.Event()
+        blocker = await lane.submit_async(release.wait)
+        ticket = await lane.submit_async(run)
+        await asyncio.sleep(0)
+        cancelled = ticket.cancel()
+        waiting = lane.get_status()["waiting"]
+        release.set()
+        await asyncio.wrap_future(blocker.future)
+        return cancelled, waiting, ticket
+
+    cancelled, waiting, ticket = asyncio.run(main())
+
+    assert cancelled is True
+    assert waiting == 0
+    assert ticket.future.cancelled()
+
+
+def test_scheduler_uses_lane_per_provider(reset_generation_scheduler):
+    """プロバイダごとに別の待ち行列が使われることをテスト"""
+    scheduler = GenerationScheduler.get_instance()
+
+    async def run():
+        return "ok"
+
+    async def main():
+        ticket = await scheduler.submit_async("openai", run)
+        return await asyncio.wrap_future(ticket.future)
+
+    assert scheduler.get_lane("claude") is scheduler.get_lane("claude")
+    assert scheduler.get_lane("claude") is not scheduler.get_lane("gemini")
+    assert asyncio.run(main()) == "ok"
+
+
+def test_submit_async_limits_concurrency_without_threads():
+    """コルーチンの投入でも同時実行数が制限され、FIFOで実行されることをテスト"""
+    lane = ProviderLane("test", max_workers=2, max_queue_size=10)
+    running = [0]
+    peak = [0]
+    order = []
+
+    async def job(i):
+        running[0] += 1
+        peak[0] = max(peak[0], running[0])
+        await asyncio.sleep(0.02)
+        order.append(i)
+        running[0] -= 1
+        return i
+
+    async def main():
+        tickets = [await lane.submit_async(job, i) for i in range(6)]
+        return await asyncio.gather(*[asyncio.wrap_future(ticket.future) for ticket in tickets])
+
+    assert asyncio.run(main()) == list(range(6))
+    assert peak[0] == 2
+    assert order[:2] == [0, 1]
+    assert lane.get_status() == {"waiting": 0, "active": 0}
+
+
+def test_submit_async_reject_policy():
+    """コルーチンの投入でもreject設定で待ち行列が満杯の場合にQueueFullErrorとなることをテスト"""
+    lane = ProviderLane("test", max_workers=1, max_queue_size=1, queue_policy="reject")
+
+    async def main():
+        release = asyncio.Event()
+        await lane.submit_async(release.wait)
+        await lane.submit_async(release.wait)
+        await asyncio.sleep(0)
+        with pytest.raises(QueueFullError):
+            await lane.submit_async(release.wait)
+        release.set()
+
+    asyncio.run(main())
+
+
+def test_borrow_workers_stays_within_max_workers():
+    """実行中のチケットが追加で確保するワーカーは空きの範囲のみで、待ち行列があれば確保しないことをテスト"""
+    lane = ProviderLane("test", max_workers=3, max_queue_size=10)
+
+    async def main():
+        release = asyncio.Event()
+        running = await lane.submit_async(release.wait)
+        await asyncio.sleep(0)
+        with lane.borrow_workers(5) as granted:
+            status = lane.get_status()
+            queued = await lane.submit_async(release.wait)
+            with lane.borrow_workers(1) as granted_while_queued:
+                pass
+        # 解放したワーカーで待ち行列のチケットが実行される
+        status_after_release = lane.get_status()
+        release.set()
+        await asyncio.gather(asyncio.wrap_future(running.future), asyncio.wrap_future(queued.future))
+        return granted, status, granted_while_queued, status_after_release
+
+    granted, status, granted_while_queued, status_after_release = asyncio.run(main())
+
+    assert granted == 2
+    assert status == {"waiting": 0, "active": 3}
+    assert granted_while_queued == 0
+    assert status_after_release == {"waiting": 0, "active": 2}
+    assert lane.get_status() == {"waiting": 0, "active": 0}
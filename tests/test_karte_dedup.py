@@ -0,0 +1,111 @@
+from unittest.mock import patch
+
+from services.summary_service import deduplicate_input
+from utils.karte_dedup import CHANGED_MARKER, MAX_CANDIDATES, OMITTED_MARKER, REMOVED_PREFIX, KarteDeduplicator
+
+
+def create_entry(date, days, vital="BT 36.8 BP 124/72 SpO2 97%(RA) 呼吸音清。", plan="ワーファリン内服継続。\n"):
+    return (f"{date}(月)　（入院 {days} 日目）\n"
+            "内科　　山田　太郎　　国保　　09:00\n"
+            "S >\n咳嗽は軽減している。食事は全量摂取。\n"
+            f"O >\n{vital}\n"
+            "A >\n肺炎は改善傾向。\n"
+            f"P >\n抗菌薬を継続し、明日採血で炎症反応を確認する。\n{plan}")
+
+
+def test_exact_duplicate_entry_is_omitted():
+    """前日と同じ記載は見出しを残して省略することをテスト"""
+    first = create_entry("2025/04/01", 1)
+    text = first + create_entry("2025/04/02", 2)
+
+    deduplicated, stats = KarteDeduplicator().deduplicate(text)
+
+    assert deduplicated == (first + "2025/04/02(月)　（入院 2 日目）\n"
+                            "内科　　山田　太郎　　国保　　09:00\n" + OMITTED_MARKER + "\n")
+    assert stats["removed_paragraphs"] == 1
+    assert stats["removed_chars"] == len(text) - len(deduplicated)
+    assert stats["removed_bytes"] == len(text.encode("utf-8")) - len(deduplicated.encode("utf-8"))
+
+
+def test_whitespace_differences_are_treated_as_duplicate():
+    """全角・半角や空白の違いのみの記載は同じものとして扱うことをテスト"""
+    text = create_entry("2025/04/01", 1) + create_entry("2025/04/02", 2).replace("BT 36.8", "ＢＴ　36.8")
+
+    deduplicated, stats = KarteDeduplicator().deduplicate(text)
+
+    assert stats["removed_paragraphs"] == 1
+    assert deduplicated.endswith(OMITTED_MARKER + "\n")
+
+
+def test_near_duplicate_keeps_changed_lines():
+    """ほぼ同じ記載は、変更された行とそのSOAPの見出しのみを残すことをテスト"""
+    text = create_entry("2025/04/01", 1) + create_entry("2025/04/02", 2, vital="BT 38.2 BP 124/72 SpO2 97%(RA) 呼吸音清。")
+
+    deduplicated, stats = KarteDeduplicator().deduplicate(text)
+
+    assert stats["removed_paragraphs"] == 1
+    assert deduplicated.endswith(f"{CHANGED_MARKER}\nO >\nBT 38.2 BP 124/72 SpO2 97%(RA) 呼吸音清。\n"
+                                 f"{REMOVED_PREFIX}BT 36.8 BP 124/72 SpO2 97%(RA) 呼吸音清。\n")
+
+
+def test_near_duplicate_keeps_removed_lines():
+    """以前の記載から削除された行（中止した処方など）は省略せず、削除された行として残すことをテスト"""
+    text = create_entry("2025/04/01", 1) + create_entry("2025/04/02", 2, plan="")
+
+    deduplicated, stats = KarteDeduplicator().deduplicate(text)
+
+    assert stats["removed_paragraphs"] == 1
+    assert OMITTED_MARKER not in deduplicated
+    assert deduplicated.endswith(f"{CHANGED_MARKER}\n{REMOVED_PREFIX}ワーファリン内服継続。\n")
+
+
+def test_only_recent_candidates_are_compared():
+    """類似度は直近の候補のみと比較し、段落数が増えても比較の回数が増えないことをテスト"""
+    common = "".join(f"検査{j}: 前回と著変なし。経過観察を継続する方針。\n" for j in range(15))
+    text = "".join(f"2025/04/{i % 28 + 1:02d}(月)　（入院 {i + 1} 日目）\n"
+                   + "".join(f"所見{i}-{k}: 値{(i * 7 + k) % 97}で推移。\n" for k in range(6)) + common
+                   for i in range(100))
+    deduplicator = KarteDeduplicator()
+    bucket_sizes = []
+
+    def find_similar(shingles, bands, paragraphs, buckets):
+        bucket_sizes.extend(len(bucket) for bucket in buckets.values())
+        return None
+
+    with patch.object(deduplicator, "find_similar", side_effect=find_similar):
+        deduplicator.deduplicate(text)
+
+    assert max(bucket_sizes) == MAX_CANDIDATES
+
+
+def test_different_entries_are_kept():
+    """内容が異なる記載や短い段落は省略しないことをテスト"""
+    text = (create_entry("2025/04/01", 1)
+            + "2025/04/02(火)　（入院 2 日目）\n内科　　山田　太郎　　国保　　10:00\n"
+            "S >\n腹痛あり。嘔気なし。排便は昨日から認めていない。\n")
+
+    deduplicated, stats = KarteDeduplicator().deduplicate(text)
+
+    assert deduplicated == text
+    assert stats["removed_paragraphs"] == 0
+
+
+@patch("services.summary_service.KARTE_DEDUP_ENABLED", True)
+def test_deduplicate_input_can_be_disabled_per_department():
+    """指定した診療科では省略しないことをテスト"""
+    text = create_entry("2025/04/01", 1) + create_entry("2025/04/02", 2)
+
+    deduplicated, dedup_usage = deduplicate_input(text, "内科", "claude")
+    assert deduplicated != text
+    assert dedup_usage["dedup_removed_paragraphs"] == 1
+    assert dedup_usage["dedup_removed_tokens"] > 0
+
+    with patch("services.summary_service.KARTE_DEDUP_DISABLED_DEPARTMENTS", ["内科"]):
+        assert deduplicate_input(text, "内科", "claude") == (text, {})
+
+
+def test_deduplicate_input_is_disabled_by_default():
+    """KARTE_DEDUP_ENABLEDを設定しない場合は省略しないことをテスト"""
+    text = create_entry("2025/04/01", 1) + create_entry("2025/04/02", 2)
+
+    assert deduplicate_input(text, "内科", "claude") == (text, {})
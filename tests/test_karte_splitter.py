@@ -0,0 +1,47 @@
+from utils.karte_splitter import split_karte
+
+
+def create_day(date, days, entries=1, body="発熱あり。抗菌薬を継続。\n"):
+    lines = [f"{date}(月)　（入院 {days} 日目）\n"]
+    for index in range(entries):
+        lines.append(f"内科　　山田　太郎　　国保　　{9 + index:02d}:00\n")
+        lines.append("S >\n")
+        lines.append(body)
+    return "".join(lines)
+
+
+def test_split_karte_keeps_days_together():
+    """日付の途中では区切らず、chunk_size以内にまとめることをテスト"""
+    days = [create_day(f"2025/04/{day:02d}", day) for day in range(1, 7)]
+    text = "".join(days)
+
+    chunks = split_karte(text, len(days[0]) * 2)
+
+    assert len(chunks) == 3
+    assert chunks[0]["text"] == days[0] + days[1]
+    assert chunks[0]["start_date"] == "2025/04/01"
+    assert chunks[0]["end_date"] == "2025/04/02"
+    assert "".join(chunk["text"] for chunk in chunks) == text
+
+
+def test_split_karte_splits_oversized_day_by_entry():
+    """1日分がchunk_sizeを超える場合は記載ごとに分割することをテスト"""
+    day = create_day("2025/04/01", 1, entries=4)
+
+    chunks = split_karte(day, len(day) // 2)
+
+    assert len(chunks) >= 2
+    assert all(chunk["start_date"] == "2025/04/01" for chunk in chunks)
+    assert "".join(chunk["text"] for chunk in chunks) == day
+    assert all(len(chunk["text"]) <= len(day) // 2 for chunk in chunks)
+
+
+def test_split_karte_without_dates():
+    """日付行がない場合は行単位で分割し、日付はNoneとなることをテスト"""
+    text = "経過良好。\n" * 100
+
+    chunks = split_karte(text, 100)
+
+    assert len(chunks) > 1
+    assert chunks[0]["start_date"] is None
+    assert "".join(chunk["text"] for chunk in chunks) == text
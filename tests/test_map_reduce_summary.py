@@ -0,0 +1,155 @@
+import asyncio
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from external_service.prompt_builder import MAP_SECTION, create_discharge_summary_prompt
+from services.generation_scheduler import ProviderLane
+from services.map_reduce_summary import MapReduceSummarizer, combine_outcomes, create_reduce_input
+from utils.exceptions import APIError
+
+CHUNKS = [
+    {"text": "2025/04/01(火)\n発熱\n", "start_date": "2025/04/01", "end_date": "2025/04/01"},
+    {"text": "2025/04/02(水)\n解熱\n", "start_date": "2025/04/02", "end_date": "2025/04/03"},
+]
+
+
+def create_outcome(text, model_name, input_tokens=10, output_tokens=5):
+    return {
+        "discharge_summary": text,
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens,
+        "cache_usage": {},
+        "model_name": model_name,
+        "model_detail": model_name,
+        "failover": False,
+        "retry_count": 0
+    }
+
+
+class FakeRouter:
+    """モデル名と入力を記録し、チャンクごとの要約を返すテスト用のルータ"""
+
+    def __init__(self, error=None):
+        self.error = error
+        self.calls = []
+        self.registry = MagicMock()
+        self.registry.is_model_available.return_value = True
+        self.running = 0
+        self.max_running = 0
+
+    def is_circuit_available(self, model_name):
+        return True
+
+    async def generate_async(self, model_name, input_text, selected_department, additional_info="",
+                             on_chunk=None, section=None):
+        self.calls.append((model_name, input_text, additional_info, section))
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        await asyncio.sleep(0.01)
+        self.running -= 1
+        if self.error and model_name == "Gemini_Flash":
+            raise self.error
+        return create_outcome(f"要約:{input_text.splitlines()[0]}", model_name)
+
+
+def test_split_only_long_input():
+    """閾値以下の入力や無効な場合は分割しないことをテスト"""
+    summarizer = MapReduceSummarizer(FakeRouter(), chunk_size=20, threshold=30, enabled=True)
+    text = "".join(chunk["text"] for chunk in CHUNKS) * 2
+
+    assert summarizer.split("発熱") is None
+    assert len(summarizer.split(text)) > 1
+    assert MapReduceSummarizer(FakeRouter(), chunk_size=20, threshold=30, enabled=False).split(text) is None
+
+
+def test_create_reduce_input_labels_periods():
+    """期間の見出しをつけて要約を連結することをテスト"""
+    reduce_input = create_reduce_input(CHUNKS, ["要約1", "要約2"])
+
+    assert reduce_input == "【2025/04/01の経過の要約】\n要約1\n\n【2025/04/02〜2025/04/03の経過の要約】\n要約2"
+
+
+def test_generate_async_maps_with_fast_model_and_reduces_with_selected_model():
+    """チャンクは高速なモデルで並列に要約し、選択したモデルでまとめることをテスト"""
+    router = FakeRouter()
+    summarizer = MapReduceSummarizer(router, map_model="Gemini_Flash", concurrency=1)
+
+    outcome = asyncio.run(summarizer.generate_async("Claude", CHUNKS, "default", "退院後は外来"))
+
+    assert [call[0] for call in router.calls] == ["Gemini_Flash", "Gemini_Flash", "Claude"]
+    assert router.calls[-1][1] == create_reduce_input(CHUNKS, ["要約:2025/04/01(火)", "要約:2025/04/02(水)"])
+    assert router.calls[-1][2] == "退院後は外来"
+    # チャンクには期間の経過要約のみを指示し、まとめる際は退院時サマリ全体を生成する
+    assert [call[3] for call in router.calls] == [MAP_SECTION, MAP_SECTION, None]
+    assert router.max_running == 1
+    assert outcome["model_detail"] == "Gemini_Flash / Claude"
+    assert outcome["input_tokens"] == 30
+    assert outcome["output_tokens"] == 15
+    assert outcome["chunk_count"] == 2
+    assert outcome["model_usage"] == [
+        {"model_detail": "Gemini_Flash", "requests": 2, "input_tokens": 20, "output_tokens": 10},
+        {"model_detail": "Claude", "requests": 1, "input_tokens": 10, "output_tokens": 5},
+    ]
+
+
+def test_combine_outcomes_merges_cache_usage_and_failover():
+    """チャンクの要約のキャッシュの利用量とフェイルオーバーも、まとめた結果に反映することをテスト"""
+    map_outcomes = [
+        {**create_outcome("要約1", "Gemini_Flash"), "cache_usage": {"cache_read_input_tokens": 100}},
+        {**create_outcome("要約2", "Gemini_Pro"), "failover": True},
+    ]
+    reduce_outcome = {**create_outcome("退院時サマリ", "Claude"), "cache_usage": {"cache_read_input_tokens": 50}}
+
+    outcome = combine_outcomes(map_outcomes, reduce_outcome)
+
+    assert outcome["discharge_summary"] == "退院時サマリ"
+    assert outcome["model_name"] == "Gemini_Flash / Gemini_Pro / Claude"
+    assert outcome["cache_usage"] == {"cache_read_input_tokens": 150}
+    assert outcome["failover"] is True
+
+
+@patch("external_service.prompt_builder.get_prompt_template", return_value="退院時サマリを作成")
+def test_map_prompt_asks_for_period_summary(mock_template):
+    """チャンクのプロンプトはカルテ情報の後に期間の経過要約のみを出力する指示を置くことをテスト"""
+    prompt = create_discharge_summary_prompt("発熱", "", "default", section=MAP_SECTION)
+
+    assert prompt.startswith("退院時サマリを作成\n\n【カルテ情報】\n発熱\n\n【作成する内容】")
+    assert "期間の経過要約のみ" in prompt
+    assert "の項目のみ" not in prompt
+
+
+def test_generate_async_without_free_workers_maps_sequentially():
+    """プロバイダの空きワーカーがない場合は、チケット自身のワーカーのみで1チャンクずつ要約することをテスト"""
+    lane = ProviderLane("claude", max_workers=1, max_queue_size=10)
+    router = FakeRouter()
+    summarizer = MapReduceSummarizer(router, map_model="Gemini_Flash", concurrency=4, lane=lane)
+
+    async def main():
+        ticket = await lane.submit_async(summarizer.generate_async, "Claude", CHUNKS, "default")
+        return await asyncio.wrap_future(ticket.future)
+
+    outcome = asyncio.run(main())
+
+    assert router.max_running == 1
+    assert outcome["chunk_count"] == 2
+
+
+def test_generate_async_raises_first_chunk_error():
+    """チャンクの要約が失敗した場合はそのエラーを返すことをテスト"""
+    summarizer = MapReduceSummarizer(FakeRouter(error=APIError("503 UNAVAILABLE")), map_model="Gemini_Flash")
+
+    with pytest.raises(APIError, match="503"):
+        asyncio.run(summarizer.generate_async("Claude", CHUNKS, "default"))
+
+
+def test_generate_uses_selected_model_when_map_model_unavailable():
+    """高速なモデルが利用できない場合は選択したモデルで要約することをテスト"""
+    router = FakeRouter()
+    router.registry.is_model_available.return_value = False
+    summarizer = MapReduceSummarizer(router, map_model="Gemini_Flash")
+
+    outcome = asyncio.run(summarizer.generate_async("Claude", CHUNKS, "default"))
+
+    assert [call[0] for call in router.calls] == ["Claude", "Claude", "Claude"]
+    assert outcome["chunk_count"] == 2
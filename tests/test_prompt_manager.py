@@ -7,10 +7,18 @@ from utils.prompt_manager import (
     insert_document, update_document, initialize_departments, get_all_departments,
     create_department, delete_department, initialize_default_prompt,
     get_prompt_by_department, get_all_prompts, create_or_update_prompt,
-    delete_prompt, initialize_database
+    delete_prompt, initialize_database, PromptCache
 )
 
 
+@pytest.fixture(autouse=True)
+def reset_prompt_cache():
+    """各テストでプロンプトキャッシュを初期化し、バージョン管理コレクションをモック"""
+    with patch('utils.prompt_manager._prompt_cache', PromptCache(poll_interval=0)), \
+            patch('utils.prompt_manager.get_cache_version_collection') as mock_version_collection:
+        yield mock_version_collection
+
+
 @pytest.fixture
 def mock_db_connection():
     """MongoDB接続のモック"""
@@ -288,30 +296,100 @@ def test_get_prompt_by_department_exists(mock_prompt_collection):
         "name": "内科プロンプト",
         "content": "内科用の内容"
     }
-    mock_prompt_collection.find_one.return_value = expected_prompt
+    mock_prompt_collection.find.return_value = [expected_prompt]
 
     result = get_prompt_by_department("内科")
 
     assert result == expected_prompt
-    mock_prompt_collection.find_one.assert_called_once_with({"department": "内科"})
+    mock_prompt_collection.find.assert_called_once_with()
 
 
 def test_get_prompt_by_department_fallback(mock_prompt_collection):
     """診療科プロンプト取得のテスト（存在しない場合のフォールバック）"""
     # 指定した診療科のプロンプトが存在しない→デフォルトにフォールバック
-    mock_prompt_collection.find_one.side_effect = [
-        None,  # 最初の呼び出し（指定診療科）の結果
-        {"department": "default", "content": "デフォルト内容"}  # 2回目の呼び出し（デフォルト）の結果
+    mock_prompt_collection.find.return_value = [
+        {"department": "default", "content": "デフォルト内容", "is_default": True},
+        {"department": "内科", "content": "内科用の内容", "is_default": False}
     ]
 
     result = get_prompt_by_department("存在しない科")
 
     assert result["department"] == "default"
     assert result["content"] == "デフォルト内容"
-    assert mock_prompt_collection.find_one.call_count == 2
-    # 1回目と2回目の呼び出し引数を確認
-    assert mock_prompt_collection.find_one.call_args_list[0][0][0] == {"department": "存在しない科"}
-    assert mock_prompt_collection.find_one.call_args_list[1][0][0] == {"department": "default", "is_default": True}
+
+
+def test_get_prompt_by_department_uses_cache(mock_prompt_collection):
+    """2回目以降の取得でDBにアクセスしないことをテスト"""
+    mock_prompt_collection.find.return_value = [{"department": "内科", "content": "内科用の内容"}]
+
+    get_prompt_by_department("内科")
+    get_prompt_by_department("内科")
+    get_prompt_by_department("外科")
+
+    mock_prompt_collection.find.assert_called_once()
+    mock_prompt_collection.find_one.assert_not_called()
+
+
+def test_create_or_update_prompt_invalidates_cache(mock_prompt_collection, reset_prompt_cache):
+    """プロンプト更新後にキャッシュが再読み込みされることをテスト"""
+    mock_prompt_collection.find.return_value = [{"department": "内科", "content": "旧内容"}]
+    assert get_prompt_by_department("内科")["content"] == "旧内容"
+
+    mock_prompt_collection.find_one.return_value = {"department": "内科"}
+    create_or_update_prompt("内科", "内科プロンプト", "新内容")
+    mock_prompt_collection.find.return_value = [{"department": "内科", "content": "新内容"}]
+
+    assert get_prompt_by_department("内科")["content"] == "新内容"
+    reset_prompt_cache.return_value.update_one.assert_called_once_with(
+        {"_id": "prompts"}, {"$inc": {"version": 1}}, upsert=True
+    )
+
+
+def test_prompt_cache_reloads_when_version_changes(mock_prompt_collection, reset_prompt_cache):
+    """他プロセスでバージョンが更新された場合に再読み込みされることをテスト"""
+    version_collection = reset_prompt_cache.return_value
+    version_collection.find_one.return_value = {"_id": "prompts", "version": 1}
+    mock_prompt_collection.find.return_value = [{"department": "内科", "content": "旧内容"}]
+    cache = PromptCache(poll_interval=0.01)
+
+    assert cache.get("内科")["content"] == "旧内容"
+
+    version_collection.find_one.return_value = {"_id": "prompts", "version": 2}
+    mock_prompt_collection.find.return_value = [{"department": "内科", "content": "新内容"}]
+    with patch('utils.prompt_manager.time.monotonic', return_value=10 ** 9):
+        assert cache.get("内科")["content"] == "新内容"
+
+
+def test_prompt_cache_reloads_after_max_age(mock_prompt_collection):
+    """バージョンが更新されない直接の編集も、max_age秒経過後に反映されることをテスト"""
+    mock_prompt_collection.find.return_value = [{"department": "内科", "content": "旧内容"}]
+    cache = PromptCache(poll_interval=0, max_age=60)
+
+    assert cache.get("内科")["content"] == "旧内容"
+
+    mock_prompt_collection.find.return_value = [{"department": "内科", "content": "新内容"}]
+    assert cache.get("内科")["content"] == "旧内容"
+    with patch('utils.prompt_manager.time.monotonic', return_value=10 ** 9):
+        assert cache.get("内科")["content"] == "新内容"
+
+
+def test_prompt_cache_queries_mongodb_without_lock(mock_prompt_collection):
+    """MongoDBへの問い合わせ中はロックを保持せず、再読み込みに失敗した場合は手元の内容を使うことをテスト"""
+    cache = PromptCache(poll_interval=0, max_age=60)
+    locked = []
+
+    def find():
+        locked.append(cache._lock.locked())
+        if len(locked) > 1:
+            raise Exception("接続エラー")
+        return [{"department": "内科", "content": "内科用の内容"}]
+
+    mock_prompt_collection.find.side_effect = find
+
+    assert cache.get("内科")["content"] == "内科用の内容"
+    with patch('utils.prompt_manager.time.monotonic', return_value=10 ** 9):
+        assert cache.get("内科")["content"] == "内科用の内容"
+    assert locked == [False, False]
 
 
 def test_get_all_prompts(mock_prompt_collection):
@@ -0,0 +1,123 @@
+import asyncio
+from types import SimpleNamespace
+
+from unittest.mock import patch, MagicMock, AsyncMock
+
+from external_service.claude_api import claude_stream_discharge_summary_async
+from external_service.gemini_api import gemini_stream_discharge_summary_async
+from external_service.gemini_context_cache import GeminiContextCache
+from external_service.openai_api import openai_stream_discharge_summary_async
+
+
+async def iterate(items):
+    for item in items:
+        yield item
+
+
+def collect_events(stream):
+    async def main():
+        return [event async for event in stream]
+
+    return asyncio.run(main())
+
+
+def create_claude_client(texts, usage):
+    """messages.stream()のコンテキストマネージャを再現したクライアント"""
+    stream = MagicMock()
+    stream.text_stream = iterate(texts)
+    stream.get_final_message = AsyncMock(return_value=SimpleNamespace(usage=usage))
+    stream_manager = MagicMock()
+    stream_manager.__aenter__ = AsyncMock(return_value=stream)
+    stream_manager.__aexit__ = AsyncMock(return_value=False)
+    client = MagicMock()
+    client.messages.stream.return_value = stream_manager
+    return client
+
+
+@patch('external_service.claude_api.CLAUDE_API_KEY', "test_api_key")
+@patch('external_service.claude_api.create_message_params')
+@patch('external_service.claude_api.get_async_anthropic_client')
+def test_claude_stream_emits_deltas_and_cache_usage(mock_get_client, mock_create_params):
+    """Claudeのテキスト差分を順に返し、最後にキャッシュ分を含めた使用量を返すことをテスト"""
+    usage = SimpleNamespace(input_tokens=100, output_tokens=50, cache_read_input_tokens=800,
+                            cache_creation_input_tokens=200)
+    client = create_claude_client(["入院期間:", "2023年1月1日"], usage)
+    mock_get_client.return_value = client
+    mock_create_params.return_value = {"messages": [{"role": "user", "content": "カルテ"}]}
+
+    events = collect_events(claude_stream_discharge_summary_async("カルテ", model_name="claude-test", max_tokens=300))
+
+    assert events == [
+        {"type": "delta", "text": "入院期間:"},
+        {"type": "delta", "text": "2023年1月1日"},
+        {"type": "usage", "input_tokens": 1100, "output_tokens": 50,
+         "cache_read_input_tokens": 800, "cache_creation_input_tokens": 200},
+    ]
+    assert client.messages.stream.call_args.kwargs["model"] == "claude-test"
+    assert client.messages.stream.call_args.kwargs["max_tokens"] == 300
+
+
+def create_openai_chunk(content=None, usage=None):
+    choices = [SimpleNamespace(delta=SimpleNamespace(content=content))] if content is not None else []
+    return SimpleNamespace(choices=choices, usage=usage)
+
+
+@patch('external_service.openai_api.OPENAI_API_KEY', "test_api_key")
+@patch('external_service.openai_api.create_discharge_summary_prompt')
+@patch('external_service.openai_api.get_async_openai_client')
+def test_openai_stream_reads_usage_from_last_chunk(mock_get_client, mock_create_prompt):
+    """OpenAIは使用量を含める指定で送信し、choicesが空の最後のチャンクから使用量を取得することをテスト"""
+    chunks = [
+        create_openai_chunk("入院期間:"),
+        create_openai_chunk(""),
+        create_openai_chunk("2023年1月1日"),
+        create_openai_chunk(usage=SimpleNamespace(prompt_tokens=120, completion_tokens=30)),
+    ]
+    client = MagicMock()
+    client.chat.completions.create = AsyncMock(return_value=iterate(chunks))
+    mock_get_client.return_value = client
+    mock_create_prompt.return_value = "プロンプト"
+
+    events = collect_events(openai_stream_discharge_summary_async("カルテ", model_name="gpt-test"))
+
+    assert events == [
+        {"type": "delta", "text": "入院期間:"},
+        {"type": "delta", "text": "2023年1月1日"},
+        {"type": "usage", "input_tokens": 120, "output_tokens": 30},
+    ]
+    kwargs = client.chat.completions.create.call_args.kwargs
+    assert kwargs["stream"] is True
+    assert kwargs["stream_options"] == {"include_usage": True}
+
+
+def create_gemini_chunk(text=None, usage_metadata=None):
+    return SimpleNamespace(text=text, usage_metadata=usage_metadata)
+
+
+@patch('external_service.gemini_api.create_discharge_summary_prompt_parts')
+@patch('external_service.gemini_api.initialize_gemini')
+def test_gemini_stream_emits_deltas_and_cached_tokens(mock_initialize, mock_create_parts):
+    """Geminiのテキスト差分を順に返し、累積値で届く使用量とキャッシュ読み込み分を最後に返すことをテスト"""
+    chunks = [
+        create_gemini_chunk("入院期間:", SimpleNamespace(prompt_token_count=900, candidates_token_count=5,
+                                                      cached_content_token_count=700)),
+        create_gemini_chunk("2023年1月1日", SimpleNamespace(prompt_token_count=900, candidates_token_count=40,
+                                                        cached_content_token_count=None)),
+    ]
+    client = MagicMock()
+    client.aio.models.generate_content_stream = AsyncMock(return_value=iterate(chunks))
+    client.aio.caches.create = AsyncMock(return_value=SimpleNamespace(name="cachedContents/1"))
+    mock_initialize.return_value = client
+    mock_create_parts.return_value = ("プロンプト", "カルテ")
+
+    with patch.object(GeminiContextCache, "_instance", GeminiContextCache(enabled=True)):
+        events = collect_events(gemini_stream_discharge_summary_async("カルテ", model_name="gemini-test"))
+
+    assert events == [
+        {"type": "delta", "text": "入院期間:"},
+        {"type": "delta", "text": "2023年1月1日"},
+        {"type": "usage", "input_tokens": 900, "output_tokens": 40, "cache_read_input_tokens": 700},
+    ]
+    kwargs = client.aio.models.generate_content_stream.call_args.kwargs
+    assert kwargs["model"] == "gemini-test"
+    assert kwargs["config"].cached_content == "cachedContents/1"
@@ -0,0 +1,98 @@
+import asyncio
+import time
+
+from services.rate_limiter import RateLimiter, TokenBucket
+
+MODEL = {"name": "Claude", "provider": "claude", "model": "claude-test"}
+
+
+def test_token_bucket_refills_per_second():
+    """1分あたりの上限に応じて毎秒補充され、不足分の待ち時間を返すことをテスト"""
+    bucket = TokenBucket(60)
+    now = bucket.updated_at
+
+    assert bucket.get_wait(60, now) == 0
+    bucket.consume(60)
+    assert bucket.get_wait(1, now) == 1
+    assert bucket.get_wait(1, now + 1) == 0
+    # 上限を超える量は満杯になれば消費できる
+    assert bucket.get_wait(1000, now + 1) == 59
+
+
+def test_token_bucket_adjust_creates_debt():
+    """実際の使用量が見積もりを上回った分は以降の待ち時間に反映されることをテスト"""
+    bucket = TokenBucket(60)
+    now = bucket.updated_at
+    bucket.consume(30)
+
+    bucket.adjust(60)
+
+    assert bucket.tokens == -30
+    assert bucket.get_wait(1, now) == 31
+
+
+def test_unlimited_model_does_not_wait():
+    """制限が設定されていないモデルは待機しないことをテスト"""
+    limiter = RateLimiter(default_rpm=0, default_tpm=0)
+
+    asyncio.run(limiter.acquire_async(MODEL, 1_000_000))
+
+    assert limiter._buckets == {}
+
+
+def test_requests_wait_instead_of_failing():
+    """RPMの上限に達したリクエストはエラーにならず、補充されるまで待機することをテスト"""
+    limiter = RateLimiter(default_rpm=600, default_tpm=0)
+    bucket = limiter.get_buckets(MODEL)["requests"]
+    bucket.tokens = 1
+
+    async def main():
+        start = time.monotonic()
+        await limiter.acquire_async(MODEL, 0)
+        await limiter.acquire_async(MODEL, 0)
+        return time.monotonic() - start
+
+    # 600回/分は0.1秒に1回の補充
+    assert asyncio.run(main()) >= 0.09
+
+
+def test_model_limits_override_defaults():
+    """モデル定義のrpm・tpmが既定値より優先されることをテスト"""
+    limiter = RateLimiter(default_rpm=100, default_tpm=1000)
+
+    buckets = limiter.get_buckets({**MODEL, "model": "other", "tpm": 0})
+
+    assert buckets["requests"].capacity == 100
+    assert buckets["tokens"] is None
+
+
+def test_record_usage_adjusts_token_bucket():
+    """応答後に実際の使用量との差分がTPMに反映されることをテスト"""
+    limiter = RateLimiter(default_rpm=0, default_tpm=6000)
+    asyncio.run(limiter.acquire_async(MODEL, 1000))
+
+    limiter.record_usage(MODEL, 1000, 3000)
+
+    assert round(limiter.get_buckets(MODEL)["tokens"].tokens, -1) == 3000
+
+
+def test_waiters_are_served_in_order():
+    """待機中のリクエストが到着順に処理されることをテスト"""
+    limiter = RateLimiter(default_rpm=0, default_tpm=6000)
+    limiter.get_buckets(MODEL)["tokens"].tokens = 0
+    order = []
+
+    async def worker(i):
+        await limiter.acquire_async(MODEL, 10)
+        order.append(i)
+
+    async def main():
+        tasks = []
+        for i in range(3):
+            tasks.append(asyncio.create_task(worker(i)))
+            await asyncio.sleep(0.02)
+        await asyncio.wait_for(asyncio.gather(*tasks), timeout=5)
+
+    asyncio.run(main())
+
+    assert order == [0, 1, 2]
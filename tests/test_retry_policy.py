@@ -0,0 +1,116 @@
+import asyncio
+import datetime
+
+import anthropic
+import httpx
+import pytest
+from unittest.mock import AsyncMock, patch
+
+from services.retry_policy import RetryPolicy, get_retry_info, parse_retry_after
+from utils.exceptions import APIError
+
+
+def create_status_error(status_code, headers=None):
+    request = httpx.Request("POST", "https://api.anthropic.com/v1/messages")
+    response = httpx.Response(status_code, headers=headers or {}, request=request)
+    return anthropic.APIStatusError("エラー", response=response, body=None)
+
+
+def wrap_error(error):
+    """プロバイダ関数と同様に元の例外をAPIErrorで包む"""
+    try:
+        raise error
+    except Exception as e:
+        try:
+            raise APIError(f"Claude APIでエラーが発生しました: {str(e)}")
+        except APIError as wrapped:
+            return wrapped
+
+
+def test_parse_retry_after_headers():
+    """Retry-Afterとレート制限の解除時刻を秒数に変換するテスト"""
+    now = datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc)
+
+    assert parse_retry_after({"retry-after": "3"}) == 3
+    assert parse_retry_after({"retry-after-ms": "1500"}) == 1.5
+    assert parse_retry_after({"retry-after": "Wed, 01 Jan 2025 00:00:10 GMT"}, now) == 10
+    assert parse_retry_after({"x-ratelimit-reset-requests": "1m30s", "x-ratelimit-reset-tokens": "500ms"}) == 90
+    assert parse_retry_after({"anthropic-ratelimit-requests-reset": "2025-01-01T00:00:05Z"}, now) == 5
+    assert parse_retry_after({}) is None
+
+
+def test_get_retry_info_follows_wrapped_error():
+    """APIErrorに包まれた元の例外からステータスとRetry-Afterを取得するテスト"""
+    assert get_retry_info(wrap_error(create_status_error(429, {"retry-after": "2"}))) == (True, 2)
+    assert get_retry_info(wrap_error(create_status_error(503))) == (True, None)
+    assert get_retry_info(wrap_error(create_status_error(400))) == (False, None)
+    assert get_retry_info(APIError("OpenAI APIでエラーが発生しました: insufficient_quota")) == (False, None)
+    assert get_retry_info(APIError("認証情報が設定されていません")) == (False, None)
+
+
+def test_call_async_retries_and_returns_retry_count():
+    """一時的なエラーの後に成功した場合、結果と再試行回数を返すテスト"""
+    policy = RetryPolicy(max_attempts=3, base_delay=1, max_delay=10, deadline=60)
+    calls = []
+
+    async def func():
+        calls.append(1)
+        if len(calls) < 3:
+            raise wrap_error(create_status_error(503))
+        return "成功"
+
+    with patch('services.retry_policy.asyncio.sleep', new_callable=AsyncMock) as mock_sleep:
+        assert asyncio.run(policy.call_async(func)) == ("成功", 2)
+
+    assert mock_sleep.call_count == 2
+    # フルジッターのため待機時間は0からbase_delay * 2^nの範囲
+    assert 0 <= mock_sleep.call_args_list[0].args[0] <= 1
+    assert 0 <= mock_sleep.call_args_list[1].args[0] <= 2
+
+
+def test_call_async_waits_at_least_retry_after():
+    """Retry-Afterが指定された場合はその秒数以上待機するテスト"""
+    policy = RetryPolicy(max_attempts=2, base_delay=0.1, max_delay=10, deadline=60)
+    errors = [wrap_error(create_status_error(429, {"retry-after": "5"}))]
+
+    async def func():
+        if errors:
+            raise errors.pop()
+        return "成功"
+
+    with patch('services.retry_policy.asyncio.sleep', new_callable=AsyncMock) as mock_sleep:
+        asyncio.run(policy.call_async(func))
+
+    mock_sleep.assert_called_once_with(5)
+
+
+def test_call_async_gives_up_at_max_attempts_and_deadline():
+    """試行回数の上限、または待機が期限を超える場合は再試行しないテスト"""
+    async def func():
+        raise wrap_error(create_status_error(503))
+
+    with patch('services.retry_policy.asyncio.sleep', new_callable=AsyncMock) as mock_sleep:
+        with pytest.raises(APIError):
+            asyncio.run(RetryPolicy(max_attempts=3, base_delay=0, deadline=60).call_async(func))
+        assert mock_sleep.call_count == 2
+
+    async def rate_limited():
+        raise wrap_error(create_status_error(429, {"retry-after": "120"}))
+
+    with patch('services.retry_policy.asyncio.sleep', new_callable=AsyncMock) as mock_sleep:
+        with pytest.raises(APIError):
+            asyncio.run(RetryPolicy(max_attempts=3, deadline=60).call_async(rate_limited))
+        mock_sleep.assert_not_called()
+
+
+def test_call_async_does_not_retry_non_retryable_error():
+    """400などの再試行しても解消しないエラーはそのまま送出するテスト"""
+    calls = []
+
+    async def func():
+        calls.append(1)
+        raise wrap_error(create_status_error(400))
+
+    with pytest.raises(APIError):
+        asyncio.run(RetryPolicy(max_attempts=3).call_async(func))
+    assert len(calls) == 1
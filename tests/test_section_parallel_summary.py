@@ -0,0 +1,155 @@
+import asyncio
+from unittest.mock import patch
+
+import pytest
+
+from external_service.claude_api import create_message_params
+from services.generation_scheduler import ProviderLane
+from services.section_parallel_summary import SectionParallelSummarizer, combine_section_outcomes, \
+    extract_section_content
+from utils.constants import DEFAULT_SECTION_NAMES
+from utils.exceptions import APIError
+from utils.text_processor import SECTION_ALIASES, SECTION_HEADERS, parse_discharge_summary
+
+
+class FakeRouter:
+    """項目ごとに「項目名:本文」を返し、同時に実行中のリクエスト数を記録するテスト用のルータ"""
+
+    def __init__(self, error_section=None):
+        self.error_section = error_section
+        self.calls = []
+        self.running = 0
+        self.max_running = 0
+
+    async def generate_async(self, selected_model, input_text, selected_department, additional_info="",
+                             on_chunk=None, section=None):
+        self.calls.append(section)
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        await asyncio.sleep(0.01)
+        self.running -= 1
+        if section == self.error_section:
+            raise APIError("503 UNAVAILABLE")
+        return {
+            "discharge_summary": f"{section}: {section}の内容",
+            "input_tokens": 100,
+            "output_tokens": 10,
+            "cache_usage": {"cache_read_input_tokens": 90},
+            "model_name": selected_model,
+            "model_detail": selected_model,
+            "failover": False,
+            "retry_count": 0
+        }
+
+
+def test_extract_section_content():
+    """応答の先頭の項目名を除くことをテスト"""
+    assert extract_section_content("現病歴", "現病歴: 発熱で受診") == "発熱で受診"
+    assert extract_section_content("現病歴", "現病歴：発熱で受診") == "発熱で受診"
+    assert extract_section_content("現病歴", "発熱で受診") == "発熱で受診"
+
+
+def test_combine_section_outcomes_records_every_model():
+    """項目ごとに異なるモデルで生成した場合は、使用したすべてのモデルを項目の順に記録することをテスト"""
+    outcomes = [
+        {"discharge_summary": f"{section}:内容", "input_tokens": 100, "output_tokens": 10, "cache_usage": {},
+         "model_name": model, "model_detail": f"{model.lower()}-test", "failover": model != "Claude",
+         "retry_count": 0}
+        for section, model in zip(DEFAULT_SECTION_NAMES[:3], ["Claude", "Gemini_Pro", "Claude"])
+    ]
+
+    outcome = combine_section_outcomes(DEFAULT_SECTION_NAMES[:3], outcomes)
+
+    assert outcome["model_name"] == "Claude / Gemini_Pro"
+    assert outcome["model_detail"] == "claude-test / gemini_pro-test"
+    assert outcome["model_usage"] == [
+        {"model_detail": "claude-test", "requests": 2, "input_tokens": 200, "output_tokens": 20},
+        {"model_detail": "gemini_pro-test", "requests": 1, "input_tokens": 100, "output_tokens": 10},
+    ]
+    assert outcome["failover"] is True
+
+
+def test_generate_async_assembles_sections_in_order():
+    """項目ごとに同時に生成し、項目の順に組み立ててトークン数を合計することをテスト"""
+    router = FakeRouter()
+    chunks = []
+    summarizer = SectionParallelSummarizer(router, enabled=True)
+
+    outcome = asyncio.run(summarizer.generate_async("Claude", "カルテ", "default", on_chunk=chunks.append))
+
+    assert outcome["discharge_summary"] == "\n".join(f"{section}:{section}の内容" for section in DEFAULT_SECTION_NAMES)
+    assert outcome["input_tokens"] == 100 * len(DEFAULT_SECTION_NAMES)
+    assert outcome["cache_usage"]["cache_read_input_tokens"] == 90 * len(DEFAULT_SECTION_NAMES)
+    assert outcome["section_count"] == len(DEFAULT_SECTION_NAMES)
+    assert outcome["model_detail"] == "Claude"
+    assert len(chunks) == len(DEFAULT_SECTION_NAMES)
+    # 最初の項目を生成してから残りを同時に送信する
+    assert router.calls[0] == DEFAULT_SECTION_NAMES[0]
+    assert router.max_running == len(DEFAULT_SECTION_NAMES) - 1
+
+
+def test_generate_async_outputs_every_parsed_section():
+    """組み立てたサマリーに、解析で認識するすべての項目が含まれることをテスト"""
+    summarizer = SectionParallelSummarizer(FakeRouter(), enabled=True)
+
+    outcome = asyncio.run(summarizer.generate_async("Claude", "カルテ", "default"))
+
+    parsed = parse_discharge_summary(outcome["discharge_summary"])
+    recognized_sections = {SECTION_ALIASES.get(header, header) for header in SECTION_HEADERS}
+    assert "禁忌/アレルギー" in recognized_sections
+    assert [section for section in recognized_sections if not parsed[section]] == []
+
+
+def test_generate_async_raises_section_error():
+    """いずれかの項目が失敗した場合はそのエラーを返すことをテスト"""
+    summarizer = SectionParallelSummarizer(FakeRouter(error_section="備考"), enabled=True)
+
+    with pytest.raises(APIError, match="503"):
+        asyncio.run(summarizer.generate_async("Claude", "カルテ", "default"))
+
+
+def test_generate_async_respects_concurrency():
+    """同時に送信するリクエスト数がconcurrencyを超えず、すべての項目を生成することをテスト"""
+    router = FakeRouter()
+    summarizer = SectionParallelSummarizer(router, concurrency=2, warmup=False, enabled=True)
+
+    outcome = asyncio.run(summarizer.generate_async("Claude", "カルテ", "default"))
+
+    assert sorted(router.calls) == sorted(DEFAULT_SECTION_NAMES)
+    assert router.max_running == 2
+    assert outcome["output_tokens"] == 10 * len(DEFAULT_SECTION_NAMES)
+
+
+def test_generate_async_uses_only_free_workers_of_lane():
+    """プロバイダの同時生成数のうち、他のチケットが使用していない空きワーカーの範囲でのみ同時に送信することをテスト"""
+    lane = ProviderLane("claude", max_workers=3, max_queue_size=10)
+    router = FakeRouter()
+
+    async def main():
+        release = asyncio.Event()
+        other = await lane.submit_async(release.wait)
+        summarizer = SectionParallelSummarizer(router, warmup=False, enabled=True, lane=lane)
+        ticket = await lane.submit_async(summarizer.generate_async, "Claude", "カルテ", "default")
+        outcome = await asyncio.wrap_future(ticket.future)
+        release.set()
+        await asyncio.wrap_future(other.future)
+        return outcome
+
+    outcome = asyncio.run(main())
+
+    # 他のチケットが1つ使用しているため、自身のワーカーと空きの1つで同時に2件まで送信する
+    assert router.max_running == 2
+    assert outcome["section_count"] == len(DEFAULT_SECTION_NAMES)
+    assert lane.get_status() == {"waiting": 0, "active": 0}
+
+
+@patch("external_service.claude_api.CLAUDE_PROMPT_CACHE", True)
+@patch("external_service.prompt_builder.get_prompt_template", return_value="退院時サマリを作成")
+def test_claude_section_request_caches_karte(mock_template):
+    """項目ごとのリクエストではカルテ情報の後にキャッシュの区切りを置き、項目の指示を続けることをテスト"""
+    params = create_message_params("発熱", "", "default", section="現病歴")
+
+    content = params["messages"][0]["content"]
+    assert content[0] == {"type": "text", "text": "【カルテ情報】\n発熱", "cache_control": {"type": "ephemeral"}}
+    assert "「現病歴」の項目のみ" in content[1]["text"]
+    assert "cache_control" not in content[1]
@@ -0,0 +1,48 @@
+import flet as ft
+import pandas as pd
+
+from ui_components.stats_table import create_stats_table, format_stats_rows, format_total_row
+
+
+def create_stats(days):
+    return pd.DataFrame({
+        "date_str": [f"2025-01-{day + 1:02d}" for day in range(days)],
+        "count": [2] * days,
+        "input_tokens": [12000] * days,
+        "output_tokens": [1500] * days,
+        "total_tokens": [13500] * days,
+        "processing_time": [12.5] * days,
+    })
+
+
+def test_format_stats_rows_and_total():
+    """各行のセルと合計行を以前の表と同じ書式で整形することをテスト"""
+    stats = create_stats(2)
+
+    assert format_stats_rows(stats, "date_str")[0] == ("2025-01-01", "2", "12,000", "1,500", "13,500", "12.5秒")
+    assert format_total_row(stats) == ("合計/平均", "4", "24,000", "3,000", "27,000", "12.5秒")
+
+
+def test_single_page_has_no_pager():
+    """1ページに収まる場合はページ送りを付けず、全行と合計行を表示することをテスト"""
+    table = create_stats_table(create_stats(3), "date_str", "日付", page_size=10)
+
+    assert isinstance(table, ft.DataTable)
+    assert len(table.rows) == 4
+
+
+def test_pages_show_only_current_rows():
+    """複数ページの場合は表示するページの行と全体の合計行のみ作成することをテスト"""
+    pages = []
+    content = create_stats_table(create_stats(25), "date_str", "日付", page_index=2, page_size=10,
+                                 on_page_change=pages.append)
+
+    table, pager = content.controls
+    assert len(table.rows) == 6
+    assert table.rows[0].cells[0].content.value == "2025-01-21"
+    assert table.rows[-1].cells[1].content.value == "50"
+    assert pager.controls[1].value == "21～25件 / 25件"
+    assert pager.controls[2].disabled
+
+    pager.controls[0].on_click(None)
+    assert pages == [1]
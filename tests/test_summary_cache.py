@@ -0,0 +1,103 @@
+import pytest
+from unittest.mock import patch, MagicMock
+
+from pymongo.errors import OperationFailure
+
+from services.summary_cache import SummaryCache, build_cache_key
+
+
+def test_build_cache_key_changes_with_inputs():
+    """キーの構成要素が1つでも異なれば別のキーになることをテスト"""
+    base = build_cache_key("テンプレート", "内科", "claude-test", "カルテ", "")
+
+    assert base == build_cache_key("テンプレート", "内科", "claude-test", "カルテ", None)
+    assert base != build_cache_key("テンプレート改", "内科", "claude-test", "カルテ", "")
+    assert base != build_cache_key("テンプレート", "外科", "claude-test", "カルテ", "")
+    assert base != build_cache_key("テンプレート", "内科", "gpt-test", "カルテ", "")
+    assert base != build_cache_key("テンプレート", "内科", "claude-test", "カルテ2", "")
+    assert base != build_cache_key("テンプレート", "内科", "claude-test", "カルテ", "追加")
+
+
+def test_memory_cache_evicts_least_recently_used():
+    """メモリキャッシュが上限を超えた場合に最も古いエントリが削除されることをテスト"""
+    cache = SummaryCache(max_entries=2, use_mongodb=False)
+
+    cache.set("a", {"discharge_summary": "A"})
+    cache.set("b", {"discharge_summary": "B"})
+    cache.get("a")
+    cache.set("c", {"discharge_summary": "C"})
+
+    assert cache.get("a") == {"discharge_summary": "A"}
+    assert cache.get("b") is None
+    assert cache.get("c") == {"discharge_summary": "C"}
+
+
+def test_set_stores_only_result_fields():
+    """成功フラグなど結果以外の項目はキャッシュに保存されないことをテスト"""
+    cache = SummaryCache(max_entries=2, use_mongodb=False)
+
+    cache.set("a", {"success": True, "discharge_summary": "A", "input_tokens": 10})
+
+    assert cache.get("a") == {"discharge_summary": "A", "input_tokens": 10}
+
+
+@patch('services.summary_cache.get_summary_cache_collection')
+def test_mongodb_tier_is_used_on_memory_miss(mock_get_collection):
+    """メモリにない場合はMongoDBから取得し、メモリに昇格することをテスト"""
+    mock_collection = MagicMock()
+    mock_collection.index_information.return_value = {}
+    mock_collection.find_one.return_value = {"result": {"discharge_summary": "DB"}}
+    mock_get_collection.return_value = mock_collection
+    cache = SummaryCache(max_entries=2, use_mongodb=True, ttl=3600)
+
+    assert cache.get("key") == {"discharge_summary": "DB"}
+    assert cache.get_from_memory("key") == {"discharge_summary": "DB"}
+    mock_collection.create_index.assert_called_once_with("created_at", expireAfterSeconds=3600)
+    mock_collection.find_one.assert_called_once()
+
+
+@patch('services.summary_cache.get_summary_cache_collection')
+def test_mongodb_tier_upserts_result(mock_get_collection):
+    """MongoDB層に結果がupsertされることをテスト"""
+    mock_collection = MagicMock()
+    mock_get_collection.return_value = mock_collection
+    cache = SummaryCache(max_entries=2, use_mongodb=True)
+
+    cache.set("key", {"discharge_summary": "A"})
+
+    args, kwargs = mock_collection.replace_one.call_args
+    assert args[0] == {"_id": "key"}
+    assert args[1]["result"] == {"discharge_summary": "A"}
+    assert kwargs["upsert"] is True
+
+
+@patch('services.summary_cache.get_summary_cache_collection')
+def test_mongodb_tier_updates_changed_ttl(mock_get_collection):
+    """保持期間を変更した場合は既存のTTLインデックスを変更し、失敗してもキャッシュを使い続けることをテスト"""
+    mock_collection = MagicMock()
+    mock_collection.name = "summary_cache"
+    mock_collection.index_information.return_value = {
+        "created_at_1": {"key": [("created_at", 1)], "expireAfterSeconds": 86400}
+    }
+    mock_collection.database.command.side_effect = OperationFailure("not authorized")
+    mock_collection.find_one.return_value = {"result": {"discharge_summary": "DB"}}
+    mock_get_collection.return_value = mock_collection
+    cache = SummaryCache(max_entries=2, use_mongodb=True, ttl=3600)
+
+    assert cache.get("key") == {"discharge_summary": "DB"}
+    cache.set("other", {"discharge_summary": "A"})
+
+    mock_collection.create_index.assert_not_called()
+    mock_collection.database.command.assert_called_once_with(
+        "collMod", "summary_cache", index={"keyPattern": {"created_at": 1}, "expireAfterSeconds": 3600}
+    )
+    mock_collection.replace_one.assert_called_once()
+
+
+@patch('services.summary_cache.get_summary_cache_collection')
+def test_mongodb_errors_are_ignored(mock_get_collection):
+    """MongoDB層でエラーが発生してもキャッシュミスとして扱われることをテスト"""
+    mock_get_collection.side_effect = Exception("接続エラー")
+    cache = SummaryCache(max_entries=2, use_mongodb=True)
+
+    assert cache.get("key") is None
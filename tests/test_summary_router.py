@@ -0,0 +1,294 @@
+import asyncio
+
+import anthropic
+import httpx
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from external_service.base_provider import SummaryProvider
+from external_service.provider_registry import ProviderRegistry
+from services.circuit_breaker import CircuitBreakerRegistry, CLOSED, OPEN
+from services.rate_limiter import RateLimiter
+from services.retry_policy import RetryPolicy
+from services.summary_router import LatencyTracker, SummaryRouter
+from services.token_estimator import TokenEstimator
+from utils.exceptions import APIError
+
+
+@pytest.fixture(autouse=True)
+def mock_prompt_template():
+    """入力トークン数の見積もりで使うプロンプトの取得をモックする"""
+    with patch("external_service.prompt_builder.get_prompt_template", return_value="退院時サマリを作成"):
+        yield
+
+
+class FakeProvider(SummaryProvider):
+    """応答までの待ち時間と失敗を指定できるテスト用のプロバイダ"""
+
+    def __init__(self, name, delay=0.0, error=None, text="現病歴:発熱"):
+        self.name = name
+        self.delay = delay
+        self.error = error
+        self.text = text
+        self.cancelled = False
+        self.generate_async = AsyncMock(side_effect=self.generate)
+
+    def is_available(self):
+        return True
+
+    async def generate(self, model_name, medical_text, additional_info="", department="default", max_tokens=None):
+        await self.wait()
+        return self.text, 10, 5, {}
+
+    async def stream_async(self, model_name, medical_text, additional_info="", department="default", max_tokens=None):
+        await self.wait()
+        yield {"type": "delta", "text": self.text}
+        yield {"type": "usage", "input_tokens": 10, "output_tokens": 5}
+
+    async def wait(self):
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        if self.error:
+            raise self.error
+
+
+def create_router(primary, secondary, **kwargs):
+    registry = ProviderRegistry(
+        providers=[primary, secondary],
+        models=[
+            {"name": "Gemini_Pro", "provider": primary.name, "model": "gemini-pro", "model_detail": "gemini-pro"},
+            {"name": "Claude", "provider": secondary.name, "model": "claude-test"},
+        ]
+    )
+    kwargs.setdefault("circuit_breakers", CircuitBreakerRegistry())
+    return SummaryRouter(registry=registry, failover_models=["Gemini_Pro", "Claude"],
+                         latency_tracker=LatencyTracker(), **kwargs)
+
+
+def test_fails_over_to_next_model():
+    """選択したモデルが失敗した場合に次のモデルで生成され、model_detailに反映されることをテスト"""
+    primary = FakeProvider("gemini", error=APIError("503 UNAVAILABLE"))
+    secondary = FakeProvider("claude", text="現病歴:咳嗽")
+    router = create_router(primary, secondary)
+
+    outcome = asyncio.run(router.generate_async("Gemini_Pro", "カルテ", "default"))
+
+    assert outcome["discharge_summary"] == "現病歴:咳嗽"
+    assert outcome["model_detail"] == "Claude"
+    assert outcome["failover"] is True
+
+
+def test_raises_first_error_when_all_models_fail():
+    """すべてのモデルが失敗した場合は選択したモデルのエラーとなることをテスト"""
+    primary = FakeProvider("gemini", error=APIError("Geminiのエラー"))
+    secondary = FakeProvider("claude", error=APIError("Claudeのエラー"))
+    router = create_router(primary, secondary)
+
+    with pytest.raises(APIError, match="Geminiのエラー"):
+        asyncio.run(router.generate_async("Gemini_Pro", "カルテ", "default"))
+
+
+def test_async_stream_fails_over_on_error():
+    """非同期ストリーミングでも応答開始前の失敗で次のモデルに切り替わることをテスト"""
+    primary = FakeProvider("gemini", error=APIError("500 INTERNAL"))
+    secondary = FakeProvider("claude", text="現病歴:咳嗽")
+    router = create_router(primary, secondary)
+    received = []
+
+    outcome = asyncio.run(router.generate_async("Gemini_Pro", "カルテ", "default", "", received.append))
+
+    assert received == ["現病歴:咳嗽"]
+    assert outcome["model_detail"] == "Claude"
+
+
+def test_async_fails_over_on_timeout():
+    """応答が指定秒数以内に始まらない場合に次のモデルに切り替わることをテスト"""
+    primary = FakeProvider("gemini", delay=5)
+    secondary = FakeProvider("claude")
+    router = create_router(primary, secondary, attempt_timeout=0.05)
+
+    outcome = asyncio.run(router.generate_async("Gemini_Pro", "カルテ", "default"))
+
+    assert outcome["model_detail"] == "Claude"
+    assert primary.cancelled is True
+
+
+def create_drained_rate_limiter(model):
+    """送信枠を使い切った状態のレートリミッタ。rpm=240では0.25秒ごとに1リクエスト送信できる"""
+    rate_limiter = RateLimiter(default_rpm=0, default_tpm=0)
+    rate_limiter.get_buckets(model)["requests"].tokens = 0
+    return rate_limiter
+
+
+def test_rate_limiter_wait_does_not_time_out():
+    """レート制限の待ち時間はattempt_timeoutに含めず、サーキットブレーカーの失敗としても数えないことをテスト"""
+    provider = FakeProvider("claude", delay=0.01)
+    model = {"name": "Claude", "provider": "claude", "model": "claude-test", "rpm": 240}
+    registry = ProviderRegistry(providers=[provider], models=[model])
+    circuit_breakers = CircuitBreakerRegistry(failure_threshold=1)
+    router = SummaryRouter(registry=registry, failover_models=[], attempt_timeout=0.1,
+                           latency_tracker=LatencyTracker(), circuit_breakers=circuit_breakers,
+                           rate_limiter=create_drained_rate_limiter(model))
+
+    async def generate_all():
+        return await asyncio.gather(*[router.generate_async("Claude", "カルテ", "default") for _ in range(3)])
+
+    outcomes = asyncio.run(generate_all())
+
+    assert [outcome["discharge_summary"] for outcome in outcomes] == ["現病歴:発熱"] * 3
+    assert provider.generate_async.await_count == 3
+    assert circuit_breakers.get("claude").get_state() == CLOSED
+
+
+def test_rate_limiter_wait_does_not_trigger_hedge():
+    """レート制限で待機している間は、ヘッジのリクエストを送らないことをテスト"""
+    primary = FakeProvider("gemini", delay=0.01)
+    secondary = FakeProvider("claude")
+    model = {"name": "Gemini_Pro", "provider": "gemini", "model": "gemini-pro", "model_detail": "gemini-pro",
+             "rpm": 240}
+    registry = ProviderRegistry(
+        providers=[primary, secondary],
+        models=[model, {"name": "Claude", "provider": "claude", "model": "claude-test"}]
+    )
+    router = SummaryRouter(registry=registry, failover_models=["Gemini_Pro", "Claude"], hedge_enabled=True,
+                           hedge_delay=0.05, latency_tracker=LatencyTracker(),
+                           circuit_breakers=CircuitBreakerRegistry(), rate_limiter=create_drained_rate_limiter(model))
+
+    outcome = asyncio.run(router.generate_async("Gemini_Pro", "カルテ", "default"))
+
+    assert outcome["model_detail"] == "gemini-pro"
+    secondary.generate_async.assert_not_called()
+
+
+def test_async_hedged_request_cancels_slower_model():
+    """ヘッジ有効時は遅いモデルの応答を待たずに次のモデルにも送り、先に応答したほうを採用することをテスト"""
+    primary = FakeProvider("gemini", delay=5)
+    secondary = FakeProvider("claude", delay=0.01, text="現病歴:咳嗽")
+    router = create_router(primary, secondary, hedge_enabled=True, hedge_delay=0.05)
+    received = []
+
+    outcome = asyncio.run(router.generate_async("Gemini_Pro", "カルテ", "default", "", received.append))
+
+    assert outcome["model_detail"] == "Claude"
+    assert received == ["現病歴:咳嗽"]
+    assert primary.cancelled is True
+
+
+def test_async_hedge_not_sent_when_primary_is_fast():
+    """選択したモデルが遅延なく応答した場合は次のモデルに送らないことをテスト"""
+    primary = FakeProvider("gemini")
+    secondary = FakeProvider("claude")
+    secondary.generate_async = MagicMock()
+    router = create_router(primary, secondary, hedge_enabled=True, hedge_delay=1)
+
+    outcome = asyncio.run(router.generate_async("Gemini_Pro", "カルテ", "default"))
+
+    assert outcome["model_detail"] == "gemini-pro"
+    assert outcome["failover"] is False
+    secondary.generate_async.assert_not_called()
+
+
+def test_hedge_delay_uses_p95_latency():
+    """十分な件数の応答時間が記録されていればp95をヘッジの待ち時間とすることをテスト"""
+    tracker = LatencyTracker()
+    router = SummaryRouter(registry=MagicMock(), failover_models=[], hedge_delay=20, hedge_min_samples=20,
+                           latency_tracker=tracker)
+
+    assert router.get_hedge_delay("Gemini_Pro", True) == 20
+
+    for seconds in range(1, 101):
+        tracker.record(("Gemini_Pro", True), seconds / 10)
+
+    assert router.get_hedge_delay("Gemini_Pro", True) == 9.5
+
+
+def test_router_records_retry_count():
+    """一時的なエラーは同じモデルで再試行され、再試行回数が結果に含まれることをテスト"""
+    response = httpx.Response(503, request=httpx.Request("POST", "https://example.com"))
+    errors = [anthropic.APIStatusError("Service Unavailable", response=response, body=None)]
+    primary = FakeProvider("gemini")
+
+    async def generate(*args, **kwargs):
+        if errors:
+            raise errors.pop()
+        return "現病歴:発熱", 10, 5, {}
+
+    primary.generate_async.side_effect = generate
+    router = create_router(primary, FakeProvider("claude"),
+                           retry_policy_factory=lambda name: RetryPolicy(max_attempts=3, base_delay=0))
+
+    outcome = asyncio.run(router.generate_async("Gemini_Pro", "カルテ", "default"))
+
+    assert outcome["retry_count"] == 1
+    assert outcome["failover"] is False
+
+
+def test_router_skips_provider_with_open_circuit():
+    """停止中のプロバイダには送信せずに次のモデルへ切り替えることをテスト"""
+    primary = FakeProvider("gemini")
+    secondary = FakeProvider("claude")
+    circuit_breakers = CircuitBreakerRegistry(failure_threshold=1, reset_timeout=60)
+    circuit_breakers.get("gemini").record_failure()
+    router = create_router(primary, secondary, circuit_breakers=circuit_breakers)
+
+    outcome = asyncio.run(router.generate_async("Gemini_Pro", "カルテ", "default"))
+
+    assert outcome["model_detail"] == "Claude"
+    primary.generate_async.assert_not_called()
+    assert router.has_available_candidate("Gemini_Pro") is True
+
+
+def test_router_opens_circuit_on_provider_failure():
+    """5xxエラーで失敗したプロバイダのサーキットが開くことをテスト"""
+    response = httpx.Response(503, request=httpx.Request("POST", "https://example.com"))
+    error = anthropic.APIStatusError("Service Unavailable", response=response, body=None)
+    circuit_breakers = CircuitBreakerRegistry(failure_threshold=1, reset_timeout=60)
+    router = create_router(FakeProvider("gemini", error=error), FakeProvider("claude", error=error),
+                           circuit_breakers=circuit_breakers,
+                           retry_policy_factory=lambda name: RetryPolicy(max_attempts=1))
+
+    with pytest.raises(anthropic.APIStatusError):
+        asyncio.run(router.generate_async("Gemini_Pro", "カルテ", "default"))
+
+    assert circuit_breakers.get("gemini").get_state() == OPEN
+    assert router.has_available_candidate("Gemini_Pro") is False
+
+
+def test_router_calibrates_estimate_without_limits():
+    """レート制限・出力トークン数の上限がないモデルでも、見積もりと実際の入力トークン数で補正することをテスト"""
+    provider = FakeProvider("claude")
+    registry = ProviderRegistry(
+        providers=[provider],
+        models=[{"name": "Claude", "provider": "claude", "model": "claude-test"}]
+    )
+    estimator = TokenEstimator(use_tokenizer=False)
+    router = SummaryRouter(registry=registry, failover_models=[], latency_tracker=LatencyTracker(),
+                           circuit_breakers=CircuitBreakerRegistry(), token_estimator=estimator)
+
+    asyncio.run(router.generate_async("Claude", "カルテ" * 100, "default"))
+
+    assert "max_tokens" not in provider.generate_async.call_args.kwargs
+    assert estimator.get_correction("claude") < 1.0
+
+
+def test_router_passes_max_tokens_within_context_window():
+    """モデル定義にcontext_windowがある場合、入力の見積もりを差し引いたmax_tokensを渡すことをテスト"""
+    provider = FakeProvider("claude")
+    registry = ProviderRegistry(
+        providers=[provider],
+        models=[{"name": "Claude", "provider": "claude", "model": "claude-test",
+                 "max_output_tokens": 4000, "context_window": 3000}]
+    )
+    estimator = TokenEstimator(use_tokenizer=False)
+    router = SummaryRouter(registry=registry, failover_models=[], latency_tracker=LatencyTracker(),
+                           circuit_breakers=CircuitBreakerRegistry(), token_estimator=estimator)
+
+    asyncio.run(router.generate_async("Claude", "カルテ" * 100, "default"))
+
+    max_tokens = provider.generate_async.call_args.kwargs["max_tokens"]
+    assert 0 < max_tokens < 3000
+    # 実際の入力トークン数（10）で補正係数が更新される
+    assert estimator.get_correction("claude") < 1.0
@@ -0,0 +1,288 @@
+import asyncio
+
+import pytest
+from unittest.mock import patch, MagicMock
+
+from external_service.base_provider import SummaryProvider
+from external_service.claude_api import create_message_params, parse_claude_response
+from external_service.provider_registry import ProviderRegistry
+from services.summary_cache import SummaryCache
+from services.summary_router import consume_summary_stream_async
+from services.summary_service import SummaryProcessor, create_cache_hit_result, find_cached_summary, \
+    generate_summary_task_async, save_usage
+
+
+class FakeProvider(SummaryProvider):
+    """テスト用のプロバイダ。各メソッドはMagicMockに委譲する"""
+
+    def __init__(self, name):
+        self.name = name
+        self.generate_async = MagicMock()
+        self.stream_async = MagicMock()
+
+    def is_available(self):
+        return True
+
+
+async def generate_fever(*args, **kwargs):
+    return "現病歴:発熱", 50, 10, {}
+
+
+@pytest.fixture(autouse=True)
+def mock_prompt_template():
+    """キャッシュキー作成・入力トークン数の見積もり時のプロンプト取得をモックし、キャッシュを空にする"""
+    SummaryCache._instance = SummaryCache(max_entries=10, use_mongodb=False)
+    with patch('services.summary_service.get_prompt_template', return_value="テストプロンプト") as mock_template, \
+            patch('external_service.prompt_builder.get_prompt_template', return_value="テストプロンプト"):
+        yield mock_template
+    SummaryCache._instance = None
+
+
+@pytest.fixture
+def claude_provider():
+    """Claudeモデルのみを登録したProviderRegistryを使用する"""
+    provider = FakeProvider("claude")
+    ProviderRegistry._instance = ProviderRegistry(
+        providers=[provider],
+        models=[{"name": "Claude", "provider": "claude", "model": "claude-test"}]
+    )
+    yield provider
+    ProviderRegistry._instance = None
+
+
+@pytest.fixture
+def openai_provider():
+    provider = FakeProvider("openai")
+    ProviderRegistry._instance = ProviderRegistry(
+        providers=[provider],
+        models=[{"name": "GPT4.1", "provider": "openai", "model": "gpt-test"}]
+    )
+    yield provider
+    ProviderRegistry._instance = None
+
+
+def test_consume_summary_stream_async():
+    """ストリーミングイベントから全文とトークン数を組み立てるテスト"""
+    async def stream():
+        yield {"type": "delta", "text": "入院期間:"}
+        yield {"type": "delta", "text": "2025年1月1日"}
+        yield {"type": "usage", "input_tokens": 100, "output_tokens": 20}
+
+    received = []
+
+    text, input_tokens, output_tokens, cache_usage = asyncio.run(
+        consume_summary_stream_async(stream(), received.append)
+    )
+
+    assert text == "入院期間:2025年1月1日"
+    assert input_tokens == 100
+    assert output_tokens == 20
+    assert cache_usage == {}
+    assert received == ["入院期間:", "2025年1月1日"]
+
+
+def test_generate_summary_task_async_streaming(claude_provider):
+    """on_chunk指定時に非同期ストリーミングAPIでサマリが生成されることをテスト"""
+    async def stream(*args):
+        yield {"type": "delta", "text": "入院期間:"}
+        yield {"type": "delta", "text": "2025年1月1日"}
+        yield {"type": "usage", "input_tokens": 30, "output_tokens": 5}
+
+    claude_provider.stream_async.side_effect = stream
+    on_chunk = MagicMock()
+
+    result = asyncio.run(generate_summary_task_async("カルテ", "default", "Claude", "", on_chunk))
+
+    assert result["success"] is True
+    assert result["parsed_summary"]["入院期間"] == "2025年1月1日"
+    assert result["input_tokens"] == 30
+    assert on_chunk.call_count == 2
+    claude_provider.stream_async.assert_called_once_with("claude-test", "カルテ", "", "default")
+
+
+def test_generate_summary_task_async_without_streaming(claude_provider):
+    """on_chunk未指定時は通常の生成APIが使われることをテスト"""
+    claude_provider.generate_async.side_effect = generate_fever
+
+    result = asyncio.run(generate_summary_task_async("カルテ", "default", "Claude"))
+
+    assert result["success"] is True
+    assert result["discharge_summary"] == "現病歴:発熱"
+    assert result["model_detail"] == "Claude"
+    claude_provider.stream_async.assert_not_called()
+
+
+def test_generate_summary_task_async_no_credentials(claude_provider):
+    """利用可能なモデルがない場合にエラーが返されることをテスト"""
+    result = asyncio.run(generate_summary_task_async("カルテ", "default", "Unknown"))
+
+    assert result["success"] is False
+
+
+def test_generate_summary_task_async_quota_error(openai_provider):
+    """OpenAIのクォータ超過エラーが分かりやすいメッセージに変換されることをテスト"""
+    openai_provider.generate_async.side_effect = Exception("insufficient_quota")
+
+    result = asyncio.run(generate_summary_task_async("カルテ", "default", "GPT4.1"))
+
+    assert result["success"] is False
+    assert "クォータを超過" in str(result["error"])
+
+
+def generate_and_cache(input_text, selected_model, additional_info=""):
+    """キャッシュを確認し、ない場合は生成して保存する"""
+    async def main():
+        cache_key, cached_result = await find_cached_summary(input_text, "default", selected_model, additional_info)
+        if cached_result:
+            return create_cache_hit_result(cached_result)
+        return await generate_summary_task_async(input_text, "default", selected_model, additional_info,
+                                                 cache_key=cache_key)
+
+    return asyncio.run(main())
+
+
+def test_cached_summary_is_returned_for_same_input(claude_provider):
+    """同じ入力の2回目はキャッシュから返され、トークン数が0になることをテスト"""
+    claude_provider.generate_async.side_effect = generate_fever
+
+    first = generate_and_cache("カルテ", "Claude")
+    second = generate_and_cache("カルテ", "Claude")
+
+    assert first.get("cache_hit") is None
+    assert second["cache_hit"] is True
+    assert second["discharge_summary"] == first["discharge_summary"]
+    assert second["input_tokens"] == 0
+    assert second["output_tokens"] == 0
+    claude_provider.generate_async.assert_called_once()
+
+
+def test_cache_miss_on_different_input(claude_provider):
+    """追加情報が異なる場合はキャッシュが使われないことをテスト"""
+    claude_provider.generate_async.side_effect = generate_fever
+
+    generate_and_cache("カルテ", "Claude", "追加情報1")
+    result = generate_and_cache("カルテ", "Claude", "追加情報2")
+
+    assert result.get("cache_hit") is None
+    assert claude_provider.generate_async.call_count == 2
+
+
+def test_cache_miss_on_model_change(claude_provider):
+    """表示名が同じでもAPIのモデルIDが変わった場合はキャッシュが使われないことをテスト"""
+    claude_provider.generate_async.side_effect = generate_fever
+
+    generate_and_cache("カルテ", "Claude")
+    ProviderRegistry._instance = ProviderRegistry(
+        providers=[claude_provider],
+        models=[{"name": "Claude", "provider": "claude", "model": "claude-new"}]
+    )
+    result = generate_and_cache("カルテ", "Claude")
+
+    assert result.get("cache_hit") is None
+    assert claude_provider.generate_async.call_count == 2
+
+
+@patch('services.summary_service.save_usage')
+@patch('services.summary_service.predict_summary_request',
+       return_value={"input_tokens": 10, "max_tokens": 1000, "seconds": None, "cost": None})
+@patch('services.summary_service.MIN_INPUT_TOKENS', 0)
+def test_cache_hit_is_returned_without_queueing(mock_predict, mock_save_usage, claude_provider):
+    """キャッシュにある結果は生成の待ち行列に入れずに返すことをテスト"""
+    claude_provider.generate_async.side_effect = generate_fever
+    generate_and_cache("カルテ", "Claude")
+    global_state = {"selected_model": "Claude", "selected_department": "default"}
+    processor = SummaryProcessor(MagicMock(), global_state)
+
+    with patch('services.summary_service.GenerationScheduler.get_instance') as mock_scheduler:
+        asyncio.run(processor.process_discharge_summary("カルテ"))
+
+    mock_scheduler.assert_not_called()
+    assert global_state["discharge_summary"] == "現病歴:発熱"
+    assert mock_save_usage.call_args[0][0]["cache_hit"] is True
+
+
+def test_generate_summary_task_async_records_cache_usage(claude_provider):
+    """usageイベントに含まれるプロンプトキャッシュのトークン数が結果に引き継がれることをテスト"""
+    async def stream(*args):
+        yield {"type": "delta", "text": "現病歴:発熱"}
+        yield {"type": "usage", "input_tokens": 1050, "output_tokens": 10,
+               "cache_read_input_tokens": 1000, "cache_creation_input_tokens": 0}
+
+    claude_provider.stream_async.side_effect = stream
+
+    result = asyncio.run(generate_summary_task_async("カルテ", "default", "Claude", "", MagicMock()))
+
+    assert result["input_tokens"] == 1050
+    assert result["cache_usage"] == {"cache_read_input_tokens": 1000, "cache_creation_input_tokens": 0}
+
+
+@patch('services.summary_service.record_usage_rollup', side_effect=Exception("duplicate key"))
+@patch('services.summary_service.get_usage_collection')
+def test_save_usage_ignores_rollup_error(mock_get_collection, mock_record_rollup):
+    """集計の加算に失敗しても、使用記録を保存してエラーを呼び出し元に返さないことをテスト"""
+    usage_data = {"model_detail": "claude-test"}
+
+    save_usage(usage_data)
+
+    mock_get_collection.return_value.insert_one.assert_called_once_with(usage_data)
+    mock_record_rollup.assert_called_once_with(usage_data)
+
+
+@patch('services.summary_service.record_usage_rollup')
+@patch('services.summary_service.get_usage_collection')
+def test_save_usage_raises_insert_error(mock_get_collection, mock_record_rollup):
+    """使用記録の保存に失敗した場合はエラーを返し、集計には加算しないことをテスト"""
+    mock_get_collection.return_value.insert_one.side_effect = Exception("connection refused")
+
+    with pytest.raises(Exception, match="connection refused"):
+        save_usage({"model_detail": "claude-test"})
+
+    mock_record_rollup.assert_not_called()
+
+
+@patch('external_service.claude_api.CLAUDE_PROMPT_CACHE', True)
+@patch('external_service.prompt_builder.get_prompt_template', return_value="テストプロンプト")
+def test_claude_message_params_use_cacheable_system_block(mock_template):
+    """Claudeではプロンプトテンプレートがキャッシュ可能なsystemブロック、カルテ情報がuserメッセージになることをテスト"""
+    params = create_message_params("カルテ", "追加情報", "内科")
+
+    assert params["system"] == [
+        {"type": "text", "text": "テストプロンプト", "cache_control": {"type": "ephemeral"}}
+    ]
+    assert params["messages"] == [{"role": "user", "content": "【カルテ情報】\nカルテ\n追加情報"}]
+    mock_template.assert_called_once_with("内科")
+
+
+def test_parse_claude_response_includes_cache_tokens():
+    """キャッシュの読み込み・書き込みトークン数が入力トークン数に合算され、内訳も返されることをテスト"""
+    response = MagicMock()
+    response.content = [MagicMock(text="現病歴:発熱")]
+    response.usage = MagicMock(input_tokens=50, output_tokens=10,
+                               cache_read_input_tokens=1000, cache_creation_input_tokens=None)
+
+    text, input_tokens, output_tokens, cache_usage = parse_claude_response(response)
+
+    assert text == "現病歴:発熱"
+    assert input_tokens == 1050
+    assert output_tokens == 10
+    assert cache_usage == {"cache_read_input_tokens": 1000, "cache_creation_input_tokens": 0}
+
+
+def test_registry_lists_available_models_in_config_order():
+    """設定の順に、認証情報とモデルIDのあるモデルのみが利用可能となることをテスト"""
+    unavailable = FakeProvider("openai")
+    unavailable.is_available = lambda: False
+    registry = ProviderRegistry(
+        providers=[FakeProvider("gemini"), FakeProvider("claude"), unavailable],
+        models=[
+            {"name": "Gemini_Pro", "provider": "gemini", "model": "gemini-pro", "model_detail": "gemini-pro"},
+            {"name": "Gemini_Flash", "provider": "gemini", "model": None},
+            {"name": "Claude", "provider": "claude", "model": "claude-test"},
+            {"name": "GPT4.1", "provider": "openai", "model": "gpt-test"},
+        ]
+    )
+
+    assert registry.get_available_models() == ["Gemini_Pro", "Claude"]
+    assert registry.get_provider_name("Gemini_Pro") == "gemini"
+    assert registry.resolve("Claude")[1]["model_detail"] == "Claude"
+    assert registry.resolve("Gemini_Pro")[1]["model_detail"] == "gemini-pro"
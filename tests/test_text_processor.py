@@ -1,5 +1,5 @@
 import pytest
-from utils.text_processor import format_discharge_summary, parse_discharge_summary
+from utils.text_processor import SummaryStreamParser, format_discharge_summary, parse_discharge_summary
 
 
 def test_format_discharge_summary():
@@ -123,3 +123,49 @@ def test_parse_discharge_summary_with_extra_content():
     assert result["入院期間"] == "2023年1月1日～2023年1月10日\n担当医: 山田医師"
     assert result["現病歴"] == "発熱と咳"
     assert result["入院時検査"] == "血液検査"
+
+
+def test_parse_discharge_summary_long_sections():
+    """長い項目の本文を行の順に連結することをテスト"""
+    lines = [f"経過{i}" for i in range(1000)]
+    summary = "現病歴:発熱\n" + "\n".join(lines) + "\n備考:なし"
+
+    result = parse_discharge_summary(summary)
+
+    assert result["現病歴"] == "\n".join(["発熱"] + lines)
+    assert result["備考"] == "なし"
+
+
+def test_parse_discharge_summary_header_priority():
+    """複数の項目名を含む行は先に定義された項目として扱い、本文のない項目名の行はそれまでの本文を残すことをテスト"""
+    summary = "現病歴:発熱\n咳嗽\n備考 入院期間中に転倒なし\n現病歴:\n呼吸困難"
+
+    result = parse_discharge_summary(summary)
+
+    assert result["入院期間"] == "備考 中に転倒なし"
+    assert result["現病歴"] == "発熱\n咳嗽\n呼吸困難"
+
+
+def test_summary_stream_parser_matches_batch_parser():
+    """どの位置で分割した差分を与えても、一括で解析した場合と同じ結果になることをテスト"""
+    summary = "患者ID: 1\n入院期間:2023年1月1日～2023年1月10日\n現病歴:発熱と咳\nその後、呼吸困難も出現\n\n" \
+              "入院時検査:\n血液検査\n現病歴:再発\n備考:なし"
+
+    for size in range(1, 8):
+        parser = SummaryStreamParser()
+        for i in range(0, len(summary), size):
+            parser.feed(summary[i:i + size])
+        assert parser.finish() == parse_discharge_summary(summary)
+
+
+def test_summary_stream_parser_events_and_snapshot():
+    """完了した行で更新された項目名を返し、途中結果には改行前の末尾の行も含めることをテスト"""
+    parser = SummaryStreamParser()
+
+    assert parser.feed("現病歴:発") == []
+    assert parser.snapshot()["現病歴"] == "発"
+    assert parser.feed("熱\n咳嗽\n入院時") == ["現病歴"]
+    assert parser.pending == "入院時"
+    assert parser.snapshot()["現病歴"] == "発熱\n咳嗽\n入院時"
+    assert parser.feed("検査:CT\n") == ["入院時検査"]
+    assert parser.snapshot()["入院時検査"] == "CT"
@@ -0,0 +1,83 @@
+from services.token_estimator import TokenEstimator, count_char_classes, get_text_digest
+
+MODEL = {"name": "Claude", "provider": "claude", "model": "claude-test"}
+
+
+def test_count_char_classes():
+    """文字種ごとに文字数を数えることをテスト"""
+    counts = count_char_classes("発熱あり BT 38.5")
+
+    assert counts == {"cjk": 2, "kana": 2, "space": 2, "ascii": 3, "digit": 3}
+
+
+def test_estimate_differs_by_provider():
+    """同じテキストでもプロバイダごとの比率で見積もることをテスト"""
+    estimator = TokenEstimator(use_tokenizer=False)
+    text = "患者は発熱と咳嗽を主訴に来院した。" * 10
+
+    claude_tokens = estimator.estimate(text, "claude")
+    gemini_tokens = estimator.estimate(text, "gemini")
+
+    assert claude_tokens > gemini_tokens > 0
+    # 日本語は1文字あたりおよそ1トークン以下であり、文字数とは一致しない
+    assert claude_tokens != len(text)
+    assert estimator.estimate("", "claude") == 0
+
+
+def test_estimate_is_cached():
+    """同じテキストの見積もりは保持した結果を返し、上限を超えた古いものから破棄することをテスト"""
+    estimator = TokenEstimator(cache_size=2, use_tokenizer=False)
+
+    estimator.estimate("発熱", "claude")
+    estimator.estimate("咳嗽", "claude")
+    estimator.estimate("発熱", "claude")
+    estimator.estimate("頭痛", "claude")
+
+    assert list(estimator._cache) == [("claude", get_text_digest("発熱")), ("claude", get_text_digest("頭痛"))]
+    # テキストそのものは保持しない
+    assert all(isinstance(digest, bytes) and len(digest) == 32 for _, digest in estimator._cache)
+
+
+def test_record_actual_calibrates_estimate():
+    """実際のトークン数が見積もりより多い場合、以降の見積もりが増えることをテスト"""
+    estimator = TokenEstimator(use_tokenizer=False)
+    text = "入院時より抗菌薬を投与し、解熱を得た。" * 20
+    estimated = estimator.estimate(text, "claude")
+
+    for _ in range(50):
+        estimator.record_actual("claude", estimator.estimate(text, "claude"), estimated * 1.5)
+
+    assert abs(estimator.estimate(text, "claude") - estimated * 1.5) / estimated < 0.05
+    # 他のプロバイダの見積もりには影響しない
+    assert estimator.get_correction("gemini") == 1.0
+
+
+def test_choose_max_tokens():
+    """コンテキスト長から入力分を差し引いた範囲で出力トークン数の上限を決めることをテスト"""
+    estimator = TokenEstimator(use_tokenizer=False)
+
+    assert estimator.choose_max_tokens(MODEL, 1000) is None
+    assert estimator.choose_max_tokens({**MODEL, "max_output_tokens": 4000}, 1000) == 4000
+    model = {**MODEL, "max_output_tokens": 4000, "context_window": 10000}
+    assert estimator.choose_max_tokens(model, 1000) == 4000
+    assert estimator.choose_max_tokens(model, 8000) == 10000 - 8000 - 256
+    assert estimator.choose_max_tokens(model, 20000) == 0
+
+
+def test_predict_cost_and_seconds():
+    """モデル定義の単価と生成速度の実績から費用と処理時間を予測することをテスト"""
+    estimator = TokenEstimator(use_tokenizer=False)
+    model = {**MODEL, "input_price": 3.0, "output_price": 15.0}
+    text = "退院時サマリを作成してください。" * 100
+
+    prediction = estimator.predict(model, "claude", text)
+    assert prediction["seconds"] is None
+    assert prediction["output_tokens"] == 1500
+
+    estimator.record_output("claude-test", 1000, 20)
+    prediction = estimator.predict(model, "claude", text)
+
+    assert prediction["output_tokens"] == 1000
+    assert prediction["seconds"] == 20
+    expected_cost = (prediction["input_tokens"] * 3.0 + 1000 * 15.0) / 1_000_000
+    assert abs(prediction["cost"] - expected_cost) < 1e-9
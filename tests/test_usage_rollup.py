@@ -0,0 +1,86 @@
+import datetime
+from unittest.mock import MagicMock, patch
+
+import pytz
+
+from services.usage_rollup import ROLLUP_KEYS, backfill_usage_rollups, create_backfill_pipeline, get_bucket, \
+    record_usage_rollup
+from utils.db import INDEXES
+
+JST = pytz.timezone('Asia/Tokyo')
+
+
+def test_get_bucket_converts_to_utc():
+    """日本時間の日時をUTCの時間・日の開始日時に切り捨てることをテスト"""
+    date = JST.localize(datetime.datetime(2025, 4, 2, 8, 30))
+
+    assert get_bucket(date, "hourly") == datetime.datetime(2025, 4, 1, 23, 0)
+    assert get_bucket(date, "daily") == datetime.datetime(2025, 4, 1, 0, 0)
+
+
+@patch("services.usage_rollup.get_usage_rollup_collection")
+def test_record_usage_rollup_increments_each_granularity(mock_get_collection):
+    """使用記録を時間別・日別の集計に$incでupsertすることをテスト"""
+    collections = {"hourly": MagicMock(), "daily": MagicMock()}
+    mock_get_collection.side_effect = collections.get
+
+    record_usage_rollup({
+        "date": datetime.datetime(2025, 4, 1, 10, 15),
+        "department": "内科",
+        "model_detail": "claude-sonnet",
+        "document_name": "退院時サマリ",
+        "input_tokens": 1000,
+        "output_tokens": 200,
+        "total_tokens": 1200,
+        "processing_time": 15,
+    })
+
+    key, update = collections["hourly"].update_one.call_args[0]
+    assert key == {"bucket": datetime.datetime(2025, 4, 1, 10, 0), "department": "内科",
+                   "model_detail": "claude-sonnet", "document_name": "退院時サマリ"}
+    assert update == {"$inc": {"count": 1, "input_tokens": 1000, "output_tokens": 200, "total_tokens": 1200,
+                               "processing_time_sum": 15, "processing_time_count": 1}}
+    assert collections["hourly"].update_one.call_args[1] == {"upsert": True}
+    assert collections["daily"].update_one.call_args[0][0]["bucket"] == datetime.datetime(2025, 4, 1)
+
+
+@patch("services.usage_rollup.get_usage_rollup_collection")
+def test_backfill_replaces_rollups_in_range(mock_get_collection):
+    """期間を日単位に広げて既存の集計を削除し、使用記録の集計で置き換えることをテスト"""
+    rollup_collection = MagicMock()
+    mock_get_collection.return_value = rollup_collection
+    usage_collection = MagicMock()
+    usage_collection.aggregate.return_value = [
+        {"_id": {"bucket": datetime.datetime(2025, 4, 1), "department": "内科", "model_detail": "claude-sonnet",
+                 "document_name": "退院時サマリ"},
+         "count": 3, "input_tokens": 300, "output_tokens": 30, "total_tokens": 330,
+         "processing_time_sum": 30, "processing_time_count": 3},
+    ]
+
+    written = backfill_usage_rollups(datetime.datetime(2025, 4, 1, 12), datetime.datetime(2025, 4, 2, 12),
+                                     usage_collection)
+
+    assert written == {"hourly": 1, "daily": 1}
+    rollup_collection.delete_many.assert_called_with(
+        {"bucket": {"$gte": datetime.datetime(2025, 4, 1), "$lt": datetime.datetime(2025, 4, 3)}}
+    )
+    request = rollup_collection.bulk_write.call_args[0][0][0]
+    assert request._filter == {"bucket": datetime.datetime(2025, 4, 1), "department": "内科",
+                               "model_detail": "claude-sonnet", "document_name": "退院時サマリ"}
+    assert request._doc["count"] == 3
+
+
+def test_backfill_pipeline_truncates_dates():
+    """集計の単位に応じて日時を切り捨ててグループ化することをテスト"""
+    pipeline = create_backfill_pipeline("hourly")
+
+    assert len(pipeline) == 1
+    assert pipeline[0]["$group"]["_id"]["bucket"] == {"$dateTrunc": {"date": "$date", "unit": "hour"}}
+
+
+def test_rollup_collections_have_unique_index():
+    """時間別・日別の集計のコレクションに、集計のキーの一意のインデックスを作成することをテスト"""
+    rollup_indexes = {name: (keys, options) for name, keys, options in INDEXES if name.startswith("summary_usage_")}
+
+    expected = ([(key, 1) for key in ROLLUP_KEYS], {"unique": True})
+    assert rollup_indexes == {"summary_usage_hourly": expected, "summary_usage_daily": expected}
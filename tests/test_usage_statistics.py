@@ -0,0 +1,110 @@
+import datetime
+from unittest.mock import MagicMock, patch
+
+import pandas as pd
+
+from services.usage_statistics import USAGE_PROJECTION, StatisticsCache, create_statistics_pipeline, \
+    get_usage_statistics, load_usage_statistics
+
+START = datetime.datetime(2025, 4, 1)
+END = datetime.datetime(2025, 5, 1)
+
+
+def test_pipeline_matches_range_and_projects_needed_fields():
+    """期間と文書タイプで絞り込み、集計に必要な項目のみでグループ化することをテスト"""
+    pipeline = create_statistics_pipeline(START, END, "退院時サマリ", "department")
+
+    assert pipeline[0] == {"$match": {"date": {"$gte": START, "$lt": END}, "document_name": "退院時サマリ"}}
+    assert pipeline[1] == {"$project": USAGE_PROJECTION}
+    assert pipeline[2]["$group"]["_id"] == "$department"
+    assert pipeline[-1] == {"$sort": {"_id": 1}}
+
+
+def test_pipeline_without_document_filter():
+    """「すべて」の場合は文書タイプで絞り込まず、日別は日付の文字列でグループ化することをテスト"""
+    pipeline = create_statistics_pipeline(START, END, "すべて", "daily")
+
+    assert "document_name" not in pipeline[0]["$match"]
+    assert pipeline[2]["$group"]["_id"] == {"$dateToString": {"format": "%Y-%m-%d", "date": "$date"}}
+
+
+def test_load_usage_statistics_returns_aggregated_rows():
+    """集計結果をグループ名の列を持つDataFrameに変換し、平均処理時間を丸めることをテスト"""
+    collection = MagicMock()
+    collection.aggregate.return_value = [
+        {"_id": "Claude", "count": 2, "input_tokens": 300, "output_tokens": 30, "total_tokens": 330,
+         "processing_time": 12.345},
+        {"_id": "Gemini_Pro", "count": 1, "input_tokens": 100, "output_tokens": 10, "total_tokens": 110,
+         "processing_time": 8.0},
+    ]
+
+    stats = load_usage_statistics(START, END, "すべて", "model", collection)
+
+    assert stats["model_detail"].tolist() == ["Claude", "Gemini_Pro"]
+    assert stats["count"].tolist() == [2, 1]
+    assert stats["processing_time"].tolist() == [12.3, 8.0]
+
+
+def test_load_usage_statistics_without_data():
+    """該当する記録がない場合は空のDataFrameを返すことをテスト"""
+    collection = MagicMock()
+    collection.aggregate.return_value = []
+
+    stats = load_usage_statistics(START, END, "すべて", "daily", collection)
+
+    assert stats.empty
+    assert "date_str" in stats.columns
+
+
+def test_load_usage_statistics_from_rollups():
+    """集計を使う場合は期間の境界に合う単位の集計から求めることをテスト"""
+    collection = MagicMock()
+    collection.aggregate.return_value = []
+
+    with patch("services.usage_statistics.get_usage_rollup_collection", return_value=collection) as mock_get_collection:
+        load_usage_statistics(START, END, "退院時サマリ", "daily", use_rollups=True)
+        load_usage_statistics(START, END.replace(hour=9), "退院時サマリ", "daily", use_rollups=True)
+
+    assert [call[0][0] for call in mock_get_collection.call_args_list] == ["daily", "hourly"]
+    pipeline = collection.aggregate.call_args[0][0]
+    assert pipeline[0] == {"$match": {"bucket": {"$gte": START, "$lt": END.replace(hour=9)},
+                                      "document_name": "退院時サマリ"}}
+    assert pipeline[1]["$group"]["count"] == {"$sum": "$count"}
+
+
+def test_statistics_cache_uses_longer_ttl_for_past_ranges():
+    """現在より前に終わる期間はpast_ttl、現在を含む期間はttlの間キャッシュすることをテスト"""
+    cache = StatisticsCache(ttl=60, past_ttl=3600, max_entries=8)
+    stats = pd.DataFrame({"department": ["default"], "count": [1]})
+    future = datetime.datetime.now() + datetime.timedelta(days=2)
+
+    with patch("services.usage_statistics.time.monotonic", return_value=1000.0):
+        cache.set("past", stats, END)
+        cache.set("current", stats, future)
+
+    with patch("services.usage_statistics.time.monotonic", return_value=1100.0):
+        assert cache.get("past") is not None
+        assert cache.get("current") is None
+
+
+def test_statistics_cache_returns_copy():
+    """取得したDataFrameを書き換えてもキャッシュに影響しないことをテスト"""
+    cache = StatisticsCache(ttl=60, past_ttl=3600, max_entries=8)
+    cache.set("key", pd.DataFrame({"department": ["default"]}), END)
+
+    cache.get("key")["department"] = "全科共通"
+
+    assert cache.get("key")["department"].tolist() == ["default"]
+
+
+@patch("services.usage_statistics.load_usage_statistics")
+def test_get_usage_statistics_loads_once_per_query(mock_load):
+    """同じ期間・文書タイプ・集計の種類では、2回目以降はMongoDBから取得しないことをテスト"""
+    mock_load.return_value = pd.DataFrame({"model_detail": ["Claude"]})
+
+    with patch.object(StatisticsCache, "_instance", StatisticsCache(ttl=60, past_ttl=3600, max_entries=8)):
+        get_usage_statistics(START, END, "すべて", "model")
+        get_usage_statistics(START, END, "すべて", "model")
+        get_usage_statistics(START, END, "すべて", "daily")
+
+    assert mock_load.call_count == 2
@@ -1,8 +1,9 @@
 import flet as ft
 from utils.auth import get_current_user, logout, password_change_ui, can_edit_prompts
 from utils.prompt_manager import get_all_departments
-from utils.config import GEMINI_MODEL, GEMINI_CREDENTIALS, GEMINI_FLASH_MODEL, CLAUDE_API_KEY, OPENAI_API_KEY, \
-    OPENAI_MODEL, SELECTED_AI_MODEL
+from external_service.provider_registry import ProviderRegistry
+from services.circuit_breaker import CircuitBreakerRegistry
+from utils.config import SELECTED_AI_MODEL
 
 
 def render_sidebar(page, global_state, navigate_to):
@@ -52,29 +53,29 @@ def render_sidebar(page, global_state, navigate_to):
     sidebar_content.append(department_dropdown)
 
     # 利用可能なAIモデルの取得
-    global_state["available_models"] = []
-    if GEMINI_MODEL and GEMINI_CREDENTIALS:
-        global_state["available_models"].append("Gemini_Pro")
-    if GEMINI_FLASH_MODEL and GEMINI_CREDENTIALS:
-        global_state["available_models"].append("Gemini_Flash")
-    if CLAUDE_API_KEY:
-        global_state["available_models"].append("Claude")
-    if OPENAI_API_KEY:
-        global_state["available_models"].append("GPT4.1")
+    global_state["available_models"] = ProviderRegistry.get_instance().get_available_models()
+    healthy_models = get_healthy_models(global_state["available_models"])
 
     # 複数のモデルが利用可能な場合、モデル選択ドロップダウンを表示
     if len(global_state["available_models"]) > 1:
-        if "selected_model" not in global_state:
+        # 障害で停止中のモデルが選択されている場合は、利用できるモデルに切り替える
+        if "selected_model" not in global_state or (
+                global_state["selected_model"] not in healthy_models and healthy_models):
             default_model = SELECTED_AI_MODEL
-            if default_model not in global_state["available_models"] and global_state["available_models"]:
-                default_model = global_state["available_models"][0]
+            candidates = healthy_models or global_state["available_models"]
+            if default_model not in candidates:
+                default_model = candidates[0]
             global_state["selected_model"] = default_model
 
         model_dropdown = ft.Dropdown(
             width=200,
             label="AIモデル",
             options=[
-                ft.dropdown.Option(key=model, text=model)
+                ft.dropdown.Option(
+                    key=model,
+                    text=model if model in healthy_models else f"{model}（停止中）",
+                    disabled=model not in healthy_models
+                )
                 for model in global_state["available_models"]
             ],
             value=global_state["selected_model"] if global_state["selected_model"] in global_state[
@@ -126,6 +127,14 @@ def render_sidebar(page, global_state, navigate_to):
     return sidebar
 
 
+def get_healthy_models(available_models):
+    """サーキットブレーカーが開いていない（障害で停止中でない）プロバイダのモデルを返す"""
+    registry = ProviderRegistry.get_instance()
+    circuit_breakers = CircuitBreakerRegistry.get_instance()
+    return [model for model in available_models
+            if circuit_breakers.is_available(registry.get_provider_name(model))]
+
+
 def toggle_password_change(global_state, page):
     """パスワード変更フォームの表示/非表示を切り替え"""
     global_state["show_password_change"] = not global_state["show_password_change"]
@@ -0,0 +1,71 @@
+import math
+
+import flet as ft
+
+from utils.config import STATISTICS_PAGE_SIZE
+
+STATS_COLUMN_LABELS = ["処理数", "入力トークン", "出力トークン", "合計トークン", "平均処理時間"]
+TOTAL_COLUMNS = ["count", "input_tokens", "output_tokens", "total_tokens"]
+
+
+def format_stats_rows(stats, column):
+    """集計を列ごとにまとめて整形し、行ごとのセルの文字列を返す"""
+    columns = stats.to_dict("list")
+    return list(zip(
+        [str(value) for value in columns[column]],
+        [str(value) for value in columns["count"]],
+        [f"{value:,}" for value in columns["input_tokens"]],
+        [f"{value:,}" for value in columns["output_tokens"]],
+        [f"{value:,}" for value in columns["total_tokens"]],
+        [f"{value:.1f}秒" for value in columns["processing_time"]],
+    ))
+
+
+def format_total_row(stats):
+    """全ページの合計と、グループごとの平均処理時間の平均"""
+    count, input_tokens, output_tokens, total_tokens = stats[TOTAL_COLUMNS].to_numpy().sum(axis=0)
+    avg_time = stats["processing_time"].mean()
+    return ("合計/平均", str(count), f"{input_tokens:,}", f"{output_tokens:,}", f"{total_tokens:,}",
+            f"{avg_time:.1f}秒")
+
+
+def get_page_count(stats, page_size=STATISTICS_PAGE_SIZE):
+    return max(1, math.ceil(len(stats) / page_size))
+
+
+def create_stats_table(stats, column, label, page_index=0, page_size=STATISTICS_PAGE_SIZE, on_page_change=None):
+    """集計の表を作成する。表示するページの行と合計行のみDataRowを作成し、複数ページの場合はページ送りを付ける"""
+    page_count = get_page_count(stats, page_size)
+    page_index = min(max(page_index, 0), page_count - 1)
+    start = page_index * page_size
+    page = stats.iloc[start:start + page_size]
+
+    table_rows = [
+        ft.DataRow(cells=[ft.DataCell(ft.Text(value)) for value in values])
+        for values in format_stats_rows(page, column)
+    ]
+    table_rows.append(ft.DataRow(
+        cells=[ft.DataCell(ft.Text(value, weight=ft.FontWeight.BOLD)) for value in format_total_row(stats)]
+    ))
+
+    table = ft.DataTable(
+        columns=[ft.DataColumn(ft.Text(text)) for text in [label] + STATS_COLUMN_LABELS],
+        rows=table_rows
+    )
+    if page_count == 1:
+        return table
+
+    pager = ft.Row([
+        ft.IconButton(
+            icon=ft.icons.CHEVRON_LEFT,
+            disabled=page_index == 0,
+            on_click=lambda _: on_page_change(page_index - 1)
+        ),
+        ft.Text(f"{start + 1}～{start + len(page)}件 / {len(stats)}件"),
+        ft.IconButton(
+            icon=ft.icons.CHEVRON_RIGHT,
+            disabled=page_index == page_count - 1,
+            on_click=lambda _: on_page_change(page_index + 1)
+        ),
+    ])
+    return ft.Column([table, pager])
@@ -6,7 +6,8 @@ from pathlib import Path
 from utils.env_loader import load_environment_variables
 from utils.config import get_config
 from utils.db import DatabaseManager
-from utils.prompt_manager import get_all_departments, get_all_prompts, get_department_collection, get_prompt_collection
+from utils.prompt_manager import get_all_departments, get_all_prompts, get_department_collection, \
+    get_prompt_collection, invalidate_prompt_cache
 
 
 def get_mongodb_connection():
@@ -123,6 +124,9 @@ def restore_data(backup_file, data_type):
             else:
                 collection.insert_one(item)
 
+        if data_type == 'prompts':
+            invalidate_prompt_cache()
+
         print(f"{len(data)}件の{success_message}を正常に復元しました")
         return True
 
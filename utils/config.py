@@ -1,5 +1,8 @@
 import configparser
+import json
 import os
+import threading
+import time
 from pathlib import Path
 
 import google.generativeai as genai
@@ -7,15 +10,75 @@ from dotenv import load_dotenv
 from pymongo import MongoClient
 
 
-def get_config():
-    config = configparser.ConfigParser()
+def get_config_path():
     base_dir = Path(__file__).parent.parent
-    config_path = os.path.join(base_dir, 'config.ini')
+    return os.path.join(base_dir, 'config.ini')
 
-    config.read(config_path, encoding='utf-8')
 
+def read_config(config_path=None):
+    """config.iniをディスクから読み込む（キャッシュを使わない）"""
+    config = configparser.ConfigParser()
+    config.read(config_path or get_config_path(), encoding='utf-8')
     return config
 
+
+class ConfigCache:
+    """config.iniの読み込み結果を保持し、ファイルの更新日時が変わった場合のみ再読み込みする
+
+    更新日時の確認もcheck_interval秒に1回に抑え、それ以外の呼び出しではファイルにアクセスしない
+    """
+
+    def __init__(self, check_interval=None):
+        self.check_interval = check_interval
+        self._config = None
+        self._mtime = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self):
+        now = time.monotonic()
+        if self._config is not None and now - self._checked_at < self._get_check_interval():
+            return self._config
+
+        with self._lock:
+            config_path = get_config_path()
+            mtime = self._get_mtime(config_path)
+            if self._config is None or mtime != self._mtime:
+                self._config = read_config(config_path)
+                self._mtime = mtime
+            self._checked_at = now
+            return self._config
+
+    def reload(self):
+        with self._lock:
+            self._config = None
+            self._mtime = None
+        return self.get()
+
+    def _get_check_interval(self):
+        if self.check_interval is not None:
+            return self.check_interval
+        return float(os.environ.get("CONFIG_RELOAD_INTERVAL", "5"))
+
+    @staticmethod
+    def _get_mtime(config_path):
+        try:
+            return os.path.getmtime(config_path)
+        except OSError:
+            return None
+
+
+_config_cache = ConfigCache()
+
+
+def get_config():
+    return _config_cache.get()
+
+
+def reload_config():
+    """キャッシュを破棄してconfig.iniを再読み込みする"""
+    return _config_cache.reload()
+
 load_dotenv()
 
 MONGODB_URI = os.environ.get("MONGODB_URI")
@@ -28,16 +91,90 @@ GEMINI_CREDENTIALS = os.environ.get("GEMINI_CREDENTIALS")
 GEMINI_MODEL = os.environ.get("GEMINI_MODEL")
 GEMINI_FLASH_MODEL = os.environ.get("GEMINI_FLASH_MODEL")
 
+GEMINI_CONTEXT_CACHE = os.environ.get("GEMINI_CONTEXT_CACHE", "False").lower() in ("true", "1", "yes")
+GEMINI_CONTEXT_CACHE_TTL = int(os.environ.get("GEMINI_CONTEXT_CACHE_TTL", "3600"))
+GEMINI_CONTEXT_CACHE_REFRESH_MARGIN = int(os.environ.get("GEMINI_CONTEXT_CACHE_REFRESH_MARGIN", "300"))
+GEMINI_CONTEXT_CACHE_RETRY_INTERVAL = int(os.environ.get("GEMINI_CONTEXT_CACHE_RETRY_INTERVAL", "600"))
+
 GEMINI_THINKING_BUDGET = int(os.environ.get("GEMINI_THINKING_BUDGET", "0")) if os.environ.get("GEMINI_THINKING_BUDGET") else None
 
 CLAUDE_API_KEY = os.environ.get("CLAUDE_API_KEY")
 CLAUDE_MODEL = os.environ.get("CLAUDE_MODEL")
+CLAUDE_PROMPT_CACHE = os.environ.get("CLAUDE_PROMPT_CACHE", "True").lower() in ("true", "1", "yes")
 
 OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
 OPENAI_MODEL = os.environ.get("OPENAI_MODEL")
 
+
+def load_summary_models():
+    """画面上のモデル名ごとのプロバイダとモデルID
+
+    SUMMARY_MODELSにJSON配列を指定すると、その内容（表示順を含む）で置き換える
+    例: [{"name": "Claude", "provider": "claude", "model": "claude-sonnet-4-20250514"}]
+    """
+    value = os.environ.get("SUMMARY_MODELS")
+    if value:
+        return json.loads(value)
+    return [
+        {"name": "Gemini_Pro", "provider": "gemini", "model": GEMINI_MODEL, "model_detail": GEMINI_MODEL},
+        {"name": "Gemini_Flash", "provider": "gemini", "model": GEMINI_FLASH_MODEL, "model_detail": GEMINI_FLASH_MODEL},
+        {"name": "Claude", "provider": "claude", "model": CLAUDE_MODEL},
+        {"name": "GPT4.1", "provider": "openai", "model": OPENAI_MODEL},
+    ]
+
+
+SUMMARY_MODELS = load_summary_models()
+
 SELECTED_AI_MODEL = os.environ.get("SELECTED_AI_MODEL", "gemini")
 
+FAILOVER_MODELS = [model.strip() for model in os.environ.get("FAILOVER_MODELS", "").split(",") if model.strip()]
+FAILOVER_TIMEOUT = float(os.environ.get("FAILOVER_TIMEOUT", "0"))
+HEDGE_ENABLED = os.environ.get("HEDGE_ENABLED", "False").lower() in ("true", "1", "yes")
+HEDGE_DEFAULT_DELAY = float(os.environ.get("HEDGE_DEFAULT_DELAY", "20"))
+HEDGE_MIN_SAMPLES = int(os.environ.get("HEDGE_MIN_SAMPLES", "20"))
+
+KARTE_DEDUP_ENABLED = os.environ.get("KARTE_DEDUP_ENABLED", "False").lower() in ("true", "1", "yes")
+KARTE_DEDUP_SIMILARITY = float(os.environ.get("KARTE_DEDUP_SIMILARITY", "0.8"))
+KARTE_DEDUP_MIN_CHARS = int(os.environ.get("KARTE_DEDUP_MIN_CHARS", "30"))
+KARTE_DEDUP_DISABLED_DEPARTMENTS = [department.strip() for department in
+                                    os.environ.get("KARTE_DEDUP_DISABLED_DEPARTMENTS", "").split(",")
+                                    if department.strip()]
+
+MAP_REDUCE_ENABLED = os.environ.get("MAP_REDUCE_ENABLED", "False").lower() in ("true", "1", "yes")
+MAP_REDUCE_THRESHOLD = int(os.environ.get("MAP_REDUCE_THRESHOLD", "60000"))
+MAP_REDUCE_CHUNK_SIZE = int(os.environ.get("MAP_REDUCE_CHUNK_SIZE", "20000"))
+MAP_REDUCE_CONCURRENCY = int(os.environ.get("MAP_REDUCE_CONCURRENCY", "4"))
+MAP_REDUCE_MAP_MODEL = os.environ.get("MAP_REDUCE_MAP_MODEL", "Gemini_Flash")
+
+SECTION_PARALLEL_ENABLED = os.environ.get("SECTION_PARALLEL_ENABLED", "False").lower() in ("true", "1", "yes")
+SECTION_PARALLEL_CONCURRENCY = int(os.environ.get("SECTION_PARALLEL_CONCURRENCY", "0"))
+SECTION_PARALLEL_WARMUP = os.environ.get("SECTION_PARALLEL_WARMUP", "True").lower() in ("true", "1", "yes")
+
+CIRCUIT_BREAKER_FAILURE_THRESHOLD = int(os.environ.get("CIRCUIT_BREAKER_FAILURE_THRESHOLD", "5"))
+CIRCUIT_BREAKER_RESET_TIMEOUT = float(os.environ.get("CIRCUIT_BREAKER_RESET_TIMEOUT", "60"))
+
+RATE_LIMIT_RPM = int(os.environ.get("RATE_LIMIT_RPM", "0"))
+RATE_LIMIT_TPM = int(os.environ.get("RATE_LIMIT_TPM", "0"))
+
+RETRY_MAX_ATTEMPTS = int(os.environ.get("RETRY_MAX_ATTEMPTS", "3"))
+RETRY_BASE_DELAY = float(os.environ.get("RETRY_BASE_DELAY", "1"))
+RETRY_MAX_DELAY = float(os.environ.get("RETRY_MAX_DELAY", "30"))
+RETRY_DEADLINE = float(os.environ.get("RETRY_DEADLINE", "120"))
+
+
+def get_retry_settings(provider):
+    """プロバイダごとの再試行設定。RETRY_MAX_ATTEMPTS_<PROVIDER>などで個別に上書きできる"""
+    def get(name, default, cast):
+        value = os.environ.get(f"{name}_{provider.upper()}")
+        return cast(value) if value else default
+
+    return {
+        "max_attempts": get("RETRY_MAX_ATTEMPTS", RETRY_MAX_ATTEMPTS, int),
+        "base_delay": get("RETRY_BASE_DELAY", RETRY_BASE_DELAY, float),
+        "max_delay": get("RETRY_MAX_DELAY", RETRY_MAX_DELAY, float),
+        "deadline": get("RETRY_DEADLINE", RETRY_DEADLINE, float),
+    }
+
 REQUIRE_LOGIN = os.environ.get("REQUIRE_LOGIN", "True").lower() in ("true", "1", "yes")
 
 IP_WHITELIST = os.environ.get("IP_WHITELIST", "")
@@ -45,6 +182,43 @@ IP_CHECK_ENABLED = os.environ.get("IP_CHECK_ENABLED", "False").lower() in ("true
 
 MAX_INPUT_TOKENS = int(os.environ.get("MAX_INPUT_TOKENS", "200000"))
 MIN_INPUT_TOKENS = int(os.environ.get("MIN_INPUT_TOKENS", "100"))
+TOKEN_ESTIMATE_CACHE_SIZE = int(os.environ.get("TOKEN_ESTIMATE_CACHE_SIZE", "256"))
+
+STREAMING_ENABLED = os.environ.get("STREAMING_ENABLED", "True").lower() in ("true", "1", "yes")
+STREAMING_UPDATE_INTERVAL = float(os.environ.get("STREAMING_UPDATE_INTERVAL", "0.2"))
+
+GENERATION_WORKERS = int(os.environ.get("GENERATION_WORKERS", "4"))
+GENERATION_QUEUE_SIZE = int(os.environ.get("GENERATION_QUEUE_SIZE", "20"))
+GENERATION_QUEUE_POLICY = os.environ.get("GENERATION_QUEUE_POLICY", "wait").lower()
+GENERATION_QUEUE_TIMEOUT = float(os.environ.get("GENERATION_QUEUE_TIMEOUT", "30"))
+
+
+def get_generation_workers(provider):
+    """プロバイダごとの同時生成数。GENERATION_WORKERS_<PROVIDER>で個別に上書きできる"""
+    value = os.environ.get(f"GENERATION_WORKERS_{provider.upper()}")
+    return int(value) if value else GENERATION_WORKERS
+
+
+SUMMARY_CACHE_ENABLED = os.environ.get("SUMMARY_CACHE_ENABLED", "True").lower() in ("true", "1", "yes")
+SUMMARY_CACHE_SIZE = int(os.environ.get("SUMMARY_CACHE_SIZE", "128"))
+SUMMARY_CACHE_MONGODB = os.environ.get("SUMMARY_CACHE_MONGODB", "False").lower() in ("true", "1", "yes")
+SUMMARY_CACHE_TTL = int(os.environ.get("SUMMARY_CACHE_TTL", "86400"))
+
+USAGE_ROLLUP_ENABLED = os.environ.get("USAGE_ROLLUP_ENABLED", "False").lower() in ("true", "1", "yes")
+USAGE_TTL_DAYS = int(os.environ.get("USAGE_TTL_DAYS", "0"))
+
+STATISTICS_CACHE_TTL = float(os.environ.get("STATISTICS_CACHE_TTL", "60"))
+STATISTICS_CACHE_PAST_TTL = float(os.environ.get("STATISTICS_CACHE_PAST_TTL", "3600"))
+STATISTICS_CACHE_SIZE = int(os.environ.get("STATISTICS_CACHE_SIZE", "64"))
+STATISTICS_PAGE_SIZE = int(os.environ.get("STATISTICS_PAGE_SIZE", "50"))
+
+PROMPT_CACHE_POLL_INTERVAL = float(os.environ.get("PROMPT_CACHE_POLL_INTERVAL", "30"))
+PROMPT_CACHE_MAX_AGE = float(os.environ.get("PROMPT_CACHE_MAX_AGE", "600"))
+
+API_TIMEOUT = float(os.environ.get("API_TIMEOUT", "600"))
+API_MAX_CONNECTIONS = int(os.environ.get("API_MAX_CONNECTIONS", "20"))
+API_MAX_KEEPALIVE_CONNECTIONS = int(os.environ.get("API_MAX_KEEPALIVE_CONNECTIONS", "10"))
+API_KEEPALIVE_EXPIRY = float(os.environ.get("API_KEEPALIVE_EXPIRY", "60"))
 
 
 def get_gemini_client():
@@ -27,10 +27,12 @@ MESSAGES = {
     "CLAUDE_API_CREDENTIALS_MISSING": "⚠️ Claude APIの認証情報が設定されていません。環境変数を確認してください。",
     "OPENAI_API_CREDENTIALS_MISSING": "⚠️ OpenAI APIの認証情報が設定されていません。環境変数を確認してください。",
     "NO_API_CREDENTIALS": "⚠️ 使用可能なAI APIの認証情報が設定されていません。環境変数を確認してください。",
+    "QUEUE_FULL": "⚠️ 現在サマリ作成が混み合っています。しばらくしてから再度お試しください。",
+    "PROVIDER_UNAVAILABLE": "⚠️ 選択したAIモデルは障害のため一時的に利用できません。別のモデルを選択するか、しばらくしてから再度お試しください。",
 }
 
 DEFAULT_DEPARTMENTS = ["内科", "消化器内科", "整形外科", "眼科"]
-DEFAULT_SECTION_NAMES = ["入院期間", "現病歴", "入院時検査", "入院中の治療経過", "退院申し送り", "備考"]
+DEFAULT_SECTION_NAMES = ["入院期間", "現病歴", "入院時検査", "入院中の治療経過", "退院申し送り", "禁忌/アレルギー", "備考"]
 
 APP_TYPE = "discharge_summary"
 DOCUMENT_NAME = "退院時サマリ"
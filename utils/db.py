@@ -1,10 +1,30 @@
 import os
 
 from pymongo import MongoClient
+from pymongo.errors import OperationFailure
 
-from utils.config import MONGODB_URI
+from utils.config import MONGODB_DEPARTMENTS_COLLECTION, MONGODB_PROMPTS_COLLECTION, MONGODB_URI, \
+    MONGODB_USERS_COLLECTION, USAGE_TTL_DAYS
 from utils.exceptions import DatabaseError
 
+# アプリケーションの検索・並べ替えに使うインデックス（コレクション名, キー, オプション）
+INDEXES = [
+    # 統計情報: 期間と文書タイプで絞り込む
+    ("summary_usage", [("date", 1), ("document_name", 1)], {}),
+    # 診療科ごとのプロンプト・既定のプロンプトの取得
+    (MONGODB_PROMPTS_COLLECTION, [("department", 1), ("is_default", 1)], {}),
+    # 診療科の一覧の並べ替えと名前での検索
+    (MONGODB_DEPARTMENTS_COLLECTION, [("order", 1)], {}),
+    (MONGODB_DEPARTMENTS_COLLECTION, [("name", 1)], {"unique": True}),
+    # ログイン時のユーザー検索
+    (MONGODB_USERS_COLLECTION or "users", [("username", 1)], {"unique": True}),
+    # 使用統計の時間別・日別の集計: 同じキーへの同時のupsertで集計が重複しないよう一意にする
+    ("summary_usage_hourly", [("bucket", 1), ("department", 1), ("model_detail", 1), ("document_name", 1)],
+     {"unique": True}),
+    ("summary_usage_daily", [("bucket", 1), ("department", 1), ("model_detail", 1), ("document_name", 1)],
+     {"unique": True}),
+]
+
 
 class DatabaseManager:
     _instance = None
@@ -56,3 +76,59 @@ def get_usage_collection():
         return db_manager.get_collection(collection_name)
     except Exception as e:
         raise DatabaseError(f"使用状況コレクションの取得に失敗しました: {str(e)}")
+
+
+def get_summary_cache_collection():
+    """生成結果キャッシュを保存するコレクションを取得"""
+    try:
+        db_manager = DatabaseManager.get_instance()
+        collection_name = os.environ.get("MONGODB_SUMMARY_CACHE_COLLECTION", "summary_cache")
+        return db_manager.get_collection(collection_name)
+    except Exception as e:
+        raise DatabaseError(f"生成結果キャッシュコレクションの取得に失敗しました: {str(e)}")
+
+
+def get_usage_rollup_collection(granularity):
+    """使用統計の時間別・日別の集計を保存するコレクションを取得"""
+    try:
+        db_manager = DatabaseManager.get_instance()
+        collection_name = f"summary_usage_{granularity}"
+        return db_manager.get_collection(collection_name)
+    except Exception as e:
+        raise DatabaseError(f"使用状況の集計コレクションの取得に失敗しました: {str(e)}")
+
+
+def ensure_ttl_index(collection, field, seconds):
+    """fieldのTTLインデックスをsecondsに合わせる。0以下の場合はTTLインデックスを削除する"""
+    name = f"{field}_1"
+    index = collection.index_information().get(name)
+    if seconds <= 0:
+        if index and "expireAfterSeconds" in index:
+            collection.drop_index(name)
+        return
+    if index is None:
+        collection.create_index(field, expireAfterSeconds=seconds)
+    elif index.get("expireAfterSeconds") != seconds:
+        # 既存のインデックスの保持期間はcollModで変更する（create_indexでは変更できない）
+        collection.database.command(
+            "collMod", collection.name, index={"keyPattern": {field: 1}, "expireAfterSeconds": seconds}
+        )
+
+
+def ensure_indexes(db=None):
+    """INDEXESのインデックスを作成する。既に同じインデックスがある場合は何もしない
+
+    一意制約に反する既存データなどで作成できないインデックスは警告を表示して続行する。
+    USAGE_TTL_DAYSが設定されている場合は、その日数を過ぎた使用記録をMongoDBに自動削除させる
+    """
+    db = db if db is not None else DatabaseManager.get_instance().get_database()
+    for collection_name, keys, options in INDEXES:
+        try:
+            db[collection_name].create_index(keys, **options)
+        except OperationFailure as e:
+            print(f"{collection_name}のインデックスの作成に失敗しました: {str(e)}")
+
+    try:
+        ensure_ttl_index(db["summary_usage"], "date", USAGE_TTL_DAYS * 24 * 60 * 60)
+    except OperationFailure as e:
+        print(f"summary_usageのTTLインデックスの設定に失敗しました: {str(e)}")
@@ -9,3 +9,6 @@ class APIError(AppError):
 
 class DatabaseError(AppError):
     pass
+
+class QueueFullError(AppError):
+    pass
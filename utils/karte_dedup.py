@@ -0,0 +1,173 @@
+import re
+import unicodedata
+import zlib
+from collections import deque
+
+import numpy as np
+
+from utils.config import KARTE_DEDUP_MIN_CHARS, KARTE_DEDUP_SIMILARITY
+from utils.karte_splitter import DATE_PATTERN, ENTRY_PATTERN
+
+# SOAPセクション行: 例 "A >"（scripts/txt_parse.pyと同じ形式）
+SOAP_PATTERN = re.compile(r"\s*[SOAPF]\s*>")
+
+OMITTED_MARKER = "（以前と同じ記載のため省略）"
+CHANGED_MARKER = "（以前とほぼ同じ記載のため変更された行のみ記載）"
+# 以前の段落にあり、この段落で削除された行（中止した処方など）の先頭につける
+REMOVED_PREFIX = "（削除）"
+
+SHINGLE_SIZE = 5
+NUM_PERMUTATIONS = 64
+BAND_SIZE = 4
+# 比較する候補とする直近の段落数（LSHのバンドごとにも直近のものだけを保持する）。段落数に対して線形の時間で処理する
+MAX_CANDIDATES = 8
+# MinHashの各ハッシュ関数の係数（結果を再現できるよう固定のシードから生成する）
+_random = np.random.default_rng(20250401)
+HASH_SEEDS = _random.integers(0, 2 ** 63, NUM_PERMUTATIONS, dtype=np.uint64)[:, None]
+HASH_MULTIPLIERS = (_random.integers(0, 2 ** 63, NUM_PERMUTATIONS, dtype=np.uint64) | np.uint64(1))[:, None]
+
+
+def normalize(text):
+    """全角・半角と空白の違いを無視して比較するための正規化"""
+    return re.sub(r"\s+", "", unicodedata.normalize("NFKC", text))
+
+
+def is_header(line):
+    return bool(DATE_PATTERN.match(line) or ENTRY_PATTERN.match(line))
+
+
+def split_paragraphs(lines):
+    """日付・記載の見出し行と空行を区切りとして、(見出しか, 行のリスト)の列に分ける
+
+    SOAPの見出し行は区切りとせず、1回の記載（S/O/A/P）を1つの段落とする
+    """
+    paragraph = []
+    for line in lines:
+        if is_header(line) or not line.strip():
+            if paragraph:
+                yield False, paragraph
+                paragraph = []
+            yield True, [line]
+        else:
+            paragraph.append(line)
+    if paragraph:
+        yield False, paragraph
+
+
+def get_shingles(normalized):
+    if len(normalized) <= SHINGLE_SIZE:
+        return {zlib.crc32(normalized.encode("utf-8"))}
+    return {zlib.crc32(normalized[i:i + SHINGLE_SIZE].encode("utf-8"))
+            for i in range(len(normalized) - SHINGLE_SIZE + 1)}
+
+
+def get_minhash(shingles):
+    """NUM_PERMUTATIONS個のハッシュ関数それぞれでのshingleの最小値（uint64の乗算は桁あふれで剰余をとる）"""
+    values = np.fromiter(shingles, dtype=np.uint64, count=len(shingles))
+    return ((values[None, :] ^ HASH_SEEDS) * HASH_MULTIPLIERS).min(axis=1).tolist()
+
+
+def filter_changed_lines(lines, known_lines):
+    """以前の段落にない行を返す。SOAPの見出し行は、その後に残す行がある場合のみ残す"""
+    changed_lines = []
+    soap_header = None
+    for line in lines:
+        if SOAP_PATTERN.match(line):
+            soap_header = line
+        elif normalize(line) not in known_lines:
+            if soap_header:
+                changed_lines.append(soap_header)
+                soap_header = None
+            changed_lines.append(line)
+    return changed_lines
+
+
+def get_removed_lines(previous_lines, lines):
+    """以前の段落にあり、この段落にない行（SOAPの見出し行を除く）"""
+    current_lines = {normalize(line) for line in lines}
+    removed_lines = []
+    for line in previous_lines:
+        normalized = normalize(line)
+        if normalized and normalized not in current_lines and not SOAP_PATTERN.match(line):
+            removed_lines.append(REMOVED_PREFIX + line.strip() + "\n")
+            current_lines.add(normalized)
+    return removed_lines
+
+
+def get_bands(signature):
+    return [(index, tuple(signature[index:index + BAND_SIZE]))
+            for index in range(0, len(signature), BAND_SIZE)]
+
+
+class KarteDeduplicator:
+    """前日までの記載をコピーした段落を検出して省略する
+
+    日付・記載の見出しで区切った段落のうち、正規化後に完全に一致するものは省略し、MinHashとLSHで候補を絞り込んだうえで
+    文字のshingleのJaccard係数がsimilarity以上の段落は、以前の段落にない行と、以前の段落から削除された行を残す。
+    削除された行（中止した処方など）は省略しない。見出し行とmin_chars文字未満の短い段落は常に残す。
+    類似度を計算する候補は、LSHのバンドが一致した直近のMAX_CANDIDATES段落に限る
+    """
+
+    def __init__(self, similarity=KARTE_DEDUP_SIMILARITY, min_chars=KARTE_DEDUP_MIN_CHARS):
+        self.similarity = similarity
+        self.min_chars = min_chars
+
+    def deduplicate(self, text):
+        """省略後のテキストと、削減した文字数・バイト数・段落数を返す"""
+        seen = set()
+        paragraphs = []
+        buckets = {}
+        output = []
+        removed_paragraphs = 0
+
+        for header, lines in split_paragraphs(text.splitlines(keepends=True)):
+            normalized = normalize("".join(lines))
+            if header or len(normalized) < self.min_chars:
+                output.extend(lines)
+                continue
+
+            if normalized in seen:
+                output.append(OMITTED_MARKER + "\n")
+                removed_paragraphs += 1
+                continue
+
+            shingles = get_shingles(normalized)
+            bands = get_bands(get_minhash(shingles))
+            similar = self.find_similar(shingles, bands, paragraphs, buckets)
+            if similar is None:
+                output.extend(lines)
+            else:
+                known_lines, previous_lines = similar[1], similar[2]
+                changed_lines = filter_changed_lines(lines, known_lines) + get_removed_lines(previous_lines, lines)
+                marker = (CHANGED_MARKER if changed_lines else OMITTED_MARKER) + "\n"
+                if len(marker) + len("".join(changed_lines)) < len("".join(lines)):
+                    output.append(marker)
+                    output.extend(changed_lines)
+                    removed_paragraphs += 1
+                else:
+                    output.extend(lines)
+
+            seen.add(normalized)
+            for band in bands:
+                buckets.setdefault(band, deque(maxlen=MAX_CANDIDATES)).append(len(paragraphs))
+            paragraphs.append((shingles, {normalize(line) for line in lines}, lines))
+
+        deduplicated = "".join(output)
+        return deduplicated, {
+            "removed_chars": len(text) - len(deduplicated),
+            "removed_bytes": len(text.encode("utf-8")) - len(deduplicated.encode("utf-8")),
+            "removed_paragraphs": removed_paragraphs,
+        }
+
+    def find_similar(self, shingles, bands, paragraphs, buckets):
+        """LSHのバンドが一致した直近の段落のうち、最もJaccard係数が高くsimilarity以上のもの"""
+        candidates = {index for band in bands for index in buckets.get(band, ())}
+        best = None
+        best_score = self.similarity
+        for index in sorted(candidates)[-MAX_CANDIDATES:]:
+            other_shingles = paragraphs[index][0]
+            score = len(shingles & other_shingles) / len(shingles | other_shingles)
+            if score >= best_score:
+                best = paragraphs[index]
+                best_score = score
+        return best
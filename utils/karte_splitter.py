@@ -0,0 +1,89 @@
+import re
+
+# 日付行: 例 "2025/04/18(金)　（入院 71 日目）"（scripts/txt_parse.pyと同じ形式）
+DATE_PATTERN = re.compile(r"\s*(\d{4}/\d{1,2}/\d{1,2})\(.?\)")
+# 記載ごとの見出し行: 例 "内科　　波部　孝弘　　国保　　12:41"
+ENTRY_PATTERN = re.compile(r"\s*\S+\s+\S+.*\s(\d{2}:\d{2})\s*$")
+
+
+def split_blocks(lines, pattern):
+    """patternに一致する行を先頭として行を区切る。最初に一致する行より前の行は1つのブロックとする"""
+    blocks = []
+    current = []
+    for line in lines:
+        if pattern.match(line) and current:
+            blocks.append(current)
+            current = []
+        current.append(line)
+    if current:
+        blocks.append(current)
+    return blocks
+
+
+def split_oversized(lines, chunk_size):
+    """1日分でもchunk_sizeを超える場合は記載ごと、それでも超える場合は行ごとに分割する"""
+    if len("".join(lines)) <= chunk_size:
+        return [lines]
+
+    entries = split_blocks(lines, ENTRY_PATTERN)
+    if len(entries) > 1:
+        return [part for entry in entries for part in split_oversized(entry, chunk_size)]
+
+    parts = []
+    current = []
+    size = 0
+    for line in lines:
+        if current and size + len(line) > chunk_size:
+            parts.append(current)
+            current = []
+            size = 0
+        current.append(line)
+        size += len(line)
+    if current:
+        parts.append(current)
+    return parts
+
+
+def get_block_date(lines):
+    match = DATE_PATTERN.match(lines[0]) if lines else None
+    return match.group(1) if match else None
+
+
+def split_karte(text, chunk_size):
+    """カルテを日付ごとに区切り、chunk_size文字以内のチャンクにまとめる
+
+    日付の途中では区切らないようにし、1日分がchunk_sizeを超える場合のみ記載ごとに分割する。
+    各チャンクは{"text", "start_date", "end_date"}で、日付が分からない場合はNone
+    """
+    lines = text.splitlines(keepends=True)
+    blocks = []
+    for day in split_blocks(lines, DATE_PATTERN):
+        date = get_block_date(day)
+        blocks.extend((date, part) for part in split_oversized(day, chunk_size))
+
+    chunks = []
+    current = []
+    dates = []
+    size = 0
+    for date, block in blocks:
+        block_size = len("".join(block))
+        if current and size + block_size > chunk_size:
+            chunks.append(create_chunk(current, dates))
+            current = []
+            dates = []
+            size = 0
+        current.extend(block)
+        if date:
+            dates.append(date)
+        size += block_size
+    if current:
+        chunks.append(create_chunk(current, dates))
+    return chunks
+
+
+def create_chunk(lines, dates):
+    return {
+        "text": "".join(lines),
+        "start_date": dates[0] if dates else None,
+        "end_date": dates[-1] if dates else None,
+    }
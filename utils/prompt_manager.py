@@ -1,11 +1,13 @@
 import datetime
 import os
+import threading
+import time
 
 from pymongo import MongoClient
 
-from utils.config import get_config, MONGODB_URI
+from utils.config import get_config, MONGODB_URI, PROMPT_CACHE_MAX_AGE, PROMPT_CACHE_POLL_INTERVAL
 from utils.constants import DEFAULT_DEPARTMENTS, MESSAGES
-from utils.db import DatabaseManager
+from utils.db import DatabaseManager, ensure_indexes
 from utils.env_loader import load_environment_variables
 from utils.exceptions import DatabaseError, AppError
 
@@ -28,6 +30,130 @@ def get_department_collection():
         raise DatabaseError(f"診療科コレクションの取得に失敗しました: {str(e)}")
 
 
+def get_cache_version_collection():
+    try:
+        db_manager = DatabaseManager.get_instance()
+        collection_name = os.environ.get("MONGODB_CACHE_VERSIONS_COLLECTION", "cache_versions")
+        return db_manager.get_collection(collection_name)
+    except Exception as e:
+        raise DatabaseError(f"キャッシュバージョンコレクションの取得に失敗しました: {str(e)}")
+
+
+class PromptCache:
+    """全診療科のプロンプトをメモリに保持するキャッシュ
+
+    プロンプトの編集時にinvalidateで破棄する。複数プロセスで動作する場合に備え、
+    MongoDB上のバージョン番号をpoll_interval秒ごとに確認し、他プロセスでの更新も反映する。
+    バージョンを更新しない変更（Atlas上での直接の編集など）に備え、max_age秒ごとに無条件で再読み込みする。
+    MongoDBへの問い合わせ中はロックを保持せず、他のスレッドはそれまでの内容を使う
+    """
+    VERSION_ID = "prompts"
+
+    def __init__(self, poll_interval=PROMPT_CACHE_POLL_INTERVAL, max_age=PROMPT_CACHE_MAX_AGE):
+        self.poll_interval = poll_interval
+        self.max_age = max_age
+        self._prompts = None
+        self._default_prompt = None
+        self._version = None
+        self._checked_at = 0.0
+        self._loaded_at = 0.0
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def get(self, department="default"):
+        with self._lock:
+            prompts, default_prompt = self._prompts, self._default_prompt
+            action = self._get_refresh_action()
+            generation = self._generation
+        if action:
+            prompts, default_prompt = self._refresh(action, prompts, default_prompt, generation)
+        return prompts.get(department) or default_prompt
+
+    def invalidate(self):
+        with self._lock:
+            self._prompts = None
+            self._generation += 1
+        try:
+            get_cache_version_collection().update_one(
+                {"_id": self.VERSION_ID},
+                {"$inc": {"version": 1}},
+                upsert=True
+            )
+        except Exception as e:
+            print(f"プロンプトキャッシュのバージョン更新に失敗しました: {str(e)}")
+
+    def _get_refresh_action(self):
+        """必要な処理を返す（ロック取得済みで呼び出す）。"load"は再読み込み、"check"はバージョンの確認
+
+        確認・再読み込みの時刻を先に更新し、同時に呼び出された他のスレッドが重ねて問い合わせないようにする
+        """
+        if self._prompts is None:
+            return "load"
+
+        now = time.monotonic()
+        if self.max_age > 0 and now - self._loaded_at >= self.max_age:
+            self._loaded_at = now
+            return "load"
+        if self.poll_interval > 0 and now - self._checked_at >= self.poll_interval:
+            self._checked_at = now
+            return "check"
+        return None
+
+    def _refresh(self, action, prompts, default_prompt, generation):
+        """ロックの外でMongoDBから読み込み、invalidateされていなければキャッシュを置き換える"""
+        try:
+            version = self._read_version() if self.poll_interval > 0 else None
+            if action == "check" and version == self._version:
+                return prompts, default_prompt
+            loaded_prompts, loaded_default = self._load()
+        except Exception as e:
+            if prompts is None:
+                raise
+            # 読み込めない場合は手元のキャッシュを使い続ける
+            print(f"プロンプトの再読み込みに失敗しました: {str(e)}")
+            return prompts, default_prompt
+
+        with self._lock:
+            if self._generation == generation:
+                now = time.monotonic()
+                self._prompts = loaded_prompts
+                self._default_prompt = loaded_default
+                self._version = version
+                self._checked_at = now
+                self._loaded_at = now
+        return loaded_prompts, loaded_default
+
+    def _read_version(self):
+        try:
+            document = get_cache_version_collection().find_one({"_id": self.VERSION_ID})
+        except Exception:
+            # バージョンが確認できない場合は手元のキャッシュを使い続ける
+            return self._version
+        return document.get("version", 0) if document else 0
+
+    @staticmethod
+    def _load():
+        prompts = {}
+        default_prompt = None
+
+        for prompt in get_prompt_collection().find():
+            department = prompt.get("department")
+            # find_oneと同様に診療科ごとに最初の1件を採用する
+            prompts.setdefault(department, prompt)
+            if default_prompt is None and department == "default" and prompt.get("is_default"):
+                default_prompt = prompt
+
+        return prompts, default_prompt
+
+
+_prompt_cache = PromptCache()
+
+
+def invalidate_prompt_cache():
+    """プロンプトの追加・更新・削除後に呼び出し、キャッシュを破棄する"""
+    _prompt_cache.invalidate()
+
+
 def get_current_datetime():
     return datetime.datetime.now()
 
@@ -106,6 +232,7 @@ def create_department(name):
             "content": default_prompt_content,
             "is_default": False
         })
+        invalidate_prompt_cache()
 
         return True, MESSAGES["DEPARTMENT_CREATED"]
     except DatabaseError as e:
@@ -124,6 +251,7 @@ def delete_department(name):
             return False, "診療科が見つかりません"
 
         prompt_collection.delete_many({"department": name})
+        invalidate_prompt_cache()
 
         return True, "診療科を削除しました"
     except DatabaseError as e:
@@ -182,6 +310,7 @@ def initialize_default_prompt():
                 "content": default_prompt_content,
                 "is_default": True
             })
+            invalidate_prompt_cache()
     except Exception as e:
         raise DatabaseError(f"デフォルトプロンプトの初期化に失敗しました: {str(e)}")
 
@@ -189,17 +318,22 @@ def initialize_default_prompt():
 def get_prompt_by_department(department="default"):
     """指定された診療科のプロンプトを取得"""
     try:
-        prompt_collection = get_prompt_collection()
-        prompt = prompt_collection.find_one({"department": department})
-
-        if not prompt:
-            prompt = prompt_collection.find_one({"department": "default", "is_default": True})
-
-        return prompt
+        return _prompt_cache.get(department)
     except Exception as e:
         raise DatabaseError(f"プロンプトの取得に失敗しました: {str(e)}")
 
 
+def get_prompt_template(department="default"):
+    """診療科のプロンプト本文を取得。未登録の場合は設定ファイルの既定プロンプトを返す"""
+    prompt_data = get_prompt_by_department(department)
+
+    if not prompt_data:
+        config = get_config()
+        return config['PROMPTS']['discharge_summary']
+
+    return prompt_data['content']
+
+
 def get_all_prompts():
     try:
         prompt_collection = get_prompt_collection()
@@ -226,6 +360,7 @@ def create_or_update_prompt(department, name, content):
                     "content": content
                 }
             )
+            invalidate_prompt_cache()
             return True, "プロンプトを更新しました"
         else:
             # 新規作成
@@ -235,6 +370,7 @@ def create_or_update_prompt(department, name, content):
                 "content": content,
                 "is_default": False
             })
+            invalidate_prompt_cache()
             return True, "プロンプトを新規作成しました"
     except DatabaseError as e:
         return False, str(e)
@@ -256,6 +392,7 @@ def delete_prompt(department):
             return False, "プロンプトが見つかりません"
 
         department_collection.delete_one({"name": department})
+        invalidate_prompt_cache()
 
         return True, "プロンプトと関連する診療科を削除しました"
     except DatabaseError as e:
@@ -266,6 +403,7 @@ def delete_prompt(department):
 
 def initialize_database():
     try:
+        ensure_indexes()
         initialize_default_prompt()
         initialize_departments()
 
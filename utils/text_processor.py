@@ -1,3 +1,5 @@
+import re
+
 from utils.constants import DEFAULT_SECTION_NAMES
 
 
@@ -12,39 +14,98 @@ def format_discharge_summary(summary_text):
     return processed_text
 
 
-def parse_discharge_summary(summary_text):
-    sections = {section: "" for section in DEFAULT_SECTION_NAMES}
+SECTION_ALIASES = {
+    "禁忌・アレルギー": "禁忌/アレルギー"
+}
+
+# 行に含まれる項目名を探す順序（項目名、別名の順）
+SECTION_HEADERS = DEFAULT_SECTION_NAMES + list(SECTION_ALIASES)
+SECTION_PATTERN = re.compile("|".join(map(re.escape, SECTION_HEADERS)))
+
+
+def find_section_header(line):
+    """行に含まれる項目名のうち、SECTION_HEADERSで先に定義されたものを返す"""
+    if not SECTION_PATTERN.search(line):
+        return None
+    # 項目名を含む行は少ないため、複数の項目名を含む場合の優先順位はSECTION_HEADERSの順で判定する
+    return next(header for header in SECTION_HEADERS if header in line)
 
-    section_aliases = {
-        "禁忌・アレルギー": "禁忌/アレルギー"
-    }
 
-    lines = summary_text.split('\n')
-    current_section = None
+class SummaryStreamParser:
+    """ストリーミングの差分を受け取り、完了した行ごとに項目の本文を更新する
 
-    for line in lines:
+    改行で終わっていない末尾の行のみを保持し、finish()はparse_discharge_summary()と同じ結果を返す
+    """
+
+    def __init__(self):
+        self.sections = {section: [] for section in DEFAULT_SECTION_NAMES}
+        self.current_section = None
+        self.pending = ""
+
+    def feed(self, delta):
+        """差分を追加し、本文が更新された項目名を更新された順に返す"""
+        lines = (self.pending + delta).split('\n')
+        self.pending = lines.pop()
+        updated = []
+        for line in lines:
+            section = self.add_line(line)
+            if section and section not in updated:
+                updated.append(section)
+        return updated
+
+    def add_line(self, line):
+        """1行を処理し、本文が更新された項目名を返す"""
         line = line.strip()
         if not line:
-            continue
-
-        found_section = False
-        for section in list(sections.keys()) + list(section_aliases.keys()):
-            if section in line:
-                if section in section_aliases:
-                    current_section = section_aliases[section]
-                else:
-                    current_section = section
-
-                line = line.replace(section, "").replace(":", "").strip()
-                found_section = True
-                break
-
-        if current_section and line and not found_section:
-            if sections[current_section]:
-                sections[current_section] += "\n" + line
-            else:
-                sections[current_section] = line
-        elif current_section and line and found_section:
-            sections[current_section] = line
-
-    return sections
+            return None
+
+        header = find_section_header(line)
+        if header is None:
+            if self.current_section is None:
+                return None
+            self.sections[self.current_section].append(line)
+            return self.current_section
+
+        self.current_section = SECTION_ALIASES.get(header, header)
+        current_lines = self.sections.setdefault(self.current_section, [])
+        line = line.replace(header, "").replace(":", "").strip()
+        if not line:
+            return None
+        current_lines[:] = [line]
+        return self.current_section
+
+    def snapshot(self):
+        """途中の項目ごとの本文。改行で終わっていない末尾の行も、その時点の内容で含める"""
+        sections = {section: "\n".join(lines) for section, lines in self.sections.items()}
+        line = self.pending.strip()
+        if not line:
+            return sections
+
+        header = find_section_header(line)
+        if header is None:
+            if self.current_section is not None:
+                current = sections[self.current_section]
+                sections[self.current_section] = f"{current}\n{line}" if current else line
+            return sections
+
+        section = SECTION_ALIASES.get(header, header)
+        line = line.replace(header, "").replace(":", "").strip()
+        sections[section] = line or sections.get(section, "")
+        return sections
+
+    def finish(self):
+        """末尾の行を処理し、項目ごとの本文を返す"""
+        self.add_line(self.pending)
+        self.pending = ""
+        return {section: "\n".join(lines) for section, lines in self.sections.items()}
+
+
+def parse_discharge_summary(summary_text):
+    """項目名を含む行から次の項目名までを、その項目の本文として返す
+
+    項目名の行に本文がある場合はそれまでの本文を置き換え、項目名より前の行は無視する
+    """
+    parser = SummaryStreamParser()
+    for line in summary_text.split('\n'):
+        parser.add_line(line)
+    return parser.finish()
@@ -28,12 +28,27 @@ def main_page_app(page, global_state, navigate_to):
     # サマリ生成ボタン
     summary_processor = SummaryProcessor(page, global_state)
 
-    def generate_summary(e):
+    def show_summary(discharge_summary, parsed_summary, completed=False):
+        """生成中・生成後のサマリを結果タブとセクション表に反映
+
+        コピーは完成したサマリのみを対象とするため、生成中はコピーボタンを無効にする
+        """
+        result_text_area.value = discharge_summary
+        sections_container.content = create_sections_table(parsed_summary)
+        copy_button.disabled = not (completed and discharge_summary)
+        page.update()
+
+    def on_summary_complete():
+        show_summary(global_state.get("discharge_summary", ""), global_state.get("parsed_summary", {}),
+                     completed=True)
+
+    async def generate_summary(e):
         """サマリ生成ボタンのクリックイベントハンドラ"""
-        summary_processor.process_discharge_summary(
+        await summary_processor.process_discharge_summary(
             input_text_area.value,
             additional_info_area.value,
-            on_complete=lambda: page.update()
+            on_complete=on_summary_complete,
+            on_progress=show_summary
         )
 
     generate_button = ft.ElevatedButton(
@@ -57,8 +72,7 @@ def main_page_app(page, global_state, navigate_to):
     )
 
     # サマリのセクション表示用のテーブル作成
-    def create_sections_table():
-        sections = global_state.get("parsed_summary", {})
+    def create_sections_table(sections):
         if not sections:
             return ft.Text("サマリが生成されるとここにセクション別の内容が表示されます")
 
@@ -81,6 +95,12 @@ def main_page_app(page, global_state, navigate_to):
             rows=table_rows
         )
 
+    sections_container = ft.Container(
+        content=create_sections_table(global_state.get("parsed_summary", {})),
+        padding=10,
+        expand=True
+    )
+
     # 処理時間表示
     def get_processing_time():
         time = global_state.get("summary_generation_time")
@@ -102,11 +122,7 @@ def main_page_app(page, global_state, navigate_to):
             ),
             ft.Tab(
                 text="セクション別",
-                content=ft.Container(
-                    content=create_sections_table(),
-                    padding=10,
-                    expand=True
-                )
+                content=sections_container
             )
         ],
         expand=True
@@ -1,7 +1,8 @@
 import flet as ft
 import datetime
 from ui_components.navigation import render_sidebar
-from utils.db import get_usage_collection
+from ui_components.stats_table import create_stats_table
+from services.usage_statistics import get_usage_statistics
 from utils.constants import DOCUMENT_NAME_OPTIONS
 
 
@@ -91,35 +92,22 @@ def usage_statistics_ui(page, global_state, navigate_to):
             doc_type = doc_type_dropdown.value
             tab_index = stats_type.selected_index
 
-            # MongoDB からデータ取得
-            usage_collection = get_usage_collection()
+            # MongoDB で集計し、集計済みの行のみ取得（同じ条件の集計はキャッシュから取得）
+            grouping = ("daily", "department", "model")[tab_index]
+            stats = get_usage_statistics(start, end, doc_type, grouping)
 
-            # クエリの構築
-            query = {
-                "date": {"$gte": start, "$lt": end}
-            }
-
-            if doc_type != "すべて":
-                query["document_name"] = doc_type
-
-            # データ取得
-            data = list(usage_collection.find(query))
-
-            if not data:
+            if stats.empty:
                 stats_display.content = ft.Text("データがありません")
                 error_text.value = ""
                 page.update()
                 return
 
-            # データフレームに変換して集計
-            df = pd.DataFrame(data)
-
             if tab_index == 0:  # 日別集計
-                display_daily_stats(df)
+                display_daily_stats(stats)
             elif tab_index == 1:  # 診療科別集計
-                display_department_stats(df)
+                display_department_stats(stats)
             else:  # モデル別集計
-                display_model_stats(df)
+                display_model_stats(stats)
 
             error_text.value = ""
             page.update()
@@ -128,210 +116,44 @@ def usage_statistics_ui(page, global_state, navigate_to):
             error_text.value = f"統計情報の取得中にエラーが発生しました: {str(e)}"
             page.update()
 
-    # 日別統計の表示
-    def display_daily_stats(df):
-        try:
-            # 日付ごとに集計
-            df['date_str'] = df['date'].dt.strftime('%Y-%m-%d')
-            daily_stats = df.groupby('date_str').agg({
-                'input_tokens': 'sum',
-                'output_tokens': 'sum',
-                'total_tokens': 'sum',
-                'processing_time': 'mean',
-                'document_name': 'count'
-            }).reset_index()
-
-            daily_stats = daily_stats.rename(columns={'document_name': 'count'})
-            daily_stats['processing_time'] = daily_stats['processing_time'].round(1)
-
-            # 表の作成
-            table_rows = []
-            for _, row in daily_stats.iterrows():
-                table_row = ft.DataRow(
-                    cells=[
-                        ft.DataCell(ft.Text(row['date_str'])),
-                        ft.DataCell(ft.Text(str(row['count']))),
-                        ft.DataCell(ft.Text(f"{row['input_tokens']:,}")),
-                        ft.DataCell(ft.Text(f"{row['output_tokens']:,}")),
-                        ft.DataCell(ft.Text(f"{row['total_tokens']:,}")),
-                        ft.DataCell(ft.Text(f"{row['processing_time']:.1f}秒"))
-                    ]
-                )
-                table_rows.append(table_row)
-
-            # 合計行の追加
-            total_count = daily_stats['count'].sum()
-            total_input = daily_stats['input_tokens'].sum()
-            total_output = daily_stats['output_tokens'].sum()
-            total_tokens = daily_stats['total_tokens'].sum()
-            avg_time = daily_stats['processing_time'].mean()
-
-            total_row = ft.DataRow(
-                cells=[
-                    ft.DataCell(ft.Text("合計/平均", weight=ft.FontWeight.BOLD)),
-                    ft.DataCell(ft.Text(str(total_count), weight=ft.FontWeight.BOLD)),
-                    ft.DataCell(ft.Text(f"{total_input:,}", weight=ft.FontWeight.BOLD)),
-                    ft.DataCell(ft.Text(f"{total_output:,}", weight=ft.FontWeight.BOLD)),
-                    ft.DataCell(ft.Text(f"{total_tokens:,}", weight=ft.FontWeight.BOLD)),
-                    ft.DataCell(ft.Text(f"{avg_time:.1f}秒", weight=ft.FontWeight.BOLD))
-                ]
-            )
-            table_rows.append(total_row)
-
-            # テーブルの作成
-            table = ft.DataTable(
-                columns=[
-                    ft.DataColumn(ft.Text("日付")),
-                    ft.DataColumn(ft.Text("処理数")),
-                    ft.DataColumn(ft.Text("入力トークン")),
-                    ft.DataColumn(ft.Text("出力トークン")),
-                    ft.DataColumn(ft.Text("合計トークン")),
-                    ft.DataColumn(ft.Text("平均処理時間"))
-                ],
-                rows=table_rows
-            )
-
-            stats_display.content = table
+    # 表示中の集計とページ
+    displayed = {"stats": None, "column": None, "label": None, "page_index": 0}
 
-        except Exception as e:
-            stats_display.content = ft.Text(f"データの集計中にエラーが発生しました: {str(e)}")
+    def show_stats_table(stats, column, label):
+        displayed.update(stats=stats, column=column, label=label, page_index=0)
+        render_stats_table()
 
-    # 診療科別統計の表示
-    def display_department_stats(df):
+    def render_stats_table():
         try:
-            # 診療科ごとに集計
-            dept_stats = df.groupby('department').agg({
-                'input_tokens': 'sum',
-                'output_tokens': 'sum',
-                'total_tokens': 'sum',
-                'processing_time': 'mean',
-                'document_name': 'count'
-            }).reset_index()
-
-            dept_stats = dept_stats.rename(columns={'document_name': 'count'})
-            dept_stats['processing_time'] = dept_stats['processing_time'].round(1)
-
-            # デフォルト診療科の表示名を変更
-            dept_stats['department'] = dept_stats['department'].replace('default', '全科共通')
-
-            # 表の作成
-            table_rows = []
-            for _, row in dept_stats.iterrows():
-                table_row = ft.DataRow(
-                    cells=[
-                        ft.DataCell(ft.Text(row['department'])),
-                        ft.DataCell(ft.Text(str(row['count']))),
-                        ft.DataCell(ft.Text(f"{row['input_tokens']:,}")),
-                        ft.DataCell(ft.Text(f"{row['output_tokens']:,}")),
-                        ft.DataCell(ft.Text(f"{row['total_tokens']:,}")),
-                        ft.DataCell(ft.Text(f"{row['processing_time']:.1f}秒"))
-                    ]
-                )
-                table_rows.append(table_row)
-
-            # 合計行の追加
-            total_count = dept_stats['count'].sum()
-            total_input = dept_stats['input_tokens'].sum()
-            total_output = dept_stats['output_tokens'].sum()
-            total_tokens = dept_stats['total_tokens'].sum()
-            avg_time = dept_stats['processing_time'].mean()
-
-            total_row = ft.DataRow(
-                cells=[
-                    ft.DataCell(ft.Text("合計/平均", weight=ft.FontWeight.BOLD)),
-                    ft.DataCell(ft.Text(str(total_count), weight=ft.FontWeight.BOLD)),
-                    ft.DataCell(ft.Text(f"{total_input:,}", weight=ft.FontWeight.BOLD)),
-                    ft.DataCell(ft.Text(f"{total_output:,}", weight=ft.FontWeight.BOLD)),
-                    ft.DataCell(ft.Text(f"{total_tokens:,}", weight=ft.FontWeight.BOLD)),
-                    ft.DataCell(ft.Text(f"{avg_time:.1f}秒", weight=ft.FontWeight.BOLD))
-                ]
+            stats_display.content = create_stats_table(
+                displayed["stats"],
+                displayed["column"],
+                displayed["label"],
+                page_index=displayed["page_index"],
+                on_page_change=on_page_change
             )
-            table_rows.append(total_row)
-
-            # テーブルの作成
-            table = ft.DataTable(
-                columns=[
-                    ft.DataColumn(ft.Text("診療科")),
-                    ft.DataColumn(ft.Text("処理数")),
-                    ft.DataColumn(ft.Text("入力トークン")),
-                    ft.DataColumn(ft.Text("出力トークン")),
-                    ft.DataColumn(ft.Text("合計トークン")),
-                    ft.DataColumn(ft.Text("平均処理時間"))
-                ],
-                rows=table_rows
-            )
-
-            stats_display.content = table
-
         except Exception as e:
             stats_display.content = ft.Text(f"データの集計中にエラーが発生しました: {str(e)}")
 
-    # モデル別統計の表示
-    def display_model_stats(df):
-        try:
-            # モデルごとに集計
-            model_stats = df.groupby('model_detail').agg({
-                'input_tokens': 'sum',
-                'output_tokens': 'sum',
-                'total_tokens': 'sum',
-                'processing_time': 'mean',
-                'document_name': 'count'
-            }).reset_index()
-
-            model_stats = model_stats.rename(columns={'document_name': 'count'})
-            model_stats['processing_time'] = model_stats['processing_time'].round(1)
-
-            # 表の作成
-            table_rows = []
-            for _, row in model_stats.iterrows():
-                table_row = ft.DataRow(
-                    cells=[
-                        ft.DataCell(ft.Text(row['model_detail'])),
-                        ft.DataCell(ft.Text(str(row['count']))),
-                        ft.DataCell(ft.Text(f"{row['input_tokens']:,}")),
-                        ft.DataCell(ft.Text(f"{row['output_tokens']:,}")),
-                        ft.DataCell(ft.Text(f"{row['total_tokens']:,}")),
-                        ft.DataCell(ft.Text(f"{row['processing_time']:.1f}秒"))
-                    ]
-                )
-                table_rows.append(table_row)
-
-            # 合計行の追加
-            total_count = model_stats['count'].sum()
-            total_input = model_stats['input_tokens'].sum()
-            total_output = model_stats['output_tokens'].sum()
-            total_tokens = model_stats['total_tokens'].sum()
-            avg_time = model_stats['processing_time'].mean()
-
-            total_row = ft.DataRow(
-                cells=[
-                    ft.DataCell(ft.Text("合計/平均", weight=ft.FontWeight.BOLD)),
-                    ft.DataCell(ft.Text(str(total_count), weight=ft.FontWeight.BOLD)),
-                    ft.DataCell(ft.Text(f"{total_input:,}", weight=ft.FontWeight.BOLD)),
-                    ft.DataCell(ft.Text(f"{total_output:,}", weight=ft.FontWeight.BOLD)),
-                    ft.DataCell(ft.Text(f"{total_tokens:,}", weight=ft.FontWeight.BOLD)),
-                    ft.DataCell(ft.Text(f"{avg_time:.1f}秒", weight=ft.FontWeight.BOLD))
-                ]
-            )
-            table_rows.append(total_row)
-
-            # テーブルの作成
-            table = ft.DataTable(
-                columns=[
-                    ft.DataColumn(ft.Text("AIモデル")),
-                    ft.DataColumn(ft.Text("処理数")),
-                    ft.DataColumn(ft.Text("入力トークン")),
-                    ft.DataColumn(ft.Text("出力トークン")),
-                    ft.DataColumn(ft.Text("合計トークン")),
-                    ft.DataColumn(ft.Text("平均処理時間"))
-                ],
-                rows=table_rows
-            )
+    # ページ送り（再集計せず表示中の集計から表を作り直す）
+    def on_page_change(page_index):
+        displayed["page_index"] = page_index
+        render_stats_table()
+        page.update()
 
-            stats_display.content = table
+    # 日別統計の表示
+    def display_daily_stats(daily_stats):
+        show_stats_table(daily_stats, "date_str", "日付")
 
-        except Exception as e:
-            stats_display.content = ft.Text(f"データの集計中にエラーが発生しました: {str(e)}")
+    # 診療科別統計の表示
+    def display_department_stats(dept_stats):
+        # デフォルト診療科の表示名を変更
+        dept_stats['department'] = dept_stats['department'].replace('default', '全科共通')
+        show_stats_table(dept_stats, "department", "診療科")
+
+    # モデル別統計の表示
+    def display_model_stats(model_stats):
+        show_stats_table(model_stats, "model_detail", "AIモデル")
 
     # 検索ボタンのイベントハンドラ
     def on_search(e):